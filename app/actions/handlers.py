@@ -2,20 +2,41 @@ import json
 import logging
 import traceback
 from datetime import datetime
+from functools import partial
+from typing import Optional
 
 from gundi_core.schemas.v2 import Integration, LogLevel
 from gundi_core.events.transformers import MessageTransformedInReach
 
 from app.services.activity_logger import activity_logger, log_action_activity
+from app.services.config_manager import integration_details_cache
+from app.services.idempotency import IdempotencyStore
 from app import settings
 from opentelemetry.trace import SpanKind
 from . import tracing
 from .configurations import AuthenticateConfig, PushMessageConfig
-from .inreach_client import InReachClient, InReachAuthenticationError
+from .inreach_client import (
+    InReachAuthenticationError,
+    inreach_client_pool,
+    inreach_message_batcher,
+    inreach_credentials_cache,
+    inreach_message_validator,
+    get_credentials_hash,
+    split_message,
+)
 from .utils import extract_error_details
 
 
 logger = logging.getLogger(__name__)
+idempotency_store = IdempotencyStore()
+
+
+def invalidate_credentials_checks(integration_id: Optional[str]):
+    # Check the credentials against InReach again after the integration (e.g. its auth config) changes
+    inreach_credentials_cache.invalidate(integration_id=integration_id)
+
+
+integration_details_cache.add_invalidation_hook(invalidate_credentials_checks)
 
 
 async def action_auth(integration: Integration, action_config: AuthenticateConfig):
@@ -24,8 +45,11 @@ async def action_auth(integration: Integration, action_config: AuthenticateConfi
     inreach_password = action_config.password.get_secret_value()
     if not inreach_api_url or not inreach_username or not inreach_password:
         return {"valid_credentials": False, "error": "URL, username, and password are required for authentication."}
+    # Credentials validated recently don't need another round trip to InReach
+    if inreach_credentials_cache.is_valid(str(integration.id), inreach_api_url, inreach_username, inreach_password):
+        return {"valid_credentials": True}
     try:
-        async with InReachClient(api_url=inreach_api_url) as inreach_client:
+        async with inreach_client_pool.client(api_url=inreach_api_url, username=inreach_username) as inreach_client:
             await inreach_client.pingback(
                 username=inreach_username,
                 password=inreach_password,
@@ -35,12 +59,89 @@ async def action_auth(integration: Integration, action_config: AuthenticateConfi
     except Exception as e:
         return {"valid_credentials": False, "error": f"Error in authentication test: {type(e).__name__}: {e}."}
     else:
+        inreach_credentials_cache.add(str(integration.id), inreach_api_url, inreach_username, inreach_password)
         return {"valid_credentials": True}
 
 
 # ToDo: implement auxiliary actions
 
 
+async def _send_messages_to_inreach(ipc_messages, api_url: str, username: str, password: str):
+    async with inreach_client_pool.client(api_url=api_url, username=username) as inreach_client:
+        return await inreach_client.send_messages(
+            ipc_messages=ipc_messages,
+            username=username,
+            password=password,
+        )
+
+
+async def _deliver_message(
+        integration: Integration, ipc_message, auth_config: AuthenticateConfig, gundi_id, metadata: dict
+):
+    inreach_api_url = auth_config.api_url
+    inreach_username = auth_config.username
+    inreach_password = auth_config.password.get_secret_value()
+    with tracing.tracer.start_as_current_span(
+            "inreach_connector.inreach_client.send_messages", kind=SpanKind.CLIENT
+    ) as sub_span:
+        try:
+            # Long texts are sent as several messages. Invalid messages are rejected (or repaired) here,
+            # without a round trip to InReach.
+            ipc_messages = [
+                inreach_message_validator.validate(segment)
+                for segment in split_message(inreach_message_validator.validate_timestamp(ipc_message))
+            ]
+            # Messages for the same account arriving close in time are sent together in one request.
+            # The password is part of the key, so a batch is never sent with the credentials of another integration.
+            inreach_response = await inreach_message_batcher.submit(
+                key=get_credentials_hash(inreach_api_url, inreach_username, inreach_password),
+                messages=ipc_messages,
+                send_batch=partial(
+                    _send_messages_to_inreach,
+                    api_url=inreach_api_url,
+                    username=inreach_username,
+                    password=inreach_password,
+                ),
+            )
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            error_title = f"Error Delivering Message {gundi_id} to '{inreach_api_url}'"
+            logger.exception(f"{error_title}: {error}")
+            sub_span.set_attribute("error", error)
+            # Generate custom activity log to show similar messages to the ones generated by dispatchers
+            extra_error_details = extract_error_details(e)
+            await log_action_activity(
+                integration_id=str(integration.id),
+                action_id="push_messages",
+                title=error_title,
+                level=LogLevel.ERROR,
+                data={
+                    "error": error,
+                    "error_traceback": traceback.format_exc(),
+                    **extra_error_details,
+                    **metadata,
+                }
+            )
+            raise  # Re-raise to ensure the error is captured in activity logs and retried by gcp
+        else:
+            sub_span.set_attribute("is_dispatched_successfully", True)
+            sub_span.add_event(
+                name="inreach_connector.message_dispatched_successfully"
+            )
+            # Generate custom activity log to show similar messages to the ones generated by dispatchers
+            await log_action_activity(
+                integration_id=str(integration.id),
+                action_id="push_messages",
+                title=f"Message {gundi_id} Delivered to '{inreach_api_url}'",
+                level=LogLevel.DEBUG,
+                data={
+                    "delivered_at": datetime.now().isoformat(),
+                    **metadata,
+                }
+            )
+            return {"status": "success", "inreach_response": inreach_response}
+
+
 @activity_logger()
 async def action_push_messages(
         integration: Integration, action_config: PushMessageConfig, data: MessageTransformedInReach, metadata: dict
@@ -64,54 +165,15 @@ async def action_push_messages(
         auth_config = integration.get_action_config("auth")
         if not auth_config:
             raise ValueError("Authentication configuration is required for sending messages.")
-        parsed_auth_config = AuthenticateConfig.parse_obj(auth_config.data)
-        inreach_api_url = parsed_auth_config.api_url
-        inreach_username = parsed_auth_config.username
-        inreach_password = parsed_auth_config.password.get_secret_value()
-        with tracing.tracer.start_as_current_span(
-                "inreach_connector.inreach_client.send_messages", kind=SpanKind.CLIENT
-        ) as sub_span:
-            try:
-                async with InReachClient(api_url=inreach_api_url) as inreach_client:
-                    inreach_response = await inreach_client.send_messages(
-                        ipc_messages=[ipc_message],
-                        username=inreach_username,
-                        password=inreach_password,
-                    )
-            except Exception as e:
-                error = f"{type(e).__name__}: {e}"
-                error_title = f"Error Delivering Message {gundi_id} to '{inreach_api_url}'"
-                logger.exception(f"{error_title}: {error}")
-                sub_span.set_attribute("error", error)
-                # Generate custom activity log to show similar messages to the ones generated by dispatchers
-                extra_error_details = extract_error_details(e)
-                await log_action_activity(
-                    integration_id=str(integration.id),
-                    action_id="push_messages",
-                    title=error_title,
-                    level=LogLevel.ERROR,
-                    data={
-                        "error": error,
-                        "error_traceback": traceback.format_exc(),
-                        **extra_error_details,
-                        **metadata,
-                    }
-                )
-                raise  # Re-raise to ensure the error is captured in activity logs and retried by gcp
-            else:
-                sub_span.set_attribute("is_dispatched_successfully", True)
-                sub_span.add_event(
-                    name="inreach_connector.message_dispatched_successfully"
-                )
-                # Generate custom activity log to show similar messages to the ones generated by dispatchers
-                await log_action_activity(
-                    integration_id=str(integration.id),
-                    action_id="push_messages",
-                    title=f"Message {gundi_id} Delivered to '{inreach_api_url}'",
-                    level=LogLevel.DEBUG,
-                    data={
-                        "delivered_at": datetime.now().isoformat(),
-                        **metadata,
-                    }
-                )
-                return {"status": "success", "inreach_response": inreach_response}
+        deliver_message = partial(
+            _deliver_message,
+            integration=integration,
+            ipc_message=ipc_message,
+            auth_config=AuthenticateConfig.parse_obj(auth_config.data),
+            gundi_id=gundi_id,
+            metadata=metadata,
+        )
+        if not gundi_id:
+            return await deliver_message()
+        # PubSub may redeliver a message. Send it only once and answer duplicates with the first response.
+        return await idempotency_store.run_once(key=f"push_messages.{destination_id}.{gundi_id}", func=deliver_message)
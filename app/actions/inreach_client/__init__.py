@@ -1,2 +1,8 @@
 from .client import *
 from .errors import *
+from .pool import *
+from .batching import *
+from .rate_limiter import *
+from .circuit_breaker import *
+from .credentials import *
+from .validation import *
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Hashable, List
+
+from app import settings
+from .errors import message_errors
+
+
+logger = logging.getLogger(__name__)
+
+
+class MessageBatch:
+    def __init__(self, send_batch: Callable[[List[Any]], Awaitable[Any]]):
+        self.send_batch = send_batch
+        self.entries = []  # (messages, future) for each caller
+        self.size = 0
+        self.timer = None
+
+    @property
+    def messages(self) -> List[Any]:
+        return [message for messages, _ in self.entries for message in messages]
+
+
+class MessageBatcher:
+    """
+    Collects messages pushed to the same destination within a short time window (or up to a max count)
+    and delivers them with a single call. Each caller gets back the result or the error of its own send.
+    """
+
+    def __init__(self, **kwargs):
+        self.window = kwargs.get("window", settings.INREACH_BATCH_WINDOW_SECONDS)
+        self.max_size = kwargs.get("max_size", settings.INREACH_BATCH_MAX_SIZE)
+        self._batches = {}
+        self._flush_tasks = set()
+
+    async def submit(self, key: Hashable, messages: List[Any], send_batch: Callable[[List[Any]], Awaitable[Any]]):
+        """
+        Queue messages to be sent together with others for the same key.
+        :param key: Destination of the messages, including the credentials used to send them
+        :param messages: Messages that must be delivered together, in order
+        :param send_batch: Coroutine function used to send a list of messages in one call.
+        The batch is sent with the one of its first caller, so it must be interchangeable for the same key.
+        :return: The result of the call that delivered the messages
+        """
+        if self.window <= 0:  # Batching disabled
+            return await send_batch(messages)
+        loop = asyncio.get_running_loop()
+        batch = self._batches.get(key)
+        if batch and batch.size + len(messages) > self.max_size:
+            self._flush(key, batch)  # Full, send it now and start a new one
+            batch = None
+        if not batch:
+            batch = self._batches[key] = MessageBatch(send_batch=send_batch)
+            batch.timer = loop.call_later(self.window, self._flush, key, batch)
+        future = loop.create_future()
+        batch.entries.append((messages, future))
+        batch.size += len(messages)
+        if batch.size >= self.max_size:
+            self._flush(key, batch)
+        return await future
+
+    def _flush(self, key: Hashable, batch: MessageBatch):
+        if self._batches.get(key) is not batch:  # Sent already
+            return
+        del self._batches[key]
+        batch.timer.cancel()
+        task = asyncio.create_task(self._send(key, batch))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _send(self, key: Hashable, batch: MessageBatch):
+        logger.debug(f"Sending batch of {batch.size} messages from {len(batch.entries)} callers to {key}.")
+        try:
+            result = await batch.send_batch(batch.messages)
+        except message_errors as e:
+            if len(batch.entries) == 1:
+                self._set_exception(batch.entries[0][1], e)
+                return
+            # Don't let one invalid message fail the rest. Send them individually so each caller gets its own result.
+            logger.warning(f"Batch to {key} failed with {type(e).__name__}. Retrying messages individually.")
+            await asyncio.gather(
+                *[self._send_individually(batch.send_batch, messages, future) for messages, future in batch.entries]
+            )
+        except Exception as e:
+            for _, future in batch.entries:
+                self._set_exception(future, e)
+        else:
+            for _, future in batch.entries:
+                if not future.done():
+                    future.set_result(result)
+
+    async def _send_individually(self, send_batch, messages: List[Any], future: asyncio.Future):
+        try:
+            result = await send_batch(messages)
+        except Exception as e:
+            self._set_exception(future, e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    def _set_exception(future: asyncio.Future, exc: Exception):
+        if not future.done():  # The caller may have been cancelled
+            future.set_exception(exc)
+
+    async def close(self):
+        """
+        Send any pending batches right away and wait for in-flight sends to finish.
+        """
+        for key, batch in list(self._batches.items()):
+            self._flush(key, batch)
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+
+
+inreach_message_batcher = MessageBatcher()
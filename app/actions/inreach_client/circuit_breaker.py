@@ -0,0 +1,138 @@
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import Enum
+
+from app import settings
+from .errors import InReachServiceUnreachable, InReachInternalError, InReachCircuitOpenError
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Stops calling the InReach API for a while when most of the recent calls failed,
+    so that requests fail right away instead of waiting for timeouts during an outage.
+    After a cool-down, a few trial calls decide whether to close the circuit again.
+    """
+
+    def __init__(self, name: str, **kwargs):
+        self.name = name
+        self.failure_rate_threshold = kwargs.get(
+            "failure_rate_threshold", settings.INREACH_CIRCUIT_BREAKER_FAILURE_RATE_THRESHOLD
+        )
+        self.minimum_calls = kwargs.get("minimum_calls", settings.INREACH_CIRCUIT_BREAKER_MINIMUM_CALLS)
+        self.open_seconds = kwargs.get("open_seconds", settings.INREACH_CIRCUIT_BREAKER_OPEN_SECONDS)
+        self.half_open_max_calls = kwargs.get("half_open_max_calls", settings.INREACH_CIRCUIT_BREAKER_HALF_OPEN_MAX_CALLS)
+        window_size = kwargs.get("window_size", settings.INREACH_CIRCUIT_BREAKER_WINDOW_SIZE)
+        self._outcomes = deque(maxlen=window_size)  # True for success, False for failure
+        self.state = CircuitState.CLOSED
+        self.opened_at = None
+        self._trial_calls = 0
+
+    @property
+    def failure_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    @staticmethod
+    def is_failure(exc: Exception) -> bool:
+        return isinstance(exc, (InReachServiceUnreachable, InReachInternalError))
+
+    def _set_state(self, state: CircuitState):
+        if state == self.state:
+            return
+        logger.warning(
+            f"Circuit breaker for '{self.name}' changed from {self.state.value} to {state.value} "
+            f"(failure rate: {self.failure_rate:.0%})."
+        )
+        self.state = state
+        self._trial_calls = 0
+        if state == CircuitState.OPEN:
+            self.opened_at = time.monotonic()
+        else:
+            self.opened_at = None
+            self._outcomes.clear()
+
+    def before_call(self):
+        if self.state == CircuitState.OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                raise InReachCircuitOpenError()
+            self._set_state(CircuitState.HALF_OPEN)
+        if self.state == CircuitState.HALF_OPEN:
+            if self._trial_calls >= self.half_open_max_calls:
+                raise InReachCircuitOpenError()
+            self._trial_calls += 1
+
+    def record_success(self):
+        if self.state == CircuitState.HALF_OPEN:
+            self._set_state(CircuitState.CLOSED)
+        else:
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        if self.state == CircuitState.HALF_OPEN:
+            self._set_state(CircuitState.OPEN)
+            return
+        self._outcomes.append(False)
+        if len(self._outcomes) >= self.minimum_calls and self.failure_rate >= self.failure_rate_threshold:
+            self._set_state(CircuitState.OPEN)
+
+    def _release_trial_call(self):
+        # The call ended without telling whether the service is healthy (e.g. it was cancelled)
+        if self.state == CircuitState.HALF_OPEN:
+            self._trial_calls = max(self._trial_calls - 1, 0)
+
+    @asynccontextmanager
+    async def call(self):
+        self.before_call()
+        try:
+            yield
+        except Exception as e:
+            if self.is_failure(e):
+                self.record_failure()
+            elif getattr(e, "response", None) is not None:  # The service answered, so it's up
+                self.record_success()
+            else:
+                self._release_trial_call()
+            raise
+        except BaseException:
+            self._release_trial_call()
+            raise
+        else:
+            self.record_success()
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state.value,
+            "failure_rate": round(self.failure_rate, 3),
+            "recorded_calls": len(self._outcomes),
+            "open_for_seconds": round(time.monotonic() - self.opened_at, 3) if self.opened_at else None,
+        }
+
+
+class CircuitBreakerRegistry:
+
+    def __init__(self, **kwargs):
+        self._breaker_kwargs = kwargs
+        self._breakers = {}
+
+    def get(self, api_url: str) -> CircuitBreaker:
+        if api_url not in self._breakers:
+            self._breakers[api_url] = CircuitBreaker(name=api_url, **self._breaker_kwargs)
+        return self._breakers[api_url]
+
+    def snapshot(self) -> dict:
+        return {api_url: breaker.snapshot() for api_url, breaker in self._breakers.items()}
+
+
+inreach_circuit_breakers = CircuitBreakerRegistry()
@@ -10,6 +10,19 @@ from .errors import (
     InReachServiceUnreachable,
     InReachInternalError, exceptions_by_inreach_code,
 )
+from .rate_limiter import AdaptiveRateLimiter, inreach_rate_limiter
+from .circuit_breaker import CircuitBreaker, inreach_circuit_breakers
+
+
+def serialize_messages(ipc_messages: List[InReachIPCMessage]) -> bytes:
+    """
+    Encode the IPC messages envelope straight to JSON bytes, in a single pass.
+    Datetime fields keep the "/Date(<milliseconds>)/" format set in the model's json encoders.
+    """
+    return json.dumps(
+        {"Messages": [msg.dict() for msg in ipc_messages]},
+        default=InReachIPCMessage.__json_encoder__,
+    ).encode("utf-8")
 
 
 class InReachClient:
@@ -23,12 +36,17 @@ class InReachClient:
             connect_timeout: float = DEFAULT_CONNECT_TIMEOUT_SECONDS,
             data_timeout: float = DEFAULT_DATA_TIMEOUT_SECONDS,
             username: Optional[str] = None, password: Optional[str] = None,
+            transport: Optional[httpx.AsyncBaseTransport] = None,
+            rate_limiter: Optional[AdaptiveRateLimiter] = None,
+            circuit_breaker: Optional[CircuitBreaker] = None,
     ):
         self.username = username
         self.password = password
         self.api_url = api_url or self.DEFAULT_API_URL
         self.connect_timeout = connect_timeout
         self.data_timeout = data_timeout
+        self.rate_limiter = rate_limiter or inreach_rate_limiter
+        self.circuit_breaker = circuit_breaker or inreach_circuit_breakers.get(self.api_url)
         session_kwargs = {
             "base_url": self.api_url,
             "timeout": httpx.Timeout(
@@ -38,6 +56,8 @@ class InReachClient:
         }
         if username and password:
             session_kwargs["auth"] = (self.username, self.password)
+        if transport:  # Share a connection pool with other clients (see InReachClientPool)
+            session_kwargs["transport"] = transport
         self.session = httpx.AsyncClient(**session_kwargs)
 
     async def __aenter__(self):
@@ -50,9 +70,10 @@ class InReachClient:
     async def close(self):
         await self.session.aclose()
 
-    async def _call_api(self, endpoint: str, method: str = "GET", data: dict = None, **kwargs):
+    async def _call_api(self, endpoint: str, method: str = "GET", data: dict = None, content: bytes = None, **kwargs):
         """
         Make an API call to the InReach service.
+        Pass either a dict in data, or an already encoded JSON body in content.
         """
         url = urljoin(self.api_url, endpoint.lstrip("/"))
         extra = {}
@@ -63,9 +84,24 @@ class InReachClient:
         elif not self.session.auth:
             raise InReachAuthenticationError("No authentication credentials provided.")
         extra |= kwargs
+        # Fail fast while the service is down. Otherwise, limit concurrency per account
+        # and adapt it to the throttling signals from InReach
+        account = username or self.username
+        async with self.circuit_breaker.call():
+            async with self.rate_limiter.limit(key=f"{self.api_url}:{account}"):
+                return await self._send_request(url=url, method=method, data=data, content=content, **extra)
+
+    async def _send_request(self, url: str, method: str = "GET", data: dict = None, content: bytes = None, **extra):
         try:
             if method == "GET":
                 response = await self.session.get(url, **extra)
+            elif method == "POST" and content is not None:
+                response = await self.session.post(
+                    url,
+                    content=content,
+                    headers={"Content-Type": "application/json"},
+                    **extra
+                )
             elif method == "POST":
                 data = data or {}
                 clean_data = json.loads(json.dumps(data, default=str))  # Convert to JSON serializable
@@ -116,13 +152,9 @@ class InReachClient:
         """
         Send messages to the InReach service.
         """
-        messages = [
-            json.loads(msg.json())  # Custom serialization of datetime fields to "/Date(<milliseconds>)/ format"
-            for msg in ipc_messages
-        ]
         return await self._call_api(
             endpoint="IPCInbound/V1/Messaging.svc/Message",
             method="POST",
-            data={"Messages": messages},
+            content=serialize_messages(ipc_messages),
             username=username, password=password
         )
@@ -0,0 +1,59 @@
+import hashlib
+import logging
+from typing import Optional, Tuple
+
+from app import settings
+from app.services.caching import TTLCache
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_credentials_hash(api_url: str, username: str, password: str) -> str:
+    """
+    Identifies an InReach account and password without keeping the secret itself.
+    """
+    return hashlib.sha256(f"{api_url}\0{username}\0{password}".encode("utf-8")).hexdigest()
+
+
+class CredentialsValidationCache:
+    """
+    Remembers successful credential checks against InReach (pingback) for a short time.
+    Entries are keyed by the integration and a hash of the API URL and credentials, so secrets are never kept
+    in memory and integrations sharing an account are invalidated independently.
+    """
+
+    def __init__(self, **kwargs):
+        self._cache = TTLCache(
+            maxsize=kwargs.get("maxsize", settings.INREACH_AUTH_CACHE_MAX_SIZE),
+            ttl=kwargs.get("ttl", settings.INREACH_AUTH_CACHE_TTL),
+        )
+
+    @staticmethod
+    def _get_key(integration_id: str, api_url: str, username: str, password: str) -> Tuple[str, str]:
+        return str(integration_id), get_credentials_hash(api_url, username, password)
+
+    def is_valid(self, integration_id: str, api_url: str, username: str, password: str) -> bool:
+        return self._get_key(integration_id, api_url, username, password) in self._cache
+
+    def add(self, integration_id: str, api_url: str, username: str, password: str):
+        self._cache.set(self._get_key(integration_id, api_url, username, password), True)
+
+    def invalidate(self, integration_id: Optional[str]):
+        """
+        Forget the credential checks of an integration, or of all of them if integration_id is None.
+        """
+        if integration_id is None:
+            self.clear()
+            return
+        keys = [key for key, _ in self._cache.items() if key[0] == str(integration_id)]
+        for key in keys:
+            self._cache.pop(key)
+        if keys:
+            logger.debug(f"Removed {len(keys)} cached credential checks for integration {integration_id}.")
+
+    def clear(self):
+        self._cache.clear()
+
+
+inreach_credentials_cache = CredentialsValidationCache()
@@ -12,6 +12,11 @@ class InReachServiceUnreachable(InReachClientError):
         super().__init__(message, response)
 
 
+class InReachCircuitOpenError(InReachServiceUnreachable):
+    def __init__(self, message="The InReach service is unavailable after repeated failures. Calls are paused for a while.", response=None):
+        super().__init__(message, response)
+
+
 class InReachInternalError(InReachClientError):
     def __init__(self, message="An unexpected error occurred in InReach API.", response=None):
         super().__init__(message, response)
@@ -116,3 +121,22 @@ exceptions_by_inreach_code = {
     16: InReachInvalidBinaryTypeError,
     17: InReachInvalidPayloadError,
 }
+
+
+# Errors caused by the content of a specific message rather than by the service or the account
+message_errors = (
+    InReachUnknownDeviceError,
+    InReachInvalidMessageError,
+    InReachInvalidTimestampError,
+    InReachInvalidSenderError,
+    InReachInvalidAltitudeError,
+    InReachInvalidSpeedError,
+    InReachInvalidCourseError,
+    InReachInvalidPositionError,
+    InReachInvalidIntervalError,
+    InReachInvalidLocationTypeError,
+    InReachInvalidLabelError,
+    InReachIllegalEmergencyActionError,
+    InReachInvalidBinaryTypeError,
+    InReachInvalidPayloadError,
+)
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+from app import settings
+from .client import InReachClient
+
+
+logger = logging.getLogger(__name__)
+
+
+class SharedTransport(httpx.AsyncHTTPTransport):
+    """
+    Connection pool shared by the clients of an API URL. Closing one of the clients leaves it open for the others,
+    it's closed with close_connections() when the pool is closed.
+    """
+
+    async def aclose(self):
+        pass
+
+    async def close_connections(self):
+        await super().aclose()
+
+
+class PooledInReachClient:
+    def __init__(self, client: InReachClient, max_connections: int):
+        self.client = client
+        self.semaphore = asyncio.Semaphore(max_connections)
+        self.leases = 0
+        self.last_used = time.monotonic()
+
+
+class InReachClientPool:
+    """
+    Process-wide registry of long-lived InReach clients keyed by (api_url, username).
+    Clients pointing to the same API URL share one keep-alive connection pool,
+    and each tenant can use up to a limited number of connections at a time.
+    """
+
+    def __init__(self, **kwargs):
+        self.max_clients = kwargs.get("max_clients", settings.INREACH_CLIENT_POOL_MAX_CLIENTS)
+        self.max_connections = kwargs.get("max_connections", settings.INREACH_CLIENT_POOL_MAX_CONNECTIONS)
+        self.max_connections_per_tenant = kwargs.get(
+            "max_connections_per_tenant", settings.INREACH_CLIENT_POOL_MAX_CONNECTIONS_PER_TENANT
+        )
+        self.idle_timeout = kwargs.get("idle_timeout", settings.INREACH_CLIENT_POOL_IDLE_TIMEOUT)
+        self.keepalive_expiry = kwargs.get("keepalive_expiry", settings.INREACH_CLIENT_KEEPALIVE_EXPIRY)
+        self._transports = {}
+        self._clients = OrderedDict()
+
+    def _get_transport(self, api_url: str) -> SharedTransport:
+        transport = self._transports.get(api_url)
+        if transport is None:
+            transport = SharedTransport(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                )
+            )
+            self._transports[api_url] = transport
+        return transport
+
+    def _get_pooled_client(self, api_url: str, username: Optional[str]) -> PooledInReachClient:
+        key = (api_url, username)
+        pooled_client = self._clients.get(key)
+        if pooled_client is None:
+            logger.debug(f"Creating pooled InReach client for '{api_url}' (user: {username}).")
+            pooled_client = PooledInReachClient(
+                client=InReachClient(api_url=api_url, transport=self._get_transport(api_url)),
+                max_connections=self.max_connections_per_tenant,
+            )
+            self._clients[key] = pooled_client
+        self._clients.move_to_end(key)
+        return pooled_client
+
+    async def evict_idle_clients(self):
+        """
+        Close clients unused for longer than the idle timeout, and the least recently used ones
+        when the pool is full. Clients in use are never evicted.
+        """
+        now = time.monotonic()
+        for key, pooled_client in list(self._clients.items()):  # Least recently used first
+            if pooled_client.leases:
+                continue
+            if len(self._clients) > self.max_clients or now - pooled_client.last_used > self.idle_timeout:
+                del self._clients[key]
+                # Releases what the client owns (e.g. proxy transports). The shared connection pool stays open.
+                await pooled_client.client.close()
+                logger.debug(f"Evicted pooled InReach client for '{key[0]}' (user: {key[1]}).")
+
+    @asynccontextmanager
+    async def client(self, api_url: Optional[str] = None, username: Optional[str] = None):
+        """
+        Borrow the client for the given API URL and account. Credentials are still passed on each call.
+        """
+        pooled_client = self._get_pooled_client(api_url or InReachClient.DEFAULT_API_URL, username)
+        pooled_client.leases += 1
+        try:
+            await self.evict_idle_clients()
+            async with pooled_client.semaphore:
+                yield pooled_client.client
+        finally:
+            pooled_client.leases -= 1
+            pooled_client.last_used = time.monotonic()
+
+    async def warm_up(self, api_url: Optional[str] = None):
+        """
+        Open a keep-alive connection to the API URL in advance, so the first request doesn't pay for DNS, TCP and TLS.
+        """
+        api_url = api_url or InReachClient.DEFAULT_API_URL
+        transport = self._get_transport(api_url)
+        # Any response will do, the connection goes back to the shared pool once the response is closed
+        response = await transport.handle_async_request(httpx.Request("HEAD", api_url))
+        await response.aclose()
+
+    async def close(self):
+        clients, self._clients = self._clients, OrderedDict()
+        for pooled_client in clients.values():
+            await pooled_client.client.close()
+        transports, self._transports = self._transports, {}
+        for transport in transports.values():
+            await transport.close_connections()
+
+    def __len__(self):
+        return len(self._clients)
+
+
+inreach_client_pool = InReachClientPool()
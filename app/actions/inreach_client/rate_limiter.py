@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import redis.asyncio as redis
+from app import settings
+from .errors import InReachTooManyRequestsError, InReachServiceUnreachable
+
+
+logger = logging.getLogger(__name__)
+
+
+# Slots in use are leases: request ids in a sorted set scored by the time they expire
+ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])
+local limit = tonumber(redis.call('HGET', KEYS[1], 'limit') or ARGV[1])
+if redis.call('ZCARD', KEYS[2]) < math.floor(limit) then
+    redis.call('ZADD', KEYS[2], tonumber(ARGV[2]) + tonumber(ARGV[3]), ARGV[4])
+    redis.call('EXPIRE', KEYS[2], math.ceil(tonumber(ARGV[3])))
+    return 1
+end
+return 0
+"""
+
+ADJUST_SCRIPT = """
+local limit = tonumber(redis.call('HGET', KEYS[1], 'limit') or ARGV[1])
+limit = limit * tonumber(ARGV[2]) + tonumber(ARGV[3])
+limit = math.max(tonumber(ARGV[4]), math.min(tonumber(ARGV[5]), limit))
+redis.call('HSET', KEYS[1], 'limit', tostring(limit))
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+return tostring(limit)
+"""
+
+
+class LocalRateLimiterBackend:
+    """
+    Keeps the limits in memory, per replica.
+    """
+
+    def __init__(self, **kwargs):
+        self._limits = {}
+        self._leases = {}  # key -> {lease_id: expiration time}
+
+    async def try_acquire(self, key: str, initial_limit: float, lease_id: str, lease_seconds: float) -> bool:
+        now = time.time()
+        leases = {
+            other_id: expires_at for other_id, expires_at in self._leases.get(key, {}).items() if expires_at > now
+        }
+        self._leases[key] = leases
+        if len(leases) < int(self._limits.get(key, initial_limit)):
+            leases[lease_id] = now + lease_seconds
+            return True
+        return False
+
+    async def release(self, key: str, lease_id: str):
+        self._leases.get(key, {}).pop(lease_id, None)
+
+    def in_flight(self, key: str) -> int:
+        now = time.time()
+        return len([expires_at for expires_at in self._leases.get(key, {}).values() if expires_at > now])
+
+    async def adjust_limit(
+            self, key: str, initial_limit: float, factor: float, step: float,
+            min_limit: float, max_limit: float, ttl: int
+    ) -> float:
+        limit = self._limits.get(key, initial_limit) * factor + step
+        self._limits[key] = max(min_limit, min(max_limit, limit))
+        return self._limits[key]
+
+
+class RedisRateLimiterBackend:
+    """
+    Keeps the limits in Redis so that all the replicas share them.
+    """
+
+    def __init__(self, **kwargs):
+        host = kwargs.get("host", settings.REDIS_HOST)
+        port = kwargs.get("port", settings.REDIS_PORT)
+        db = kwargs.get("db", settings.REDIS_STATE_DB)
+        self.db_client = redis.Redis(host=host, port=port, db=db)
+
+    def _get_key(self, key: str) -> str:
+        return f"inreach_rate_limit.{key}"
+
+    def _get_leases_key(self, key: str) -> str:
+        return f"inreach_rate_limit.{key}.leases"
+
+    async def try_acquire(self, key: str, initial_limit: float, lease_id: str, lease_seconds: float) -> bool:
+        acquired = await self.db_client.eval(
+            ACQUIRE_SCRIPT, 2, self._get_key(key), self._get_leases_key(key),
+            initial_limit, time.time(), lease_seconds, lease_id
+        )
+        return bool(acquired)
+
+    async def release(self, key: str, lease_id: str):
+        await self.db_client.zrem(self._get_leases_key(key), lease_id)
+
+    async def adjust_limit(
+            self, key: str, initial_limit: float, factor: float, step: float,
+            min_limit: float, max_limit: float, ttl: int
+    ) -> float:
+        limit = await self.db_client.eval(
+            ADJUST_SCRIPT, 1, self._get_key(key), initial_limit, factor, step, min_limit, max_limit, ttl
+        )
+        return float(limit)
+
+
+class AdaptiveRateLimiter:
+    """
+    Limits the number of concurrent requests per InReach account, using AIMD:
+    the limit grows a bit after each success and is cut down when InReach asks us to slow down
+    (error code 2 or HTTP 503). Errors talking to the backend never block requests.
+    Each request holds a lease that expires after lease_seconds, so slots that are never released
+    (e.g. a replica crashed) are eventually freed.
+    """
+
+    def __init__(self, backend=None, **kwargs):
+        self.backend = backend or LocalRateLimiterBackend()
+        self.initial_limit = kwargs.get("initial_limit", settings.INREACH_RATE_LIMITER_INITIAL_LIMIT)
+        self.min_limit = kwargs.get("min_limit", settings.INREACH_RATE_LIMITER_MIN_LIMIT)
+        self.max_limit = kwargs.get("max_limit", settings.INREACH_RATE_LIMITER_MAX_LIMIT)
+        self.increase_step = kwargs.get("increase_step", settings.INREACH_RATE_LIMITER_INCREASE_STEP)
+        self.decrease_factor = kwargs.get("decrease_factor", settings.INREACH_RATE_LIMITER_DECREASE_FACTOR)
+        self.max_wait = kwargs.get("max_wait", settings.INREACH_RATE_LIMITER_MAX_WAIT_SECONDS)
+        self.state_ttl = kwargs.get("state_ttl", settings.INREACH_RATE_LIMITER_STATE_TTL)
+        self.lease_seconds = kwargs.get("lease_seconds", settings.INREACH_RATE_LIMITER_LEASE_SECONDS)
+
+    @staticmethod
+    def is_throttling_error(exc: Exception) -> bool:
+        if isinstance(exc, InReachTooManyRequestsError):
+            return True
+        response = getattr(exc, "response", None)
+        return isinstance(exc, InReachServiceUnreachable) and response is not None and response.status_code == 503
+
+    async def acquire(self, key: str) -> Optional[str]:
+        """
+        Wait for a free slot. Returns the id of the lease to release, or None if the backend is unavailable.
+        """
+        deadline = time.monotonic() + self.max_wait
+        wait = 0.05
+        lease_id = str(uuid.uuid4())
+        while True:
+            try:
+                if await self.backend.try_acquire(key, self.initial_limit, lease_id, self.lease_seconds):
+                    return lease_id
+            except redis.RedisError as e:
+                logger.warning(f"Rate limiter unavailable, request for '{key}' allowed: {type(e).__name__}: {e}")
+                return None
+            if time.monotonic() + wait > deadline:
+                raise InReachTooManyRequestsError(
+                    f"Too many concurrent requests for '{key}'. Waited {self.max_wait}s for a free slot."
+                )
+            await asyncio.sleep(wait)
+            wait = min(wait * 2, 1.0)
+
+    async def release(self, key: str, lease_id: str):
+        try:
+            await self.backend.release(key, lease_id)
+        except redis.RedisError as e:
+            logger.warning(f"Error releasing rate limiter slot for '{key}': {type(e).__name__}: {e}")
+
+    async def _adjust_limit(self, key: str, factor: float, step: float):
+        try:
+            limit = await self.backend.adjust_limit(
+                key, self.initial_limit, factor, step, self.min_limit, self.max_limit, self.state_ttl
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Error updating rate limit for '{key}': {type(e).__name__}: {e}")
+        else:
+            logger.debug(f"Rate limit for '{key}' set to {limit:.2f} concurrent requests.")
+            return limit
+
+    async def on_success(self, key: str):
+        return await self._adjust_limit(key, factor=1.0, step=self.increase_step)
+
+    async def on_throttled(self, key: str):
+        logger.warning(f"InReach is throttling requests for '{key}'. Reducing concurrency.")
+        return await self._adjust_limit(key, factor=self.decrease_factor, step=0.0)
+
+    @asynccontextmanager
+    async def limit(self, key: str):
+        lease_id = await self.acquire(key)
+        try:
+            yield
+        except Exception as e:
+            if self.is_throttling_error(e):
+                await self.on_throttled(key)
+            raise
+        else:
+            await self.on_success(key)
+        finally:
+            if lease_id:
+                await self.release(key, lease_id)
+
+
+def get_rate_limiter_backend():
+    if settings.INREACH_RATE_LIMITER_BACKEND == "redis":
+        return RedisRateLimiterBackend()
+    return LocalRateLimiterBackend()
+
+
+inreach_rate_limiter = AdaptiveRateLimiter(backend=get_rate_limiter_backend())
@@ -0,0 +1,183 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from gundi_core.schemas.v2 import InReachIPCMessage
+from opentelemetry import metrics
+
+from app import settings
+from .errors import (
+    InReachInvalidMessageError,
+    InReachInvalidTimestampError,
+    InReachInvalidAltitudeError,
+    InReachInvalidSpeedError,
+    InReachInvalidCourseError,
+    InReachInvalidPositionError,
+    InReachInvalidLabelError,
+)
+
+
+logger = logging.getLogger(__name__)
+
+meter = metrics.get_meter(__name__)
+rejected_messages_counter = meter.create_counter(
+    name="inreach_connector.ipc_messages.rejected",
+    unit="1",
+    description="IPC messages rejected before sending them to InReach, by field.",
+)
+repaired_messages_counter = meter.create_counter(
+    name="inreach_connector.ipc_messages.repaired",
+    unit="1",
+    description="IPC message fields repaired before sending them to InReach, by field.",
+)
+
+# Limits enforced by the InReach IPC Inbound API (see errors.py)
+MESSAGE_MAX_LENGTH = 160
+MIN_TIMESTAMP = datetime(2011, 1, 1, tzinfo=timezone.utc)
+MIN_ALTITUDE = -1000  # Meters
+MAX_ALTITUDE = 18000
+MIN_SPEED = 0  # Km/h
+MAX_SPEED = 1854
+MAX_COURSE = 360  # Degrees
+MAX_LATITUDE = 90
+MAX_LONGITUDE = 180
+
+
+def _clamp(value, min_value, max_value):
+    return max(min_value, min(value, max_value))
+
+
+class IPCMessageValidator:
+    """
+    Checks IPC messages against the limits of the InReach API before sending them, so that invalid
+    messages fail right away with the same errors InReach would return, without a network round trip.
+    Fields that can be fixed safely (e.g. an altitude slightly out of range) are repaired when repair is enabled.
+    """
+
+    def __init__(self, **kwargs):
+        self.repair = kwargs.get("repair", settings.INREACH_REPAIR_INVALID_MESSAGES)
+
+    def _reject(self, error_class, field: str, detail: str):
+        rejected_messages_counter.add(1, {"field": field})
+        raise error_class(f"{error_class().args[0]} Got: {detail}")
+
+    def _repair_or_reject(self, error_class, field: str, value, repaired_value):
+        if not self.repair:
+            self._reject(error_class, field, str(value))
+        logger.debug(f"Repaired IPC message field '{field}': {value} -> {repaired_value}")
+        repaired_messages_counter.add(1, {"field": field})
+        return repaired_value
+
+    def _validate_timestamp(self, message: InReachIPCMessage):
+        timestamp = message.Timestamp
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        now = datetime.now(timezone.utc)
+        if timestamp < MIN_TIMESTAMP:
+            self._reject(InReachInvalidTimestampError, "Timestamp", timestamp.isoformat())
+        if timestamp > now:  # Usually a small clock skew in the source system
+            message.Timestamp = self._repair_or_reject(InReachInvalidTimestampError, "Timestamp", timestamp, now)
+
+    def validate_timestamp(self, ipc_message: InReachIPCMessage) -> InReachIPCMessage:
+        """
+        Returns a copy of the message with a valid timestamp (repaired if needed). Check it before splitting
+        a long message, so that the segments keep their order if the timestamp has to be repaired.
+        """
+        message = ipc_message.copy(deep=True)
+        self._validate_timestamp(message)
+        return message
+
+    def validate(self, ipc_message: InReachIPCMessage) -> InReachIPCMessage:
+        """
+        Returns a valid copy of the message (repaired if needed), or raises the matching InReachClientError.
+        """
+        message = ipc_message.copy(deep=True)
+
+        if not 1 <= len(message.Message) <= MESSAGE_MAX_LENGTH:
+            self._reject(InReachInvalidMessageError, "Message", f"{len(message.Message)} characters")
+
+        self._validate_timestamp(message)
+
+        if reference_point := message.ReferencePoint:
+            coordinate = reference_point.Coordinate
+            if not -MAX_LATITUDE <= coordinate.Latitude <= MAX_LATITUDE:
+                self._reject(InReachInvalidPositionError, "Latitude", str(coordinate.Latitude))
+            if not -MAX_LONGITUDE <= coordinate.Longitude <= MAX_LONGITUDE:
+                if abs(coordinate.Longitude) > 2 * MAX_LONGITUDE:
+                    self._reject(InReachInvalidPositionError, "Longitude", str(coordinate.Longitude))
+                # Same meridian, expressed in the -180..180 range
+                coordinate.Longitude = self._repair_or_reject(
+                    InReachInvalidPositionError, "Longitude", coordinate.Longitude,
+                    (coordinate.Longitude + MAX_LONGITUDE) % (2 * MAX_LONGITUDE) - MAX_LONGITUDE
+                )
+            if not MIN_ALTITUDE <= reference_point.Altitude <= MAX_ALTITUDE:
+                reference_point.Altitude = self._repair_or_reject(
+                    InReachInvalidAltitudeError, "Altitude", reference_point.Altitude,
+                    _clamp(reference_point.Altitude, MIN_ALTITUDE, MAX_ALTITUDE)
+                )
+            if not MIN_SPEED <= reference_point.Speed <= MAX_SPEED:
+                reference_point.Speed = self._repair_or_reject(
+                    InReachInvalidSpeedError, "Speed", reference_point.Speed,
+                    _clamp(reference_point.Speed, MIN_SPEED, MAX_SPEED)
+                )
+            if not -MAX_COURSE <= reference_point.Course <= MAX_COURSE:
+                reference_point.Course = self._repair_or_reject(
+                    InReachInvalidCourseError, "Course", reference_point.Course, reference_point.Course % MAX_COURSE
+                )
+            max_label_length = MESSAGE_MAX_LENGTH - len(message.Message)
+            if len(reference_point.Label) > max_label_length:
+                reference_point.Label = self._repair_or_reject(
+                    InReachInvalidLabelError, "Label", f"{len(reference_point.Label)} characters",
+                    reference_point.Label[:max_label_length]
+                )
+
+        return message
+
+
+inreach_message_validator = IPCMessageValidator()
+
+
+def _split_text(text: str, width: int, first_width: int = None) -> List[str]:
+    chunks = []
+    text = text.strip()
+    while len(text) > (limit := first_width if first_width and not chunks else width):
+        cut = text.rfind(" ", 0, limit + 1)
+        if cut < limit // 2:  # No space nearby, cut the word
+            cut = limit
+        chunks.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+def split_message(ipc_message: InReachIPCMessage, max_length: int = MESSAGE_MAX_LENGTH) -> List[InReachIPCMessage]:
+    """
+    Split a message longer than max_length into segments prefixed with "(i/n) ", breaking at spaces when possible.
+    Only the first segment has the reference point, and it leaves room for its label (which counts towards the limit).
+    Segments are a millisecond apart to keep their order in InReach, ending at the original timestamp (so that
+    none of them is in the future, as long as the original one isn't. See IPCMessageValidator.validate_timestamp()).
+    """
+    if len(ipc_message.Message) <= max_length or not ipc_message.Message.strip():
+        return [ipc_message]
+    reference_point = ipc_message.ReferencePoint
+    label_length = len(reference_point.Label or "") if reference_point else 0
+    digits = 1
+    while True:  # The prefix length depends on the number of segments
+        width = max_length - len(f"({'9' * digits}/{'9' * digits}) ")
+        chunks = _split_text(ipc_message.Message, width=width, first_width=max(width - label_length, 1))
+        if len(str(len(chunks))) <= digits:
+            break
+        digits += 1
+    total = len(chunks)
+    return [
+        ipc_message.copy(
+            update={
+                "Message": f"({i}/{total}) {chunk}",
+                "Timestamp": ipc_message.Timestamp - timedelta(milliseconds=total - i),
+                "ReferencePoint": reference_point if i == 1 else None,
+            },
+            deep=True,
+        )
+        for i, chunk in enumerate(chunks, start=1)
+    ]
@@ -4,6 +4,46 @@ import pytest
 import datetime
 from gundi_core.schemas.v2.inreach import InReachIPCMessage
 from gundi_core.schemas.v2 import Integration, IntegrationSummary
+from app.actions.inreach_client import (
+    AdaptiveRateLimiter,
+    LocalRateLimiterBackend,
+    CircuitBreakerRegistry,
+    CredentialsValidationCache,
+)
+from app.services.idempotency import IdempotencyStore
+
+
+@pytest.fixture(autouse=True)
+def local_inreach_rate_limiter(mocker):
+    """Keep rate limits in memory instead of Redis while testing."""
+    rate_limiter = AdaptiveRateLimiter(backend=LocalRateLimiterBackend())
+    mocker.patch("app.actions.inreach_client.client.inreach_rate_limiter", rate_limiter)
+    return rate_limiter
+
+
+@pytest.fixture(autouse=True)
+def inreach_circuit_breakers(mocker):
+    """Start every test with closed circuit breakers."""
+    circuit_breakers = CircuitBreakerRegistry()
+    mocker.patch("app.actions.inreach_client.client.inreach_circuit_breakers", circuit_breakers)
+    return circuit_breakers
+
+
+@pytest.fixture(autouse=True)
+def inreach_credentials_cache(mocker):
+    """Start every test without cached credential checks."""
+    credentials_cache = CredentialsValidationCache()
+    mocker.patch("app.actions.handlers.inreach_credentials_cache", credentials_cache)
+    return credentials_cache
+
+
+@pytest.fixture(autouse=True)
+def idempotency_store(mocker, mock_redis_client_in_memory):
+    """Keep idempotency records in memory instead of Redis while testing."""
+    store = IdempotencyStore()
+    store.db_client = mock_redis_client_in_memory
+    mocker.patch("app.actions.handlers.idempotency_store", store)
+    return store
 
 
 @pytest.fixture
@@ -208,10 +248,10 @@ def mock_inreach_client(mocker):
     return mock_inreach_client
 
 @pytest.fixture
-def mock_inreach_client_class(mocker, mock_inreach_client):
-    mock_inreach_client_class = mocker.MagicMock()
-    mock_inreach_client_class.return_value = mock_inreach_client
-    return mock_inreach_client_class
+def mock_inreach_client_pool(mocker, mock_inreach_client):
+    mock_inreach_client_pool = mocker.MagicMock()
+    mock_inreach_client_pool.client.return_value.__aenter__.return_value = mock_inreach_client
+    return mock_inreach_client_pool
 
 
 @pytest.fixture
@@ -6,13 +6,15 @@ from unittest.mock import AsyncMock
 import pytest
 from gundi_core.schemas.v2 import LogLevel
 
+from app.actions.configurations import AuthenticateConfig
+from app.actions.handlers import _deliver_message
 from app.actions.inreach_client import InReachAuthenticationError, InReachServiceUnreachable, InReachInternalError
 from app.services.action_runner import execute_action
 
 
 @pytest.mark.asyncio
 async def test_execute_auth_valid_credentials(
-        mocker, inreach_integration, mock_inreach_client_class, mock_config_manager_inreach,
+        mocker, inreach_integration, mock_inreach_client, mock_inreach_client_pool, mock_config_manager_inreach,
         mock_gundi_client_v2_inreach, mock_gundi_client_v2_class_inreach,
         mock_get_gundi_api_key, mock_gundi_sensors_client_class, mock_publish_event,
 ):
@@ -20,9 +22,9 @@ async def test_execute_auth_valid_credentials(
     mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
     mocker.patch("app.services.action_runner.publish_event", mock_publish_event)
     mocker.patch("app.services.action_runner.config_manager", mock_config_manager_inreach)
-    mocker.patch("app.actions.handlers.InReachClient", mock_inreach_client_class)
+    mocker.patch("app.actions.handlers.inreach_client_pool", mock_inreach_client_pool)
     mocker.patch("app.services.gundi.GundiClient", mock_gundi_client_v2_class_inreach)
-    mocker.patch("app.services.gundi.GundiDataSenderClient", mock_gundi_sensors_client_class)
+    mocker.patch("app.services.gundi.PooledGundiDataSenderClient", mock_gundi_sensors_client_class)
     mocker.patch("app.services.gundi._get_gundi_api_key", mock_get_gundi_api_key)
     integration_id = str(inreach_integration.id)
 
@@ -38,22 +40,50 @@ async def test_execute_auth_valid_credentials(
     assert response.get("valid_credentials") is True
 
 
+@pytest.mark.asyncio
+async def test_execute_auth_uses_cached_credentials_check(
+        mocker, inreach_integration, mock_inreach_client, mock_inreach_client_pool, mock_config_manager_inreach,
+        mock_gundi_client_v2_inreach, mock_publish_event, integration_details_cache
+):
+    mocker.patch("app.services.action_runner._portal", mock_gundi_client_v2_inreach)
+    mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
+    mocker.patch("app.services.action_runner.publish_event", mock_publish_event)
+    mocker.patch("app.services.action_runner.config_manager", mock_config_manager_inreach)
+    mocker.patch("app.actions.handlers.inreach_client_pool", mock_inreach_client_pool)
+    integration_id = str(inreach_integration.id)
+    config_overrides = {"username": "test_user", "password": "test_password"}
+
+    for _ in range(2):
+        response = await execute_action(
+            integration_id=integration_id, action_id="auth", config_overrides=config_overrides
+        )
+        assert response.get("valid_credentials") is True
+
+    # Only the first check reaches InReach
+    assert mock_inreach_client.pingback.call_count == 1
+
+    # A change in the integration (here, or in another replica) forces a new check
+    await integration_details_cache.invalidate(integration_id)
+    await execute_action(integration_id=integration_id, action_id="auth", config_overrides=config_overrides)
+    assert mock_inreach_client.pingback.call_count == 2
+
+
 @pytest.mark.asyncio
 async def test_execute_auth_bad_credentials(
-        mocker, inreach_integration, mock_inreach_client_class, mock_config_manager_inreach,
+        mocker, inreach_integration, mock_inreach_client, mock_inreach_client_pool, mock_config_manager_inreach,
         mock_gundi_client_v2_inreach, mock_gundi_client_v2_class_inreach,
         mock_get_gundi_api_key, mock_gundi_sensors_client_class, mock_publish_event,
 ):
-    mock_inreach_client_class.return_value.pingback = mock.AsyncMock(
+    mock_inreach_client.pingback = mock.AsyncMock(
         side_effect=InReachAuthenticationError()
     )
     mocker.patch("app.services.action_runner._portal", mock_gundi_client_v2_inreach)
     mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
     mocker.patch("app.services.action_runner.publish_event", mock_publish_event)
     mocker.patch("app.services.action_runner.config_manager", mock_config_manager_inreach)
-    mocker.patch("app.actions.handlers.InReachClient", mock_inreach_client_class)
+    mocker.patch("app.actions.handlers.inreach_client_pool", mock_inreach_client_pool)
     mocker.patch("app.services.gundi.GundiClient", mock_gundi_client_v2_class_inreach)
-    mocker.patch("app.services.gundi.GundiDataSenderClient", mock_gundi_sensors_client_class)
+    mocker.patch("app.services.gundi.PooledGundiDataSenderClient", mock_gundi_sensors_client_class)
     mocker.patch("app.services.gundi._get_gundi_api_key", mock_get_gundi_api_key)
     integration_id = str(inreach_integration.id)
 
@@ -71,20 +101,20 @@ async def test_execute_auth_bad_credentials(
 
 @pytest.mark.asyncio
 async def test_execute_auth_with_inreach_error(
-        mocker, inreach_integration, mock_inreach_client_class, mock_config_manager_inreach,
+        mocker, inreach_integration, mock_inreach_client, mock_inreach_client_pool, mock_config_manager_inreach,
         mock_gundi_client_v2_inreach, mock_gundi_client_v2_class_inreach,
         mock_get_gundi_api_key, mock_gundi_sensors_client_class, mock_publish_event,
 ):
-    mock_inreach_client_class.return_value.pingback = mock.AsyncMock(
+    mock_inreach_client.pingback = mock.AsyncMock(
         side_effect=InReachServiceUnreachable()
     )
     mocker.patch("app.services.action_runner._portal", mock_gundi_client_v2_inreach)
     mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
     mocker.patch("app.services.action_runner.publish_event", mock_publish_event)
     mocker.patch("app.services.action_runner.config_manager", mock_config_manager_inreach)
-    mocker.patch("app.actions.handlers.InReachClient", mock_inreach_client_class)
+    mocker.patch("app.actions.handlers.inreach_client_pool", mock_inreach_client_pool)
     mocker.patch("app.services.gundi.GundiClient", mock_gundi_client_v2_class_inreach)
-    mocker.patch("app.services.gundi.GundiDataSenderClient", mock_gundi_sensors_client_class)
+    mocker.patch("app.services.gundi.PooledGundiDataSenderClient", mock_gundi_sensors_client_class)
     mocker.patch("app.services.gundi._get_gundi_api_key", mock_get_gundi_api_key)
     integration_id = str(inreach_integration.id)
 
@@ -106,7 +136,7 @@ async def test_execute_auth_with_inreach_error(
 
 @pytest.mark.asyncio
 async def test_execute_push_messages_success(
-        mocker, inreach_integration, mock_inreach_client_class, mock_config_manager_inreach,
+        mocker, inreach_integration, mock_inreach_client, mock_inreach_client_pool, mock_config_manager_inreach,
         mock_gundi_client_v2_inreach, mock_gundi_client_v2_class_inreach,
         mock_get_gundi_api_key, mock_gundi_sensors_client_class, mock_publish_event,
         mock_push_messages_data, mock_push_messages_metadata
@@ -115,9 +145,9 @@ async def test_execute_push_messages_success(
     mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
     mocker.patch("app.services.action_runner.publish_event", mock_publish_event)
     mocker.patch("app.services.action_runner.config_manager", mock_config_manager_inreach)
-    mocker.patch("app.actions.handlers.InReachClient", mock_inreach_client_class)
+    mocker.patch("app.actions.handlers.inreach_client_pool", mock_inreach_client_pool)
     mocker.patch("app.services.gundi.GundiClient", mock_gundi_client_v2_class_inreach)
-    mocker.patch("app.services.gundi.GundiDataSenderClient", mock_gundi_sensors_client_class)
+    mocker.patch("app.services.gundi.PooledGundiDataSenderClient", mock_gundi_sensors_client_class)
     mocker.patch("app.services.gundi._get_gundi_api_key", mock_get_gundi_api_key)
     mock_log_activity = AsyncMock()
     mocker.patch("app.actions.handlers.log_action_activity", mock_log_activity)
@@ -150,21 +180,21 @@ async def test_execute_push_messages_success(
 
 @pytest.mark.asyncio
 async def test_execute_push_messages_with_inreach_error(
-        mocker, inreach_integration, mock_inreach_client_class, mock_config_manager_inreach,
+        mocker, inreach_integration, mock_inreach_client, mock_inreach_client_pool, mock_config_manager_inreach,
         mock_gundi_client_v2_inreach, mock_gundi_client_v2_class_inreach,
         mock_get_gundi_api_key, mock_gundi_sensors_client_class, mock_publish_event,
         mock_push_messages_data, mock_push_messages_metadata
 ):
-    mock_inreach_client_class.return_value.send_messages = mock.AsyncMock(
+    mock_inreach_client.send_messages = mock.AsyncMock(
         side_effect=InReachInternalError()
     )
     mocker.patch("app.services.action_runner._portal", mock_gundi_client_v2_inreach)
     mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
     mocker.patch("app.services.action_runner.publish_event", mock_publish_event)
     mocker.patch("app.services.action_runner.config_manager", mock_config_manager_inreach)
-    mocker.patch("app.actions.handlers.InReachClient", mock_inreach_client_class)
+    mocker.patch("app.actions.handlers.inreach_client_pool", mock_inreach_client_pool)
     mocker.patch("app.services.gundi.GundiClient", mock_gundi_client_v2_class_inreach)
-    mocker.patch("app.services.gundi.GundiDataSenderClient", mock_gundi_sensors_client_class)
+    mocker.patch("app.services.gundi.PooledGundiDataSenderClient", mock_gundi_sensors_client_class)
     mocker.patch("app.services.gundi._get_gundi_api_key", mock_get_gundi_api_key)
     mock_log_activity = AsyncMock()
     mocker.patch("app.actions.handlers.log_action_activity", mock_log_activity)
@@ -199,3 +229,176 @@ async def test_execute_push_messages_with_inreach_error(
     assert logged_data.get("error_traceback")
     for key, value in mock_push_messages_metadata.items():
         assert logged_data.get(key) == value
+
+
+@pytest.mark.asyncio
+async def test_execute_push_messages_concurrently_sends_one_batch(
+        mocker, inreach_integration, mock_inreach_client, mock_inreach_client_pool, mock_config_manager_inreach,
+        mock_gundi_client_v2_inreach, mock_publish_event, mock_push_messages_data, mock_push_messages_metadata
+):
+    mocker.patch("app.services.action_runner._portal", mock_gundi_client_v2_inreach)
+    mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
+    mocker.patch("app.services.action_runner.publish_event", mock_publish_event)
+    mocker.patch("app.services.action_runner.config_manager", mock_config_manager_inreach)
+    mocker.patch("app.actions.handlers.inreach_client_pool", mock_inreach_client_pool)
+    mocker.patch("app.actions.handlers.log_action_activity", AsyncMock())
+    integration_id = str(inreach_integration.id)
+
+    responses = await asyncio.gather(
+        *[
+            execute_action(
+                integration_id=integration_id,
+                action_id="push_messages",
+                data=mock_push_messages_data,
+                metadata={**mock_push_messages_metadata, "gundi_id": f"23ca4b15-18b6-4cf4-9da6-36dd69c6f63{i}"}
+            ) for i in range(3)
+        ]
+    )
+
+    assert all(response.get("status") == "success" for response in responses)
+    # Messages are delivered to InReach in a single request
+    mock_inreach_client.send_messages.assert_awaited_once()
+    assert len(mock_inreach_client.send_messages.call_args.kwargs["ipc_messages"]) == 3
+
+
+@pytest.mark.asyncio
+async def test_push_messages_with_different_credentials_are_not_batched_together(
+        mocker, inreach_integration, inreach_ipc_message, mock_inreach_client, mock_inreach_client_pool,
+        mock_push_messages_metadata
+):
+    mocker.patch("app.actions.handlers.inreach_client_pool", mock_inreach_client_pool)
+    mocker.patch("app.actions.handlers.log_action_activity", AsyncMock())
+    auth_configs = [
+        AuthenticateConfig(api_url="https://inreach.test/api", username="shared_user", password=password)
+        for password in ("password1", "password2")
+    ]
+
+    await asyncio.gather(
+        *[
+            _deliver_message(
+                integration=inreach_integration,
+                ipc_message=inreach_ipc_message,
+                auth_config=auth_config,
+                gundi_id=f"23ca4b15-18b6-4cf4-9da6-36dd69c6f63{i}",
+                metadata=mock_push_messages_metadata,
+            ) for i, auth_config in enumerate(auth_configs)
+        ]
+    )
+
+    # Each message is sent with its own credentials
+    assert mock_inreach_client.send_messages.await_count == 2
+    sent_passwords = {call.kwargs["password"] for call in mock_inreach_client.send_messages.await_args_list}
+    assert sent_passwords == {"password1", "password2"}
+
+
+@pytest.mark.asyncio
+async def test_execute_push_messages_rejects_invalid_message_without_calling_inreach(
+        mocker, inreach_integration, mock_inreach_client, mock_inreach_client_pool, mock_config_manager_inreach,
+        mock_gundi_client_v2_inreach, mock_publish_event, mock_push_messages_data, mock_push_messages_metadata
+):
+    mocker.patch("app.services.action_runner._portal", mock_gundi_client_v2_inreach)
+    mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
+    mocker.patch("app.services.action_runner.publish_event", mock_publish_event)
+    mocker.patch("app.services.action_runner.config_manager", mock_config_manager_inreach)
+    mocker.patch("app.actions.handlers.inreach_client_pool", mock_inreach_client_pool)
+    mocker.patch("app.actions.handlers.log_action_activity", AsyncMock())
+    mock_push_messages_data["payload"]["Timestamp"] = "2010-06-04 13:35:10+03:00"
+
+    response = await execute_action(
+        integration_id=str(inreach_integration.id),
+        action_id="push_messages",
+        data=mock_push_messages_data,
+        metadata=mock_push_messages_metadata
+    )
+
+    assert response.status_code == 500
+    assert "InReachInvalidTimestampError" in json.loads(response.body).get("detail", {}).get("error", "")
+    mock_inreach_client.send_messages.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_execute_push_messages_sends_duplicates_once(
+        mocker, inreach_integration, mock_inreach_client, mock_inreach_client_pool, mock_config_manager_inreach,
+        mock_gundi_client_v2_inreach, mock_publish_event, mock_push_messages_data, mock_push_messages_metadata
+):
+    mocker.patch("app.services.action_runner._portal", mock_gundi_client_v2_inreach)
+    mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
+    mocker.patch("app.services.action_runner.publish_event", mock_publish_event)
+    mocker.patch("app.services.action_runner.config_manager", mock_config_manager_inreach)
+    mocker.patch("app.actions.handlers.inreach_client_pool", mock_inreach_client_pool)
+    mock_log_activity = AsyncMock()
+    mocker.patch("app.actions.handlers.log_action_activity", mock_log_activity)
+    integration_id = str(inreach_integration.id)
+
+    async def push_message():
+        return await execute_action(
+            integration_id=integration_id,
+            action_id="push_messages",
+            data=mock_push_messages_data,
+            metadata=mock_push_messages_metadata
+        )
+
+    # Duplicates in flight wait for the same delivery
+    responses = await asyncio.gather(push_message(), push_message())
+    # Messages redelivered later get the recorded response
+    responses.append(await push_message())
+
+    assert all(response == responses[0] for response in responses)
+    assert responses[0].get("status") == "success"
+    mock_inreach_client.send_messages.assert_awaited_once()
+    mock_log_activity.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_execute_push_messages_retries_after_error(
+        mocker, inreach_integration, mock_inreach_client, mock_inreach_client_pool, mock_config_manager_inreach,
+        mock_gundi_client_v2_inreach, mock_publish_event, mock_push_messages_data, mock_push_messages_metadata
+):
+    mock_inreach_client.send_messages.side_effect = [InReachServiceUnreachable(), {"Count": 1}]
+    mocker.patch("app.services.action_runner._portal", mock_gundi_client_v2_inreach)
+    mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
+    mocker.patch("app.services.action_runner.publish_event", mock_publish_event)
+    mocker.patch("app.services.action_runner.config_manager", mock_config_manager_inreach)
+    mocker.patch("app.actions.handlers.inreach_client_pool", mock_inreach_client_pool)
+    mocker.patch("app.actions.handlers.log_action_activity", AsyncMock())
+    integration_id = str(inreach_integration.id)
+
+    responses = [
+        await execute_action(
+            integration_id=integration_id,
+            action_id="push_messages",
+            data=mock_push_messages_data,
+            metadata=mock_push_messages_metadata
+        ) for _ in range(2)
+    ]
+
+    assert responses[0].status_code == 500
+    assert responses[1] == {"status": "success", "inreach_response": {"Count": 1}}
+    assert mock_inreach_client.send_messages.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_execute_push_messages_splits_long_text_in_one_request(
+        mocker, inreach_integration, mock_inreach_client, mock_inreach_client_pool, mock_config_manager_inreach,
+        mock_gundi_client_v2_inreach, mock_publish_event, mock_push_messages_data, mock_push_messages_metadata
+):
+    mocker.patch("app.services.action_runner._portal", mock_gundi_client_v2_inreach)
+    mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
+    mocker.patch("app.services.action_runner.publish_event", mock_publish_event)
+    mocker.patch("app.services.action_runner.config_manager", mock_config_manager_inreach)
+    mocker.patch("app.actions.handlers.inreach_client_pool", mock_inreach_client_pool)
+    mocker.patch("app.actions.handlers.log_action_activity", AsyncMock())
+    mock_push_messages_data["payload"]["Message"] = "Lorem ipsum dolor sit amet. " * 20
+
+    response = await execute_action(
+        integration_id=str(inreach_integration.id),
+        action_id="push_messages",
+        data=mock_push_messages_data,
+        metadata=mock_push_messages_metadata
+    )
+
+    assert response.get("status") == "success"
+    mock_inreach_client.send_messages.assert_awaited_once()
+    ipc_messages = mock_inreach_client.send_messages.call_args.kwargs["ipc_messages"]
+    assert len(ipc_messages) == 4
+    assert [message.Message[:5] for message in ipc_messages] == ["(1/4)", "(2/4)", "(3/4)", "(4/4)"]
@@ -0,0 +1,112 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from ..inreach_client import MessageBatcher, InReachInvalidMessageError, InReachServiceUnreachable
+
+
+@pytest.mark.asyncio
+async def test_batcher_sends_concurrent_messages_in_one_call():
+    batcher = MessageBatcher(window=0.05, max_size=10)
+    send_batch = AsyncMock(return_value={"count": 3})
+
+    results = await asyncio.gather(
+        *[batcher.submit(key="tenant1", messages=[f"message {i}"], send_batch=send_batch) for i in range(3)]
+    )
+
+    send_batch.assert_awaited_once_with(["message 0", "message 1", "message 2"])
+    assert results == [{"count": 3}] * 3
+
+
+@pytest.mark.asyncio
+async def test_batcher_keeps_destinations_apart():
+    batcher = MessageBatcher(window=0.05, max_size=10)
+    send_batch_1 = AsyncMock(return_value={})
+    send_batch_2 = AsyncMock(return_value={})
+
+    await asyncio.gather(
+        batcher.submit(key="tenant1", messages=["message 1"], send_batch=send_batch_1),
+        batcher.submit(key="tenant2", messages=["message 2"], send_batch=send_batch_2),
+        batcher.submit(key="tenant1", messages=["message 3"], send_batch=send_batch_1),
+    )
+
+    send_batch_1.assert_awaited_once_with(["message 1", "message 3"])
+    send_batch_2.assert_awaited_once_with(["message 2"])
+
+
+@pytest.mark.asyncio
+async def test_batcher_sends_full_batch_without_waiting_for_the_window():
+    batcher = MessageBatcher(window=60, max_size=2)
+    send_batch = AsyncMock(return_value={})
+
+    await asyncio.wait_for(
+        asyncio.gather(
+            *[batcher.submit(key="tenant1", messages=[f"message {i}"], send_batch=send_batch) for i in range(4)]
+        ),
+        timeout=1
+    )
+
+    assert send_batch.await_count == 2
+    send_batch.assert_any_await(["message 0", "message 1"])
+    send_batch.assert_any_await(["message 2", "message 3"])
+
+
+@pytest.mark.asyncio
+async def test_batcher_returns_service_errors_to_every_caller():
+    batcher = MessageBatcher(window=0.05, max_size=10)
+    send_batch = AsyncMock(side_effect=InReachServiceUnreachable())
+
+    results = await asyncio.gather(
+        *[batcher.submit(key="tenant1", messages=[f"message {i}"], send_batch=send_batch) for i in range(2)],
+        return_exceptions=True
+    )
+
+    send_batch.assert_awaited_once()
+    assert all(isinstance(result, InReachServiceUnreachable) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_batcher_retries_individually_on_invalid_message():
+    batcher = MessageBatcher(window=0.05, max_size=10)
+
+    async def send_batch(messages):
+        if "invalid" in messages:
+            raise InReachInvalidMessageError()
+        return {"count": len(messages)}
+
+    results = await asyncio.gather(
+        batcher.submit(key="tenant1", messages=["valid 1"], send_batch=send_batch),
+        batcher.submit(key="tenant1", messages=["invalid"], send_batch=send_batch),
+        batcher.submit(key="tenant1", messages=["valid 2"], send_batch=send_batch),
+        return_exceptions=True
+    )
+
+    assert results[0] == {"count": 1}
+    assert isinstance(results[1], InReachInvalidMessageError)
+    assert results[2] == {"count": 1}
+
+
+@pytest.mark.asyncio
+async def test_batcher_disabled_with_zero_window():
+    batcher = MessageBatcher(window=0, max_size=10)
+    send_batch = AsyncMock(return_value={})
+
+    await asyncio.gather(
+        *[batcher.submit(key="tenant1", messages=[f"message {i}"], send_batch=send_batch) for i in range(2)]
+    )
+
+    assert send_batch.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_batcher_close_sends_pending_batches():
+    batcher = MessageBatcher(window=60, max_size=10)
+    send_batch = AsyncMock(return_value={})
+
+    task = asyncio.create_task(batcher.submit(key="tenant1", messages=["message"], send_batch=send_batch))
+    await asyncio.sleep(0)
+    await batcher.close()
+
+    assert await task == {}
+    send_batch.assert_awaited_once_with(["message"])
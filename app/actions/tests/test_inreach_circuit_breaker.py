@@ -0,0 +1,102 @@
+import httpx
+import pytest
+import respx
+
+from ..inreach_client import (
+    InReachClient,
+    CircuitBreaker,
+    CircuitState,
+    InReachServiceUnreachable,
+    InReachCircuitOpenError,
+    InReachInvalidMessageError,
+)
+
+
+async def _call(breaker, error=None):
+    async with breaker.call():
+        if error:
+            raise error
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_opens_when_failure_rate_is_reached():
+    breaker = CircuitBreaker(name="https://explore.garmin.com", minimum_calls=4, failure_rate_threshold=0.5)
+
+    for error in [None, InReachServiceUnreachable(), None, InReachServiceUnreachable()]:
+        try:
+            await _call(breaker, error)
+        except InReachServiceUnreachable:
+            pass
+
+    assert breaker.state == CircuitState.OPEN
+    # Calls fail right away while the circuit is open
+    with pytest.raises(InReachCircuitOpenError):
+        await _call(breaker)
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_stays_closed_on_client_errors():
+    breaker = CircuitBreaker(name="https://explore.garmin.com", minimum_calls=2)
+
+    for _ in range(5):
+        with pytest.raises(InReachInvalidMessageError):
+            await _call(breaker, InReachInvalidMessageError(response=httpx.Response(status_code=400)))
+
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.failure_rate == 0.0
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_closes_after_successful_trial_call():
+    breaker = CircuitBreaker(name="https://explore.garmin.com", minimum_calls=1, open_seconds=0)
+    with pytest.raises(InReachServiceUnreachable):
+        await _call(breaker, InReachServiceUnreachable())
+    assert breaker.state == CircuitState.OPEN
+
+    await _call(breaker)  # Trial call after the cool-down
+
+    assert breaker.state == CircuitState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_reopens_after_failed_trial_call():
+    breaker = CircuitBreaker(name="https://explore.garmin.com", minimum_calls=1, open_seconds=0)
+    with pytest.raises(InReachServiceUnreachable):
+        await _call(breaker, InReachServiceUnreachable())
+
+    with pytest.raises(InReachServiceUnreachable):
+        await _call(breaker, InReachServiceUnreachable())
+
+    assert breaker.state == CircuitState.OPEN
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_limits_trial_calls():
+    breaker = CircuitBreaker(name="https://explore.garmin.com", minimum_calls=1, open_seconds=0, half_open_max_calls=1)
+    with pytest.raises(InReachServiceUnreachable):
+        await _call(breaker, InReachServiceUnreachable())
+
+    async with breaker.call():
+        assert breaker.state == CircuitState.HALF_OPEN
+        with pytest.raises(InReachCircuitOpenError):
+            await _call(breaker)
+
+
+@pytest.mark.asyncio
+async def test_inreach_client_fails_fast_when_circuit_is_open(inreach_circuit_breakers, inreach_ipc_message):
+    async with respx.mock(assert_all_called=True) as mock:
+        route = mock.post("/IPCInbound/V1/Messaging.svc/Message").respond(
+            status_code=httpx.codes.SERVICE_UNAVAILABLE,
+            text="Service Unavailable"
+        )
+
+        async with InReachClient() as client:
+            breaker = inreach_circuit_breakers.get(client.api_url)
+            for _ in range(breaker.minimum_calls):
+                with pytest.raises(InReachServiceUnreachable):
+                    await client.send_messages(ipc_messages=[inreach_ipc_message], username="user", password="pass")
+            with pytest.raises(InReachCircuitOpenError):
+                await client.send_messages(ipc_messages=[inreach_ipc_message], username="user", password="pass")
+
+        assert route.call_count == breaker.minimum_calls
+    assert inreach_circuit_breakers.snapshot()[InReachClient.DEFAULT_API_URL]["state"] == "open"
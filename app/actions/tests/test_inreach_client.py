@@ -1,10 +1,15 @@
+import datetime
+import json
+
 import httpx
 import pytest
 import respx
+from gundi_core.schemas.v2.inreach import InReachIPCMessage
 
 
 from ..inreach_client import (
     InReachClient,
+    serialize_messages,
     InReachAuthenticationError,
     InReachServiceUnreachable,
     InReachInternalError,
@@ -208,5 +213,52 @@ async def test_inreach_client_pingback_internal_error_text_response():
             assert error.response.status_code == httpx.codes.INTERNAL_SERVER_ERROR
 
 
+@pytest.mark.asyncio
+async def test_inreach_client_send_messages_request_body(inreach_ipc_message):
+    async with respx.mock(assert_all_called=True) as mock:
+        route = mock.post("/IPCInbound/V1/Messaging.svc/Message").respond(
+            status_code=httpx.codes.OK,
+            json={}
+        )
 
-
+        async with InReachClient() as client:
+            await client.send_messages(ipc_messages=[inreach_ipc_message], username="test_user", password="test_pass")
+
+        request = route.calls.last.request
+        assert request.headers["Content-Type"] == "application/json"
+        timestamp_ms = int(inreach_ipc_message.Timestamp.timestamp() * 1000)
+        assert json.loads(request.content) == {
+            "Messages": [
+                {
+                    "Message": "Gundi test message.",
+                    "Recipients": ["0123456789"],
+                    "Sender": "admin@sitex.pamdas.org",
+                    "ReferencePoint": None,
+                    "Timestamp": f"/Date({timestamp_ms})/"
+                }
+            ]
+        }
+
+
+def test_serialize_messages_matches_legacy_serialization(inreach_ipc_message):
+    message_with_location = InReachIPCMessage.parse_obj(
+        {
+            "Message": "Ranger at the gate. Ñandú spotted.",
+            "Recipients": ["0123456789", "9876543210"],
+            "Sender": "+15551234567",
+            "ReferencePoint": {
+                "Altitude": 1520,
+                "Coordinate": {"Latitude": -51.6886451, "Longitude": -72.7044213},
+                "Course": 45,
+                "Label": "Gate",
+                "Speed": 12
+            },
+            "Timestamp": datetime.datetime(2025, 6, 4, 13, 35, 10, 123456, tzinfo=datetime.timezone.utc)
+        }
+    )
+    ipc_messages = [inreach_ipc_message, message_with_location]
+    # What was sent before: per-message json() + loads, a dumps/loads round trip, then json.dumps in httpx
+    legacy_data = {"Messages": [json.loads(msg.json()) for msg in ipc_messages]}
+    legacy_body = json.dumps(json.loads(json.dumps(legacy_data, default=str))).encode("utf-8")
+
+    assert serialize_messages(ipc_messages) == legacy_body
@@ -0,0 +1,127 @@
+import asyncio
+
+import httpx
+import pytest
+import respx
+
+from ..inreach_client import InReachClientPool
+
+
+@pytest.mark.asyncio
+async def test_pool_reuses_client_for_same_api_url_and_username():
+    pool = InReachClientPool()
+
+    async with pool.client(api_url="https://explore.garmin.com", username="user1") as client_1:
+        pass
+    async with pool.client(api_url="https://explore.garmin.com", username="user1") as client_2:
+        pass
+
+    assert client_1 is client_2
+    assert len(pool) == 1
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_creates_one_client_per_tenant_with_shared_connections():
+    pool = InReachClientPool()
+
+    async with pool.client(api_url="https://explore.garmin.com", username="user1") as client_1:
+        pass
+    async with pool.client(api_url="https://explore.garmin.com", username="user2") as client_2:
+        pass
+    async with pool.client(api_url="https://eu.explore.garmin.com", username="user1") as client_3:
+        pass
+
+    assert len({id(client_1), id(client_2), id(client_3)}) == 3
+    assert len(pool) == 3
+    # Clients for the same API URL share the same connection pool
+    assert client_1.session._transport is client_2.session._transport
+    assert client_1.session._transport is not client_3.session._transport
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_evicts_idle_clients():
+    pool = InReachClientPool(idle_timeout=0.01)
+
+    async with pool.client(api_url="https://explore.garmin.com", username="user1"):
+        await asyncio.sleep(0.02)
+        # Clients in use are never evicted
+        await pool.evict_idle_clients()
+        assert len(pool) == 1
+    await asyncio.sleep(0.02)
+    await pool.evict_idle_clients()
+
+    assert len(pool) == 0
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_closes_evicted_clients_but_not_shared_connections(mocker):
+    pool = InReachClientPool(idle_timeout=0.01)
+    close_connections = mocker.patch.object(httpx.AsyncHTTPTransport, "aclose", mocker.AsyncMock())
+
+    async with pool.client(api_url="https://explore.garmin.com", username="user1") as client_1:
+        pass
+    await asyncio.sleep(0.02)
+    async with pool.client(api_url="https://explore.garmin.com", username="user2") as client_2:
+        pass
+
+    assert client_1.session.is_closed
+    assert not client_2.session.is_closed
+    close_connections.assert_not_awaited()  # Still used by user2
+    await pool.close()
+    assert client_2.session.is_closed
+    close_connections.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_pool_evicts_least_recently_used_clients_when_full():
+    pool = InReachClientPool(max_clients=2)
+
+    async with pool.client(api_url="https://explore.garmin.com", username="user1") as client_1:
+        pass
+    async with pool.client(api_url="https://explore.garmin.com", username="user2"):
+        pass
+    async with pool.client(api_url="https://explore.garmin.com", username="user1"):
+        pass
+    async with pool.client(api_url="https://explore.garmin.com", username="user3"):
+        pass
+
+    assert len(pool) == 2
+    async with pool.client(api_url="https://explore.garmin.com", username="user1") as client:
+        assert client is client_1  # user2 was evicted instead
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pooled_client_pingback_success():
+    pool = InReachClientPool()
+    async with respx.mock(assert_all_called=True) as mock:
+        mock.post("/IPCInbound/V1/Pingback.svc/PingbackRequest").respond(
+            status_code=httpx.codes.OK,
+            text=""
+        )
+
+        for _ in range(2):
+            async with pool.client(username="test_user") as client:
+                response = await client.pingback(username="test_user", password="test_pass")
+                assert response == {}
+
+        assert mock.calls.call_count == 2
+    await pool.close()
+    assert len(pool) == 0
+
+
+@pytest.mark.asyncio
+async def test_pool_warm_up_uses_shared_transport():
+    pool = InReachClientPool()
+    async with respx.mock(assert_all_called=True) as mock:
+        route = mock.head("https://explore.garmin.com").respond(status_code=httpx.codes.OK)
+
+        await pool.warm_up(api_url="https://explore.garmin.com")
+
+        assert route.called
+    assert "https://explore.garmin.com" in pool._transports
+    assert len(pool) == 0  # No clients are created
+    await pool.close()
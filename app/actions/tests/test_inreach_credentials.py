@@ -0,0 +1,28 @@
+from app.actions.inreach_client import CredentialsValidationCache
+
+
+CREDENTIALS = ("https://inreach.test/api", "shared_user", "password")
+
+
+def test_credentials_checks_are_kept_per_integration():
+    credentials_cache = CredentialsValidationCache()
+    credentials_cache.add("integration1", *CREDENTIALS)
+    credentials_cache.add("integration2", *CREDENTIALS)
+
+    # A change in one integration sharing the account doesn't affect the other
+    credentials_cache.invalidate("integration1")
+
+    assert not credentials_cache.is_valid("integration1", *CREDENTIALS)
+    assert credentials_cache.is_valid("integration2", *CREDENTIALS)
+    assert not credentials_cache.is_valid("integration2", "https://inreach.test/api", "shared_user", "other")
+
+
+def test_credentials_checks_are_all_invalidated_without_integration():
+    credentials_cache = CredentialsValidationCache()
+    credentials_cache.add("integration1", *CREDENTIALS)
+    credentials_cache.add("integration2", *CREDENTIALS)
+
+    credentials_cache.invalidate(None)
+
+    assert not credentials_cache.is_valid("integration1", *CREDENTIALS)
+    assert not credentials_cache.is_valid("integration2", *CREDENTIALS)
@@ -0,0 +1,153 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+import redis.asyncio as redis
+import respx
+
+from ..inreach_client import (
+    InReachClient,
+    AdaptiveRateLimiter,
+    LocalRateLimiterBackend,
+    RedisRateLimiterBackend,
+    InReachTooManyRequestsError,
+    InReachServiceUnreachable,
+    InReachInvalidMessageError,
+)
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_grows_limit_on_success():
+    backend = LocalRateLimiterBackend()
+    rate_limiter = AdaptiveRateLimiter(backend=backend, initial_limit=2.0, increase_step=0.5, max_limit=3.0)
+
+    for _ in range(4):
+        async with rate_limiter.limit(key="account1"):
+            pass
+
+    assert backend._limits["account1"] == 3.0  # Capped to the max limit
+    assert backend.in_flight("account1") == 0
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        InReachTooManyRequestsError(),
+        InReachServiceUnreachable(response=httpx.Response(status_code=503)),
+    ]
+)
+@pytest.mark.asyncio
+async def test_rate_limiter_shrinks_limit_when_throttled(error):
+    backend = LocalRateLimiterBackend()
+    rate_limiter = AdaptiveRateLimiter(backend=backend, initial_limit=8.0, decrease_factor=0.5, min_limit=1.0)
+
+    for _ in range(4):
+        with pytest.raises(type(error)):
+            async with rate_limiter.limit(key="account1"):
+                raise error
+
+    assert backend._limits["account1"] == 1.0  # Never below the min limit
+    assert backend.in_flight("account1") == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_ignores_other_errors():
+    backend = LocalRateLimiterBackend()
+    rate_limiter = AdaptiveRateLimiter(backend=backend, initial_limit=4.0)
+
+    with pytest.raises(InReachInvalidMessageError):
+        async with rate_limiter.limit(key="account1"):
+            raise InReachInvalidMessageError()
+
+    assert "account1" not in backend._limits
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_bounds_concurrency_per_account():
+    rate_limiter = AdaptiveRateLimiter(backend=LocalRateLimiterBackend(), initial_limit=2.0, increase_step=0.0)
+    running = {"account1": 0, "account2": 0}
+    max_running = {"account1": 0, "account2": 0}
+
+    async def call_api(key):
+        async with rate_limiter.limit(key=key):
+            running[key] += 1
+            max_running[key] = max(max_running[key], running[key])
+            await asyncio.sleep(0.01)
+            running[key] -= 1
+
+    await asyncio.gather(*[call_api("account1") for _ in range(6)], *[call_api("account2") for _ in range(6)])
+
+    assert max_running == {"account1": 2, "account2": 2}
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_raises_too_many_requests_after_max_wait():
+    rate_limiter = AdaptiveRateLimiter(backend=LocalRateLimiterBackend(), initial_limit=1.0, max_wait=0.1)
+
+    async with rate_limiter.limit(key="account1"):
+        with pytest.raises(InReachTooManyRequestsError):
+            async with rate_limiter.limit(key="account1"):
+                pass
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_frees_slots_that_are_never_released():
+    backend = LocalRateLimiterBackend()
+    rate_limiter = AdaptiveRateLimiter(backend=backend, initial_limit=1.0, max_wait=0.1, lease_seconds=0.2)
+    assert await rate_limiter.acquire(key="account1")  # Never released, e.g. the task was killed
+
+    with pytest.raises(InReachTooManyRequestsError):
+        await rate_limiter.acquire(key="account1")
+    await asyncio.sleep(0.2)  # The lease expires
+
+    assert await rate_limiter.acquire(key="account1")
+    assert backend.in_flight("account1") == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_rate_limiter_backend_uses_shared_state(mocker, mock_redis):
+    mock_redis.Redis.return_value.eval = AsyncMock(side_effect=[1, "5.1"])
+    mock_redis.Redis.return_value.zrem = AsyncMock(return_value=1)
+    mocker.patch("app.actions.inreach_client.rate_limiter.redis.Redis", mock_redis.Redis)
+    rate_limiter = AdaptiveRateLimiter(backend=RedisRateLimiterBackend(), initial_limit=5.0, increase_step=0.1)
+
+    async with rate_limiter.limit(key="account1"):
+        pass
+
+    acquire_call, increase_call = mock_redis.Redis.return_value.eval.call_args_list
+    assert acquire_call.args[1:4] == (2, "inreach_rate_limit.account1", "inreach_rate_limit.account1.leases")
+    assert increase_call.args[1:3] == (1, "inreach_rate_limit.account1")
+    lease_id = acquire_call.args[-1]
+    # The lease is released by id
+    mock_redis.Redis.return_value.zrem.assert_awaited_once_with("inreach_rate_limit.account1.leases", lease_id)
+
+
+@pytest.mark.asyncio
+async def test_redis_rate_limiter_backend_fails_open(mocker, mock_redis):
+    mock_redis.Redis.return_value.eval = AsyncMock(side_effect=redis.ConnectionError("Connection refused"))
+    mocker.patch("app.actions.inreach_client.rate_limiter.redis.Redis", mock_redis.Redis)
+    rate_limiter = AdaptiveRateLimiter(backend=RedisRateLimiterBackend())
+    call_api = MagicMock()
+
+    async with rate_limiter.limit(key="account1"):
+        call_api()
+
+    call_api.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_inreach_client_reduces_concurrency_on_error_code_2(local_inreach_rate_limiter):
+    async with respx.mock(assert_all_called=True) as mock:
+        mock.post("/IPCInbound/V1/Pingback.svc/PingbackRequest").respond(
+            status_code=httpx.codes.TOO_MANY_REQUESTS,
+            json={"Code": 2, "Description": "", "IMEI": None, "Message": "Too many requests"}
+        )
+
+        async with InReachClient() as client:
+            with pytest.raises(InReachTooManyRequestsError):
+                await client.pingback(username="test_user", password="test_pass")
+
+    key = f"{InReachClient.DEFAULT_API_URL}:test_user"
+    limits = local_inreach_rate_limiter.backend._limits
+    assert limits[key] == local_inreach_rate_limiter.initial_limit * local_inreach_rate_limiter.decrease_factor
@@ -0,0 +1,177 @@
+import datetime
+
+import pytest
+from gundi_core.schemas.v2 import InReachIPCMessage
+
+from ..inreach_client import (
+    IPCMessageValidator,
+    split_message,
+    InReachInvalidMessageError,
+    InReachInvalidTimestampError,
+    InReachInvalidAltitudeError,
+    InReachInvalidPositionError,
+)
+
+
+def _build_reference_point(**kwargs):
+    reference_point = {
+        "Altitude": 1520,
+        "Coordinate": {"Latitude": -51.688645, "Longitude": -72.704421},
+        "Course": 45,
+        "Label": "Gate",
+        "Speed": 12
+    }
+    reference_point.update(kwargs)
+    return reference_point
+
+
+def _build_message(**kwargs):
+    message = {
+        "Message": "Gundi test message.",
+        "Recipients": ["0123456789"],
+        "Sender": "admin@sitex.pamdas.org",
+        "ReferencePoint": _build_reference_point(),
+        "Timestamp": datetime.datetime(2025, 6, 4, 13, 35, 10, tzinfo=datetime.timezone.utc),
+    }
+    message.update(kwargs)
+    return InReachIPCMessage.parse_obj(message)
+
+
+def test_validator_accepts_valid_message():
+    ipc_message = _build_message()
+
+    assert IPCMessageValidator().validate(ipc_message) == ipc_message
+
+
+@pytest.mark.parametrize("text", ["", "x" * 161])
+def test_validator_rejects_invalid_message_length(text):
+    with pytest.raises(InReachInvalidMessageError):
+        IPCMessageValidator().validate(_build_message(Message=text))
+
+
+def test_validator_rejects_timestamp_before_2011():
+    ipc_message = _build_message(Timestamp=datetime.datetime(2010, 12, 31, tzinfo=datetime.timezone.utc))
+
+    with pytest.raises(InReachInvalidTimestampError):
+        IPCMessageValidator().validate(ipc_message)
+
+
+def test_validator_repairs_out_of_range_fields():
+    ipc_message = _build_message(
+        ReferencePoint=_build_reference_point(
+            Altitude=20000,
+            Speed=-5,
+            Coordinate={"Latitude": 10.5, "Longitude": 190.0},
+            Label="x" * 200
+        ),
+        Timestamp=datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=5)
+    )
+
+    repaired_message = IPCMessageValidator(repair=True).validate(ipc_message)
+
+    reference_point = repaired_message.ReferencePoint
+    assert reference_point.Altitude == 18000
+    assert reference_point.Speed == 0
+    assert reference_point.Coordinate.Longitude == -170.0
+    assert len(repaired_message.Message) + len(reference_point.Label) == 160
+    assert repaired_message.Timestamp <= datetime.datetime.now(datetime.timezone.utc)
+    # The original message is left untouched
+    assert ipc_message.ReferencePoint.Altitude == 20000
+
+
+@pytest.mark.parametrize("reference_point,error_class", [
+    (_build_reference_point(Altitude=-1001), InReachInvalidAltitudeError),
+    (_build_reference_point(Coordinate={"Latitude": 10.5, "Longitude": 190.0}), InReachInvalidPositionError),
+])
+def test_validator_rejects_out_of_range_fields_without_repair(reference_point, error_class):
+    with pytest.raises(error_class):
+        IPCMessageValidator(repair=False).validate(_build_message(ReferencePoint=reference_point))
+
+
+def test_validator_counts_rejected_messages(mocker):
+    mock_counter = mocker.MagicMock()
+    mocker.patch("app.actions.inreach_client.validation.rejected_messages_counter", mock_counter)
+
+    with pytest.raises(InReachInvalidMessageError):
+        IPCMessageValidator().validate(_build_message(Message=""))
+
+    mock_counter.add.assert_called_once_with(1, {"field": "Message"})
+
+
+def test_split_message_keeps_short_message():
+    ipc_message = _build_message()
+
+    assert split_message(ipc_message) == [ipc_message]
+
+
+def test_split_message_in_ordered_segments():
+    text = " ".join(f"word{i}" for i in range(100))
+    ipc_message = _build_message(Message=text)
+
+    segments = split_message(ipc_message)
+
+    assert len(segments) == 5
+    assert all(len(segment.Message) <= 160 for segment in segments)
+    assert [segment.Message.split(" ", 1)[0] for segment in segments] == ["(1/5)", "(2/5)", "(3/5)", "(4/5)", "(5/5)"]
+    # Words are kept whole and in order
+    assert " ".join(segment.Message.split(" ", 1)[1] for segment in segments) == text
+    assert [segment.Timestamp for segment in segments] == sorted(segment.Timestamp for segment in segments)
+    assert segments[0].ReferencePoint == ipc_message.ReferencePoint
+    assert all(segment.ReferencePoint is None for segment in segments[1:])
+
+
+def test_split_message_leaves_room_for_the_label():
+    text = " ".join(f"word{i}" for i in range(100))
+    ipc_message = _build_message(Message=text, ReferencePoint=_build_reference_point(Label="North gate camp"))
+    validator = IPCMessageValidator(repair=False)
+
+    segments = [validator.validate(segment) for segment in split_message(ipc_message)]  # None rejected
+
+    assert len(segments[0].Message) + len(segments[0].ReferencePoint.Label) <= 160
+    assert segments[0].ReferencePoint.Label == "North gate camp"
+    assert " ".join(segment.Message.split(" ", 1)[1] for segment in segments) == text
+
+
+@pytest.mark.parametrize("label_length,expected_segments", [(40, 4), (150, 5)])
+def test_split_message_uses_full_width_after_the_first_segment(label_length, expected_segments):
+    ipc_message = _build_message(Message="x" * 500, ReferencePoint=_build_reference_point(Label="L" * label_length))
+
+    segments = split_message(ipc_message)
+
+    assert len(segments) == expected_segments
+    assert len(segments[0].Message) + label_length <= 160
+    # Only the first segment is shortened for the label
+    assert all(len(segment.Message) == 160 for segment in segments[1:-1])
+    assert sum(segment.Message.count("x") for segment in segments) == 500
+
+
+def test_split_message_timestamps_are_not_in_the_future():
+    now = datetime.datetime.now(datetime.timezone.utc)
+    ipc_message = _build_message(Message="x" * 500, Timestamp=now)
+
+    segments = [IPCMessageValidator(repair=False).validate(segment) for segment in split_message(ipc_message)]
+
+    assert [segment.Timestamp for segment in segments] == sorted(set(segment.Timestamp for segment in segments))
+    assert segments[-1].Timestamp == now
+
+
+def test_split_message_keeps_order_of_segments_with_future_timestamp():
+    future = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=5)
+    ipc_message = _build_message(Message="x" * 700, Timestamp=future)
+    validator = IPCMessageValidator(repair=True)
+
+    segments = [validator.validate(segment) for segment in split_message(validator.validate_timestamp(ipc_message))]
+
+    timestamps = [int(segment.Timestamp.timestamp() * 1000) for segment in segments]  # As sent to InReach
+    assert len(segments) == 5
+    assert timestamps == sorted(set(timestamps))  # Distinct and in order
+    assert segments[-1].Timestamp < future
+
+
+def test_split_message_cuts_long_words():
+    segments = split_message(_build_message(Message="x" * 2000, ReferencePoint=None))
+
+    assert len(segments) == 14
+    assert segments[-1].Message.startswith("(14/14) ")
+    assert all(len(segment.Message) <= 160 for segment in segments)
+    assert sum(segment.Message.count("x") for segment in segments) == 2000
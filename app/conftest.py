@@ -36,6 +36,12 @@ from app.actions import (
 )
 from app.services.utils import GlobalUISchemaOptions, FieldWithUIOptions, UIOptions, OptionalStringType
 from app.services.action_scheduler import CrontabSchedule
+from app.services.gundi import IntegrationApiKeyCache, GundiDataSenderPool
+from app.services.outbox import GundiOutbox, LocalOutboxBackend
+from app.services import config_manager
+from app.services.config_manager import IntegrationDetailsCache
+from app.services.activity_logger import PubSubPublisher, ActivityEventQueue, DebugLogsPolicy
+from app.services.caching import TTLCache
 from app.webhooks import (
     GenericJsonTransformConfig,
     GenericJsonPayload,
@@ -81,12 +87,143 @@ def mock_redis(mocker, mock_integration_state):
     return redis
 
 
+@pytest.fixture
+def mock_redis_client_in_memory(mocker):
+    """A redis client mock that keeps set/setex/get/mget/delete values in a dict (also set/setex in pipelines)."""
+    values = {}
+    pipelined = []
+
+    async def set_value(key, value, nx=False, ex=None):
+        if nx and key in values:
+            return None
+        values[key] = value
+        return True
+
+    async def setex_value(key, time, value):
+        values[key] = value
+        return True
+
+    async def get_value(key):
+        return values.get(key)
+
+    async def get_values(keys):
+        return [values.get(key) for key in keys]
+
+    async def publish(channel, message):
+        return 0
+
+    async def delete_value(key):
+        return 1 if values.pop(key, None) is not None else 0
+
+    async def execute_pipeline():
+        values.update(pipelined)
+        results = [True] * len(pipelined)
+        pipelined.clear()
+        return results
+
+    async def acquire_lock(blocking=None):
+        return True
+
+    async def release_lock():
+        return None
+
+    redis_client = mocker.MagicMock()
+    redis_client.set.side_effect = set_value
+    redis_client.setex.side_effect = setex_value
+    redis_client.get.side_effect = get_value
+    redis_client.mget.side_effect = get_values
+    redis_client.publish.side_effect = publish
+    redis_client.delete.side_effect = delete_value
+    redis_client.lock.return_value.acquire.side_effect = acquire_lock
+    redis_client.lock.return_value.release.side_effect = release_lock
+    pipe = mocker.MagicMock()
+    pipe.set.side_effect = lambda key, value, ex=None: pipelined.append((key, value))
+    pipe.setex.side_effect = lambda key, time, value: pipelined.append((key, value))
+    pipe.execute.side_effect = execute_pipeline
+    pipe.__aenter__.return_value = pipe
+    pipe.__aexit__.return_value = False
+    redis_client.pipeline.return_value = pipe
+    redis_client.values = values
+    return redis_client
+
+
+@pytest.fixture(autouse=True)
+def gundi_api_key_cache(mocker):
+    """Start every test without cached API keys."""
+    api_key_cache = IntegrationApiKeyCache()
+    mocker.patch("app.services.gundi.gundi_api_key_cache", api_key_cache)
+    mocker.patch("app.services.config_events_consumer.gundi_api_key_cache", api_key_cache)
+    return api_key_cache
+
+
+@pytest.fixture(autouse=True)
+def integration_details_cache(mocker, mock_redis_client_in_memory):
+    """Start every test without cached integrations, keeping the hooks registered by the actions."""
+    details_cache = IntegrationDetailsCache(invalidation_hooks=config_manager.integration_details_cache.invalidation_hooks)
+    details_cache.db_client = mock_redis_client_in_memory
+    mocker.patch("app.services.config_manager.integration_details_cache", details_cache)
+    mocker.patch("app.services.config_events_consumer.integration_details_cache", details_cache)
+    return details_cache
+
+
+@pytest.fixture(autouse=True)
+def gundi_data_sender_pool(mocker):
+    """Start every test with an empty pool of sensors API clients."""
+    sender_pool = GundiDataSenderPool()
+    mocker.patch("app.services.gundi.gundi_data_sender_pool", sender_pool)
+    return sender_pool
+
+
+@pytest.fixture(autouse=True)
+def gundi_outbox(mocker):
+    """Keep the outbox of data for Gundi in memory while testing."""
+    outbox = GundiOutbox(backend=LocalOutboxBackend())
+    mocker.patch("app.services.outbox.gundi_outbox", outbox)
+    mocker.patch("app.webhooks.handlers.gundi_outbox", outbox)
+    return outbox
+
+
+@pytest.fixture(autouse=True)
+def event_publisher(mocker):
+    """Start every test without buffered PubSub events."""
+    publisher = PubSubPublisher()
+    mocker.patch("app.services.activity_logger.event_publisher", publisher)
+    return publisher
+
+
+@pytest.fixture(autouse=True)
+def activity_event_queue(mocker):
+    """Start every test with an empty queue of activity events."""
+    event_queue = ActivityEventQueue()
+    mocker.patch("app.services.activity_logger.activity_event_queue", event_queue)
+    return event_queue
+
+
+@pytest.fixture(autouse=True)
+def debug_logs_policy(mocker):
+    """Start every test without sampled or coalesced DEBUG logs."""
+    logs_policy = DebugLogsPolicy()
+    mocker.patch("app.services.activity_logger.debug_logs_policy", logs_policy)
+    return logs_policy
+
+
+@pytest.fixture(autouse=True)
+def webhook_failure_events_sent(mocker):
+    """Start every test without rate-limited webhook failure events."""
+    events_sent = TTLCache(ttl=settings.WEBHOOK_FAILURE_EVENTS_INTERVAL)
+    mocker.patch("app.services.webhooks.failure_events_sent", events_sent)
+    return events_sent
+
+
 @pytest.fixture
 def mock_redis_empty(mocker, mock_integration_state):
     redis = MagicMock()
     redis_client = mocker.MagicMock()
     redis_client.set.return_value = async_return(MagicMock())
     redis_client.get.return_value = async_return(None)
+    redis_client.mget.side_effect = lambda keys: async_return([None] * len(keys))
+    redis_client.lock.return_value.acquire.side_effect = lambda **kwargs: async_return(True)
+    redis_client.lock.return_value.release.side_effect = lambda: async_return(None)
     redis_client.delete.return_value = async_return(MagicMock())
     redis_client.setex.return_value = async_return(None)
     redis_client.incr.return_value = redis_client
@@ -3,6 +3,7 @@ import json
 import logging
 import os
 from contextlib import asynccontextmanager
+from functools import partial
 from fastapi import FastAPI, Request, status, BackgroundTasks
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError, HTTPException
@@ -12,7 +13,18 @@ import app.settings as settings
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.services.action_runner import execute_action, _portal
+from app.actions.inreach_client import (
+    InReachClient,
+    inreach_client_pool,
+    inreach_message_batcher,
+    inreach_circuit_breakers,
+)
 from app.services.self_registration import register_integration_in_gundi
+from app.services.gundi import gundi_data_sender_pool
+from app.services.outbox import gundi_outbox
+from app.services.config_manager import integration_details_cache
+from app.services.activity_logger import event_publisher, activity_event_queue, debug_logs_policy
+from app.services.warmup import warm_up_connections
 
 
 # For running behind a proxy, we'll want to configure the root path for OpenAPI browser.
@@ -25,9 +37,28 @@ async def lifespan(app: FastAPI):
     if settings.REGISTER_ON_START:
         await register_integration_in_gundi(gundi_client=_portal)
         # ToDo: set env var to false in GCP after registration
+    if settings.WARMUP_CONNECTIONS_ON_START:
+        await warm_up_connections(
+            gundi_client=_portal,
+            extra_targets={
+                f"InReach API ({api_url})": partial(inreach_client_pool.warm_up, api_url=api_url)
+                for api_url in settings.INREACH_WARMUP_API_URLS or [InReachClient.DEFAULT_API_URL]
+            }
+        )
+    integration_details_cache.start()
+    gundi_outbox.start()
+    event_publisher.start()
     yield
     # Shotdown Hook
+    await gundi_outbox.stop()
+    await integration_details_cache.stop()
     await _portal.close()
+    await inreach_message_batcher.close()
+    await inreach_client_pool.close()
+    await gundi_data_sender_pool.close()
+    await debug_logs_policy.close()
+    await activity_event_queue.close()
+    await event_publisher.close()  # Publish the buffered events
 
 
 app = FastAPI(
@@ -64,6 +95,24 @@ def read_root(
     return {"status": "healthy"}
 
 
+@app.get(
+    "/status/circuit-breakers",
+    tags=["health-check"],
+    summary="Check the state of the circuit breakers protecting the InReach API",
+)
+def read_circuit_breakers():
+    return inreach_circuit_breakers.snapshot()
+
+
+@app.get(
+    "/status/gundi-outbox",
+    tags=["health-check"],
+    summary="Check how much data is waiting to be sent to Gundi",
+)
+async def read_gundi_outbox():
+    return await gundi_outbox.status()
+
+
 @app.post(
     "/",
     summary="Execute an action from GCP PubSub",
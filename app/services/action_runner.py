@@ -110,8 +110,8 @@ async def execute_action(
 
     logger.info(f"Executing action '{action_id}' for integration '{integration_id}'...")
 
-    # Get the configuration needed to execute the action
-    action_config = await config_manager.get_action_configuration(integration_id, action_id)
+    # Get the configuration needed to execute the action, from the integration loaded above
+    action_config = integration.get_action_config(action_id)
     if not action_config and not config_overrides:
         message = f"Configuration for action '{action_id}' for integration {str(integration.id)} is missing."
         logger.error(message)
@@ -122,7 +122,8 @@ async def execute_action(
         )
 
     try:  # Parse the action configuration
-        config_data = action_config.data if action_config else {}
+        # A copy, the integration may be cached and shared with other requests
+        config_data = dict(action_config.data) if action_config else {}
         if config_overrides:
             config_data.update(config_overrides)
         parsed_config = config_model.parse_obj(config_data)
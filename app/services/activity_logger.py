@@ -1,12 +1,20 @@
 import asyncio
+import itertools
 import json
 import logging
+import math
+import time
+from collections import deque
+from http import HTTPStatus
+from typing import List
 
 import aiohttp
 import stamina
 from functools import wraps
 from gcloud.aio import pubsub
+from opentelemetry import metrics
 from gundi_core.events import (
+    LogLevel,
     SystemEventBaseModel,
     IntegrationActionCustomLog,
     CustomActivityLog,
@@ -26,42 +34,446 @@ from gundi_core.events import (
     CustomWebhookLog,
 )
 from app import settings
+from .spool import DiskSpool
 
 
 logger = logging.getLogger(__name__)
 
-
-# Publish events for other services or system components
-@stamina.retry(
-    on=(aiohttp.ClientError, asyncio.TimeoutError),
-    attempts=5,
-    wait_initial=4.0,
-    wait_max=60,
-    wait_jitter=5.0
+meter = metrics.get_meter(__name__)
+dropped_events_counter = meter.create_counter(
+    name="activity_logger.events.dropped",
+    unit="1",
+    description="Activity events dropped because the queue was full, by level.",
 )
-async def publish_event(event: SystemEventBaseModel, topic_name: str):
-    timeout_settings = aiohttp.ClientTimeout(total=20.0)
-    async with aiohttp.ClientSession(
-        raise_for_status=True, timeout=timeout_settings
-    ) as session:
-        client = pubsub.PublisherClient(session=session)
-        # Get the topic
-        topic = client.topic_path(settings.GCP_PROJECT_ID, topic_name)
-        # Prepare the payload
+spooled_events_counter = meter.create_counter(
+    name="activity_logger.events.spooled",
+    unit="1",
+    description="Events saved in the local spool because PubSub was unavailable.",
+)
+delayed_events_counter = meter.create_counter(
+    name="activity_logger.events.delayed",
+    unit="1",
+    description="Activity events that waited for room in the queue, by level.",
+)
+rejected_events_counter = meter.create_counter(
+    name="activity_logger.events.rejected",
+    unit="1",
+    description="Spooled events dropped because PubSub rejected them, by topic.",
+)
+
+
+class PubSubPublisher:
+    """
+    Process-wide PubSub publisher. Events are buffered per topic and published in batches, when a batch is
+    full or a short while after the first event, through one persistent HTTP session.
+    Each event gets a future that resolves with its publish response (or the error, once retries are exhausted).
+    If a spool is configured, events that can't be published are saved on disk instead, and so are the next ones
+    (to keep the order) until a background task replays them all once PubSub is back.
+    Events rejected by PubSub (4xx errors) are never retried nor spooled.
+    """
+    RETRY_ON = (aiohttp.ClientError, asyncio.TimeoutError)
+
+    def __init__(self, **kwargs):
+        self.max_batch_size = kwargs.get("max_batch_size", settings.PUBSUB_PUBLISHER_MAX_BATCH_SIZE)
+        self.max_latency = kwargs.get("max_latency", settings.PUBSUB_PUBLISHER_MAX_LATENCY)
+        self.timeout = kwargs.get("timeout", settings.PUBSUB_PUBLISHER_TIMEOUT)
+        self.spool = kwargs.get("spool", get_event_spool())
+        self.replay_interval = kwargs.get("replay_interval", settings.ACTIVITY_LOGS_SPOOL_REPLAY_INTERVAL)
+        self._replayer = None
+        self._session = None
+        self._client = None
+        self._loop = None
+        self._buffers = {}  # topic_name -> [(PubsubMessage, Future), ...]
+        self._flush_timers = {}  # topic_name -> TimerHandle
+        self._publishing = set()  # Batches being published
+
+    @classmethod
+    def is_retryable(cls, exc: Exception) -> bool:
+        if isinstance(exc, aiohttp.ClientResponseError):  # Rejected requests won't succeed later
+            return exc.status >= 500 or exc.status in (HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.REQUEST_TIMEOUT)
+        return isinstance(exc, cls.RETRY_ON)
+
+    def _get_client(self) -> pubsub.PublisherClient:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._session = aiohttp.ClientSession(
+                raise_for_status=True, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._client = pubsub.PublisherClient(session=self._session)
+            self._loop = loop
+        return self._client
+
+    def publish(self, event: SystemEventBaseModel, topic_name: str) -> asyncio.Future:
+        """
+        Add an event to the batch of its topic. Await the returned future to know that it was published.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
         binary_payload = json.dumps(event.dict(), default=str).encode("utf-8")
-        messages = [pubsub.PubsubMessage(binary_payload)]
-        logger.debug(f"Sending event {event} to PubSub topic {topic_name}..")
-        try:  # Send to pubsub
-            response = await client.publish(topic, messages)
+        buffer = self._buffers.setdefault(topic_name, [])
+        buffer.append((pubsub.PubsubMessage(binary_payload), future))
+        logger.debug(f"Event {event} queued for PubSub topic {topic_name}.")
+        if len(buffer) >= self.max_batch_size:
+            self._flush(topic_name)
+        elif topic_name not in self._flush_timers:
+            self._flush_timers[topic_name] = loop.call_later(self.max_latency, self._flush, topic_name)
+        return future
+
+    def _flush(self, topic_name: str):
+        if timer := self._flush_timers.pop(topic_name, None):
+            timer.cancel()
+        if batch := self._buffers.pop(topic_name, None):
+            task = asyncio.create_task(self._publish_batch(topic_name, batch))
+            self._publishing.add(task)
+            task.add_done_callback(self._publishing.discard)
+
+    async def _send_once(self, topic_name: str, messages: List[pubsub.PubsubMessage]) -> dict:
+        client = self._get_client()
+        topic = client.topic_path(settings.GCP_PROJECT_ID, topic_name)
+        logger.debug(f"Sending {len(messages)} events to PubSub topic {topic_name}..")
+        return await client.publish(topic, messages)
+
+    async def _send(self, topic_name: str, messages: List[pubsub.PubsubMessage]) -> dict:
+        async for attempt in stamina.retry_context(
+            on=self.RETRY_ON, attempts=5, wait_initial=4.0, wait_max=60, wait_jitter=5.0
+        ):
+            with attempt:
+                try:
+                    return await self._send_once(topic_name, messages)
+                except Exception as e:
+                    if self.is_retryable(e):
+                        logger.exception(
+                            f"Error publishing {len(messages)} system events to topic {topic_name}: {e}. This will be retried."
+                        )
+                        raise e
+                    error = e
+            raise error  # Outside the attempt, so it isn't retried
+
+    def _spool_batch(self, topic_name: str, batch: list):
+        records = [f"{topic_name}\0".encode("utf-8") + message.data for message, _ in batch]
+        written = self.spool.append(records)
+        spooled_events_counter.add(written, {"topic": topic_name})
+        for i, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if i < written:
+                future.set_result({"messageIds": [], "spooled": True})
+            else:
+                future.set_exception(IOError("Event couldn't be published nor spooled (the spool is full)"))
+        if not self._replayer or self._replayer.done():  # PubSub just failed, give it some time
+            self._replayer = asyncio.create_task(self._replay(delay=self.replay_interval))
+
+    async def _replay(self, delay: float = 0):
+        """
+        Publish the spooled events in order, waiting replay_interval seconds after each failure.
+        """
+        await asyncio.sleep(delay)
+        logger.info(f"Replaying spooled events from {self.spool.directory}..")
+        while not self.spool.is_empty():
+            if not (records := self.spool.read(limit=self.max_batch_size)):  # E.g. a corrupt tail was skipped
+                if not self.spool.is_empty():  # Nothing readable yet, don't spin
+                    await asyncio.sleep(self.replay_interval)
+                continue
+            try:
+                while records:  # Consecutive events of the same topic go together
+                    topic_name = records[0][0].split(b"\0", 1)[0]
+                    group = list(itertools.takewhile(lambda r: r[0].startswith(topic_name + b"\0"), records))
+                    try:
+                        await self._send_once(
+                            topic_name.decode("utf-8"),
+                            [pubsub.PubsubMessage(payload.split(b"\0", 1)[1]) for payload, _ in group]
+                        )
+                    except self.RETRY_ON as e:
+                        if self.is_retryable(e):
+                            raise
+                        # Don't hold the events that follow behind the ones that will never be accepted
+                        logger.error(
+                            f"PubSub rejected {len(group)} spooled events for topic {topic_name.decode('utf-8')}, "
+                            f"dropping them: {type(e).__name__}: {e}"
+                        )
+                        rejected_events_counter.add(len(group), {"topic": topic_name.decode("utf-8")})
+                    self.spool.commit(group[-1][1])
+                    records = records[len(group):]
+            except self.RETRY_ON as e:
+                logger.warning(f"PubSub is still unavailable: {type(e).__name__}: {e}. Retrying in {self.replay_interval}s.")
+                await asyncio.sleep(self.replay_interval)
+        logger.info("All the spooled events were published.")
+
+    async def _publish_batch(self, topic_name: str, batch: list):
+        if self.spool is not None and not self.spool.is_empty():  # PubSub is (or was just) unavailable, keep the order
+            self._spool_batch(topic_name, batch)
+            return
+        # With a spool there's no need to retry inline, the replayer will do it without holding the callers
+        send = self._send_once if self.spool is not None else self._send
+        try:
+            response = await send(topic_name, [message for message, _ in batch])
+        except self.RETRY_ON as e:
+            if self.spool is None or not self.is_retryable(e):
+                self._fail_batch(batch, e)
+                return
+            logger.warning(f"Saving {len(batch)} events for topic {topic_name} in the spool: {type(e).__name__}: {e}")
+            self._spool_batch(topic_name, batch)
         except Exception as e:
-            logger.exception(
-                f"Error publishing system event to topic {topic_name}: {e}. This will be retried."
-            )
-            raise e
+            self._fail_batch(batch, e)
         else:
-            logger.debug(f"System event {event} published successfully.")
-            logger.debug(f"GCP PubSub response: {response}")
-            return response
+            logger.debug(f"{len(batch)} system events published successfully. GCP PubSub response: {response}")
+            message_ids = (response or {}).get("messageIds", [])
+            for i, (_, future) in enumerate(batch):
+                if not future.done():  # The caller may have given up waiting
+                    future.set_result({"messageIds": message_ids[i:i + 1]})
+
+    @staticmethod
+    def _fail_batch(batch: list, error: Exception):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def start(self):
+        """
+        Replay the events left in the spool by a previous run, if any.
+        """
+        if self.spool is not None and not self.spool.is_empty() and (not self._replayer or self._replayer.done()):
+            self._replayer = asyncio.create_task(self._replay())
+
+    async def flush(self):
+        """
+        Publish all the buffered events now, and wait for the batches in progress.
+        """
+        for topic_name in list(self._buffers):
+            self._flush(topic_name)
+        if self._publishing:
+            await asyncio.gather(*self._publishing, return_exceptions=True)
+
+    async def close(self):
+        await self.flush()
+        if self._replayer:  # The spooled events are replayed on the next start
+            self._replayer.cancel()
+            await asyncio.gather(self._replayer, return_exceptions=True)
+            self._replayer = None
+        if self.spool is not None:
+            self.spool.close()
+        session, self._session, self._client = self._session, None, None
+        if session and not session.closed:
+            await session.close()
+
+
+def get_event_spool():
+    if settings.ACTIVITY_LOGS_SPOOL_DIR:
+        return DiskSpool(directory=settings.ACTIVITY_LOGS_SPOOL_DIR)
+    return None
+
+
+event_publisher = PubSubPublisher()
+
+
+# Publish events for other services or system components
+async def publish_event(event: SystemEventBaseModel, topic_name: str):
+    return await event_publisher.publish(event=event, topic_name=topic_name)
+
+
+def get_event_level(event: SystemEventBaseModel) -> LogLevel:
+    if (level := getattr(event.payload, "level", None)) is not None:  # Custom logs
+        return LogLevel(level)
+    return LogLevel.ERROR if type(event).__name__.endswith("Failed") else LogLevel.INFO
+
+
+class ActivityEventQueue:
+    """
+    Bounded in-process queue of activity events, published by background workers so that actions and
+    webhooks don't wait for PubSub. When the queue is full, DEBUG events are dropped first (queued ones
+    make room for more important events), other events are dropped, and ERROR events wait for room.
+    """
+
+    def __init__(self, **kwargs):
+        self.maxsize = kwargs.get("maxsize", settings.ACTIVITY_LOGS_QUEUE_SIZE)
+        self.workers = kwargs.get("workers", settings.ACTIVITY_LOGS_WORKERS)
+        self.batch_size = kwargs.get("batch_size", settings.PUBSUB_PUBLISHER_MAX_BATCH_SIZE)
+        self._items = deque()  # (level, event, topic_name)
+        self._busy = 0  # Events being published
+        self._condition = asyncio.Condition()
+        self._tasks = []
+
+    def __len__(self):
+        return len(self._items)
+
+    def _is_full(self) -> bool:
+        return len(self._items) >= self.maxsize
+
+    def _make_room(self, level: LogLevel) -> bool:
+        if level <= LogLevel.DEBUG:
+            return False
+        for item in self._items:  # Oldest first
+            if item[0] <= LogLevel.DEBUG:
+                self._items.remove(item)
+                dropped_events_counter.add(1, {"level": item[0].name})
+                return True
+        return False
+
+    async def put(self, event: SystemEventBaseModel, topic_name: str):
+        level = get_event_level(event)
+        async with self._condition:
+            if self._is_full() and not self._make_room(level):
+                if level < LogLevel.ERROR:
+                    dropped_events_counter.add(1, {"level": level.name})
+                    logger.warning(f"Activity events queue is full. Dropped {level.name} event {type(event).__name__}.")
+                    return
+                delayed_events_counter.add(1, {"level": level.name})
+                await self._condition.wait_for(lambda: not self._is_full())
+            self._items.append((level, event, topic_name))
+            self._condition.notify_all()
+        self.start()
+
+    async def _publish(self, batch: list):
+        results = await asyncio.gather(
+            *[publish_event(event=event, topic_name=topic_name) for _, event, topic_name in batch],
+            return_exceptions=True
+        )
+        for (_, event, topic_name), result in zip(batch, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error publishing {type(event).__name__} to topic {topic_name}: {type(result).__name__}: {result}")
+
+    async def _run(self):
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(lambda: self._items)
+                batch = [self._items.popleft() for _ in range(min(self.batch_size, len(self._items)))]
+                self._busy += len(batch)
+                self._condition.notify_all()
+            try:
+                await self._publish(batch)
+            finally:
+                async with self._condition:
+                    self._busy -= len(batch)
+                    self._condition.notify_all()
+
+    def start(self):
+        self._tasks = [task for task in self._tasks if not task.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._run()))
+
+    async def close(self, timeout: float = None):
+        """
+        Wait (up to timeout seconds) for the queued events to be published, and stop the workers.
+        """
+        timeout = timeout if timeout is not None else settings.ACTIVITY_LOGS_SHUTDOWN_TIMEOUT
+        if self._tasks:
+            try:
+                async with self._condition:
+                    await asyncio.wait_for(
+                        self._condition.wait_for(lambda: not self._items and not self._busy), timeout=timeout
+                    )
+            except asyncio.TimeoutError:
+                logger.warning(f"{len(self._items) + self._busy} activity events couldn't be published before shutdown.")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+activity_event_queue = ActivityEventQueue()
+
+
+class DebugLogsPolicy:
+    """
+    Reduces the volume of DEBUG activity logs, per integration and action (or webhook). With "sample", one of
+    every 1/sample_rate logs is published. With "coalesce", a summary of the logs is published once per window.
+    Logs of other levels are always published individually.
+    """
+    ALL = "all"
+    SAMPLE = "sample"
+    COALESCE = "coalesce"
+
+    def __init__(self, **kwargs):
+        self.mode = kwargs.get("mode", settings.ACTIVITY_LOGS_DEBUG_POLICY)
+        self.sample_rate = kwargs.get("sample_rate", settings.ACTIVITY_LOGS_DEBUG_SAMPLE_RATE)
+        self.window = kwargs.get("window", settings.ACTIVITY_LOGS_DEBUG_COALESCE_WINDOW)
+        if self.mode not in (self.ALL, self.SAMPLE, self.COALESCE):
+            raise ValueError(f"Unknown DEBUG logs policy '{self.mode}'. Use 'all', 'sample' or 'coalesce'.")
+        self._seen = {}  # key -> DEBUG logs seen, when sampling
+        self._windows = {}  # key -> logs coalesced in the current window
+        self._flushing = set()  # Summaries being published
+
+    @staticmethod
+    def _get_key(event: SystemEventBaseModel) -> tuple:
+        payload = event.payload
+        return str(payload.integration_id), getattr(payload, "action_id", None) or getattr(payload, "webhook_id", None)
+
+    def accept(self, event: SystemEventBaseModel, topic_name: str) -> bool:
+        """
+        Returns True if the event must be published now.
+        """
+        if self.mode == self.ALL or get_event_level(event) > LogLevel.DEBUG:
+            return True
+        key = self._get_key(event)
+        if self.mode == self.SAMPLE:
+            seen = self._seen.get(key, 0)
+            self._seen[key] = seen + 1
+            return math.floor(seen * self.sample_rate) != math.floor((seen - 1) * self.sample_rate)
+        if not (window := self._windows.get(key)):
+            window = self._windows[key] = {
+                "count": 0,
+                "first_event": event,
+                "topic_name": topic_name,
+                "started_at": time.monotonic(),
+                "timer": asyncio.get_running_loop().call_later(self.window, self._flush, key),
+            }
+        window["count"] += 1
+        window["last_event"] = event
+        return False
+
+    @staticmethod
+    def _summarize(window: dict) -> SystemEventBaseModel:
+        first_event, last_event = window["first_event"], window["last_event"]
+        if window["count"] == 1:
+            return last_event
+        elapsed = time.monotonic() - window["started_at"]
+        payload = last_event.payload.copy(
+            update={
+                "title": f"{window['count']} DEBUG logs in the last {elapsed:.0f}s. Last one: {last_event.payload.title}",
+                "data": {
+                    "coalesced_logs": window["count"],
+                    "first_title": first_event.payload.title,
+                    "last_data": last_event.payload.data,
+                },
+            }
+        )
+        return type(last_event)(payload=payload)
+
+    def _flush(self, key: tuple):
+        if window := self._windows.pop(key, None):
+            window["timer"].cancel()
+            task = asyncio.create_task(_dispatch_event(self._summarize(window), window["topic_name"]))
+            self._flushing.add(task)
+            task.add_done_callback(self._flushing.discard)
+
+    async def close(self):
+        """
+        Publish the summaries of the current windows now.
+        """
+        for key in list(self._windows):
+            self._flush(key)
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+
+debug_logs_policy = DebugLogsPolicy()
+
+
+async def _dispatch_event(event: SystemEventBaseModel, topic_name: str):
+    if settings.ACTIVITY_LOGS_IN_BACKGROUND:
+        await activity_event_queue.put(event=event, topic_name=topic_name)
+    else:
+        await publish_event(event=event, topic_name=topic_name)
+
+
+async def log_event(event: SystemEventBaseModel, topic_name: str = None):
+    """
+    Publish an activity event, or queue it for the background workers if ACTIVITY_LOGS_IN_BACKGROUND is enabled.
+    DEBUG logs may be sampled or coalesced (see DebugLogsPolicy).
+    """
+    topic_name = topic_name or settings.INTEGRATION_EVENTS_TOPIC
+    if debug_logs_policy.accept(event=event, topic_name=topic_name):
+        await _dispatch_event(event=event, topic_name=topic_name)
 
 
 async def log_activity(integration_id: str, action_id: str, title: str, level="INFO", config_data: dict = None, data: dict = None):
@@ -81,7 +493,7 @@ async def log_action_activity(integration_id: str, action_id: str, title: str, l
         :return: None
         """
     logger.debug(f"Logging custom activity: {title}. Integration: {integration_id}. Action: {action_id}.")
-    await publish_event(
+    await log_event(
         event=IntegrationActionCustomLog(
             payload=CustomActivityLog(
                 integration_id=integration_id,
@@ -109,7 +521,7 @@ async def log_webhook_activity(
         :return: None
         """
     logger.debug(f"Logging custom activity: {title}. Integration: {integration_id}. Webhook: {webhook_id}.")
-    await publish_event(
+    await log_event(
         event=IntegrationWebhookCustomLog(
             payload=CustomWebhookLog(
                 integration_id=integration_id,
@@ -134,7 +546,7 @@ def activity_logger(on_start=True, on_completion=True, on_error=True):
             action_config = kwargs.get("action_config")
             config_data = action_config.dict() if action_config else {} or {}
             if on_start:
-                await publish_event(
+                await log_event(
                     event=IntegrationActionStarted(
                         payload=ActionExecutionStarted(
                             integration_id=integration_id,
@@ -148,7 +560,7 @@ def activity_logger(on_start=True, on_completion=True, on_error=True):
                 result = await func(*args, **kwargs)
             except Exception as e:
                 if on_error:
-                    await publish_event(
+                    await log_event(
                         event=IntegrationActionFailed(
                             payload=ActionExecutionFailed(
                                 integration_id=integration_id,
@@ -162,7 +574,7 @@ def activity_logger(on_start=True, on_completion=True, on_error=True):
                 raise e
             else:
                 if on_completion:
-                    await publish_event(
+                    await log_event(
                         event=IntegrationActionComplete(
                             payload=ActionExecutionComplete(
                                 integration_id=integration_id,
@@ -188,7 +600,7 @@ def webhook_activity_logger(on_start=True, on_completion=True, on_error=True):
             config_data = webhook_config.dict() if webhook_config else {} or {}
             webhook_id = str(integration.webhook_configuration.webhook.value) if integration and integration.webhook_configuration else "webhook"
             if on_start:
-                await publish_event(
+                await log_event(
                     event=IntegrationWebhookStarted(
                         payload=WebhookExecutionStarted(
                             integration_id=integration_id,
@@ -202,7 +614,7 @@ def webhook_activity_logger(on_start=True, on_completion=True, on_error=True):
                 result = await func(*args, **kwargs)
             except Exception as e:
                 if on_error:
-                    await publish_event(
+                    await log_event(
                         event=IntegrationWebhookFailed(
                             payload=WebhookExecutionFailed(
                                 integration_id=integration_id,
@@ -216,7 +628,7 @@ def webhook_activity_logger(on_start=True, on_completion=True, on_error=True):
                 raise e
             else:
                 if on_completion:
-                    await publish_event(
+                    await log_event(
                         event=IntegrationWebhookComplete(
                             payload=WebhookExecutionComplete(
                                 integration_id=integration_id,
@@ -10,8 +10,8 @@ from gundi_core.events import (
     ActionConfigDeleted
 )
 
-
-from .config_manager import IntegrationConfigurationManager
+from .config_manager import IntegrationConfigurationManager, integration_details_cache
+from .gundi import gundi_api_key_cache
 
 
 logger = logging.getLogger(__name__)
@@ -20,6 +20,7 @@ config_manager = IntegrationConfigurationManager()
 
 async def handle_integration_created_event(event: IntegrationCreated):
     await config_manager.set_integration(integration=event.payload)
+    await integration_details_cache.invalidate(integration_id=event.payload.id)
 
 
 async def handle_integration_updated_event(event: IntegrationUpdated):
@@ -29,10 +30,15 @@ async def handle_integration_updated_event(event: IntegrationUpdated):
         if hasattr(integration, key):
             setattr(integration, key, value)
     await config_manager.set_integration(integration=integration)
+    await integration_details_cache.invalidate(integration_id=event_data.id)
+    # The API key may have been rotated
+    gundi_api_key_cache.invalidate(integration_id=event_data.id)
 
 
 async def handle_integration_deleted_event(event: IntegrationDeleted):
     await config_manager.delete_integration(integration_id=event.payload.id)
+    await integration_details_cache.invalidate(integration_id=event.payload.id)
+    gundi_api_key_cache.invalidate(integration_id=event.payload.id)
 
 
 async def handle_action_config_created_event(event: ActionConfigCreated):
@@ -42,6 +48,7 @@ async def handle_action_config_created_event(event: ActionConfigCreated):
         action_id=action_config.action.value,
         config=action_config
     )
+    await integration_details_cache.invalidate(integration_id=action_config.integration)
 
 
 async def handle_action_config_updated_event(event: ActionConfigUpdated):
@@ -59,6 +66,7 @@ async def handle_action_config_updated_event(event: ActionConfigUpdated):
         action_id=action_id,
         config=action_config
     )
+    await integration_details_cache.invalidate(integration_id=integration_id)
 
 
 async def handle_action_config_deleted_event(event: ActionConfigDeleted):
@@ -69,6 +77,7 @@ async def handle_action_config_deleted_event(event: ActionConfigDeleted):
         integration_id=integration_id,
         action_id=action_id
     )
+    await integration_details_cache.invalidate(integration_id=integration_id)
 
 
 event_handlers = {
@@ -1,10 +1,143 @@
+import asyncio
 import json
+import logging
+import time
+from typing import Any, Callable, Optional, Tuple
+
 import stamina
 import httpx
 import redis.asyncio as redis
+from redis.exceptions import LockError
 from gundi_core.schemas.v2 import Integration, IntegrationSummary, IntegrationActionConfiguration, WebhookConfiguration
 from gundi_client_v2 import GundiClient
 from app import settings
+from .caching import TTLCache
+from .errors import IntegrationNotFound
+
+
+logger = logging.getLogger(__name__)
+
+
+class IntegrationDetailsCache:
+    """
+    Process-wide cache of parsed integrations (with their configurations) in front of Redis. Entries are
+    dropped when configuration events are processed, in this replica and in the others (through a Redis
+    pub/sub channel), and expire after a while in case an invalidation is missed. Cached objects are shared,
+    so they must not be modified.
+    Integrations read with a ttl (e.g. webhook configurations, which have no configuration events) are kept
+    with the time until which they are fresh, and only returned to callers with a ttl until then
+    (callers that accept stale data check the freshness with get_entry()).
+    Other caches derived from integration configurations can be dropped along with it with invalidation hooks.
+    """
+
+    def __init__(self, **kwargs):
+        host = kwargs.get("host", settings.REDIS_HOST)
+        port = kwargs.get("port", settings.REDIS_PORT)
+        db = kwargs.get("db", settings.REDIS_CONFIGS_DB)
+        self.db_client = redis.Redis(host=host, port=port, db=db)
+        self.channel = kwargs.get("channel", settings.CONFIG_INVALIDATION_CHANNEL)
+        self.retry_interval = kwargs.get("retry_interval", settings.CONFIG_INVALIDATION_RETRY_INTERVAL)
+        self._cache = TTLCache(
+            maxsize=kwargs.get("maxsize", settings.CONFIG_LOCAL_CACHE_MAX_SIZE),
+            ttl=kwargs.get("ttl", settings.CONFIG_LOCAL_CACHE_TTL),
+        )
+        self.generation = 0  # Incremented on every invalidation
+        self.invalidation_hooks = list(kwargs.get("invalidation_hooks", []))
+        self._listener = None
+
+    def get_entry(self, integration_id: str) -> Tuple[Optional[Integration], Optional[float]]:
+        """
+        Get a cached integration and the time until which it's fresh (None if it was read without a ttl).
+        """
+        return self._cache.get(str(integration_id), (None, None))
+
+    def get(self, integration_id: str, ttl=None) -> Optional[Integration]:
+        """
+        Get a cached integration. With a ttl, only if it's known to be fresh.
+        """
+        integration, fresh_until = self.get_entry(integration_id)
+        if ttl and (fresh_until is None or fresh_until <= time.time()):
+            return None
+        return integration
+
+    def set(self, integration: Integration, generation: int, fresh_until: Optional[float] = None, max_stale=None):
+        """
+        Cache an integration read when the cache was at the given generation. It's discarded if an
+        invalidation happened since, because it may be outdated.
+        :param fresh_until: Time (epoch) until which it's fresh. It's not kept past it (plus max_stale seconds).
+        """
+        if generation != self.generation:
+            return
+        ttl = None
+        if fresh_until is not None:
+            if (ttl := fresh_until + (max_stale or 0) - time.time()) <= 0:  # The entry cached before is older
+                self._cache.pop(str(integration.id))
+                return
+            ttl = min(ttl, self._cache.ttl)
+        self._cache.set(str(integration.id), (integration, fresh_until), ttl=ttl)
+
+    def add_invalidation_hook(self, hook: Callable[[Optional[str]], Any]):
+        """
+        Register a function called with the id of every integration invalidated, in this replica or in others
+        (or with None when any of them may have changed).
+        """
+        self.invalidation_hooks.append(hook)
+
+    def _run_invalidation_hooks(self, integration_id: Optional[str]):
+        for hook in self.invalidation_hooks:
+            try:
+                hook(integration_id)
+            except Exception as e:
+                logger.warning(f"Error in invalidation hook for integration {integration_id}: {type(e).__name__}: {e}")
+
+    def _drop(self, integration_id: str):
+        self.generation += 1
+        self._cache.pop(str(integration_id))
+        self._run_invalidation_hooks(str(integration_id))
+
+    async def invalidate(self, integration_id: str):
+        self._drop(integration_id)
+        try:  # Let the other replicas know
+            await self.db_client.publish(self.channel, str(integration_id))
+        except redis.RedisError as e:
+            logger.warning(f"Error publishing invalidation of integration {integration_id}: {type(e).__name__}: {e}")
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self.db_client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    self.generation += 1
+                    self._cache.clear()  # Invalidations may have been missed while disconnected
+                    self._run_invalidation_hooks(None)
+                    async for message in pubsub.listen():
+                        if message.get("type") == "message":
+                            data = message["data"]
+                            self._drop(data.decode("utf-8") if isinstance(data, bytes) else data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(
+                    f"Error listening for config invalidations: {type(e).__name__}: {e}. Retrying in {self.retry_interval}s."
+                )
+                await asyncio.sleep(self.retry_interval)
+
+    def start(self):
+        if not self._listener or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    def clear(self):
+        self.generation += 1
+        self._cache.clear()
+
+
+integration_details_cache = IntegrationDetailsCache()
 
 
 class IntegrationConfigurationManager:
@@ -15,6 +148,14 @@ class IntegrationConfigurationManager:
         port = kwargs.get("port", settings.REDIS_PORT)
         db = kwargs.get("db", settings.REDIS_CONFIGS_DB)
         self.db_client = redis.Redis(host=host, port=port, db=db)
+        # Action types seen so far, their configurations are read along with the integration
+        self._known_action_ids = set()
+        self.reload_lock_timeout = kwargs.get("reload_lock_timeout", settings.CONFIG_RELOAD_LOCK_TIMEOUT)
+        self.reload_lock_wait = kwargs.get("reload_lock_wait", settings.CONFIG_RELOAD_LOCK_WAIT)
+        self.reload_result_ttl = kwargs.get("reload_result_ttl", settings.CONFIG_RELOAD_RESULT_TTL)
+        self.missing_integration_ttl = kwargs.get("missing_integration_ttl", settings.CONFIG_MISSING_INTEGRATION_TTL)
+        self._reloading = {}  # integration_id -> Task
+        self._refreshes = set()  # Background refreshes of stale integrations
 
     def _get_integration_key(self, integration_id: str) -> str:
         return f"integration.{integration_id}"
@@ -25,23 +166,105 @@ class IntegrationConfigurationManager:
     def _get_webhook_config_key(self, integration_id: str) -> str:
         return f"integrationconfig.{integration_id}.webhook"
 
-    async def _reload_integration_from_gundi(self, integration_id: str, ttl=None) -> Integration:
+    def _get_reload_lock_key(self, integration_id: str) -> str:
+        return f"integration_reload_lock.{integration_id}"
+
+    def _get_reloaded_integration_key(self, integration_id: str) -> str:
+        return f"integration_reloaded.{integration_id}"
+
+    def _get_fresh_marker_key(self, integration_id: str) -> str:
+        return f"integration_fresh.{integration_id}"
+
+    def _get_missing_marker_key(self, integration_id: str) -> str:
+        return f"integration_missing.{integration_id}"
+
+    async def _reload_integration_from_gundi(self, integration_id: str, ttl=None, max_stale=None) -> Integration:
+        """
+        Reload the integration from Gundi into Redis. Concurrent reloads of the same integration share a single
+        request to Gundi, in this instance and (through a Redis lock) across replicas.
+        """
+        integration_id = str(integration_id)
+        if not (task := self._reloading.get(integration_id)):
+            task = asyncio.create_task(self._reload_integration_once(integration_id, ttl, max_stale))
+            self._reloading[integration_id] = task
+            task.add_done_callback(lambda t: self._reloading.pop(integration_id, None))
+        return await asyncio.shield(task)
+
+    async def _reload_integration_once(self, integration_id: str, ttl=None, max_stale=None) -> Integration:
+        lock = self.db_client.lock(
+            self._get_reload_lock_key(integration_id),
+            timeout=self.reload_lock_timeout,
+            blocking_timeout=self.reload_lock_wait
+        )
+        reloaded_key = self._get_reloaded_integration_key(integration_id)
+        waited = False
+        try:
+            if not (locked := await lock.acquire(blocking=False)):
+                # Another replica is reloading it, wait for it to finish and reuse the result
+                waited = True
+                locked = await lock.acquire()
+        except redis.RedisError as e:
+            logger.warning(f"Error locking reload of integration {integration_id}: {type(e).__name__}: {e}")
+            locked = False
+        if not locked:
+            logger.warning(f"Reloading integration {integration_id} without a lock.")
+        try:
+            if waited:
+                try:
+                    if reloaded_data := await self.db_client.get(reloaded_key):
+                        logger.debug(f"Integration {integration_id} was reloaded by another replica.")
+                        return Integration.parse_raw(reloaded_data)
+                except redis.RedisError as e:
+                    logger.warning(f"Error reading reloaded integration {integration_id}: {type(e).__name__}: {e}")
+            integration_details = await self._fetch_integration_from_gundi(integration_id, ttl, max_stale)
+            try:
+                await self.db_client.setex(reloaded_key, self.reload_result_ttl, integration_details.json())
+            except redis.RedisError as e:
+                logger.warning(f"Error saving reloaded integration {integration_id}: {type(e).__name__}: {e}")
+            return integration_details
+        finally:
+            if locked:
+                try:
+                    await lock.release()
+                except (LockError, redis.RedisError) as e:  # E.g. it expired during a slow reload
+                    logger.warning(f"Error releasing reload lock of integration {integration_id}: {type(e).__name__}: {e}")
+
+    async def _fetch_integration_from_gundi(self, integration_id: str, ttl=None, max_stale=None) -> Integration:
         key = self._get_integration_key(integration_id)
-        async with GundiClient() as gundi:
-            async for attempt in stamina.retry_context(on=httpx.HTTPError, wait_initial=1.0, wait_jitter=5.0,  wait_max=32.0):
-                with attempt:
-                    integration_details = await gundi.get_integration_details(integration_id)
-            integration = IntegrationSummary.from_integration(integration_details)
-            await self.db_client.set(key, integration.json(), ttl)
+        try:
+            async with GundiClient() as gundi:
+                async for attempt in stamina.retry_context(on=httpx.HTTPError, wait_initial=1.0, wait_jitter=5.0,  wait_max=32.0):
+                    with attempt:
+                        try:
+                            integration_details = await gundi.get_integration_details(integration_id)
+                        except httpx.HTTPStatusError as e:
+                            if e.response.status_code != httpx.codes.NOT_FOUND:
+                                raise
+                            raise IntegrationNotFound(f"Integration {integration_id} not found in Gundi.") from e  # Not retried
+        except IntegrationNotFound:
+            try:  # Remember it for a while, so we don't ask again on every request
+                await self.db_client.setex(self._get_missing_marker_key(integration_id), self.missing_integration_ttl, 1)
+            except redis.RedisError as e:
+                logger.warning(f"Error saving missing integration {integration_id}: {type(e).__name__}: {e}")
+            raise
+        integration = IntegrationSummary.from_integration(integration_details)
+        # Write everything in one transaction, so readers never see a half-written integration
+        async with self.db_client.pipeline(transaction=True) as pipe:
+            if ttl:
+                # The marker tells until when it's fresh. With max_stale, the data is kept for a while longer.
+                pipe.setex(self._get_fresh_marker_key(integration_id), ttl, time.time() + ttl)
+                ttl += max_stale or 0
+            pipe.set(key, integration.json(), ttl)
             # Save configurations for individual actions
             for config in integration_details.configurations:
                 config_key = self._get_action_config_key(integration_id, config.action.value)
-                await self.db_client.set(config_key, config.json(), ttl)
+                pipe.set(config_key, config.json(), ttl)
             # Save webhook configuration if present
             if webhook_configuration := integration_details.webhook_configuration:
                 webhook_key = self._get_webhook_config_key(integration_id)
-                await self.db_client.set(webhook_key, webhook_configuration.json(), ttl)
-            return integration_details
+                pipe.set(webhook_key, webhook_configuration.json(), ttl)
+            await pipe.execute()
+        return integration_details
 
     async def get_action_configuration(self, integration_id: str, action_id: str, ttl=None) -> IntegrationActionConfiguration:
         key = self._get_action_config_key(integration_id, action_id)
@@ -102,15 +325,77 @@ class IntegrationConfigurationManager:
             with attempt:
                 await self.db_client.delete(key)
 
-    async def get_integration_details(self, integration_id: str, ttl=None) -> Integration:
-        integration_summary = await self.get_integration(integration_id, ttl)
-        configurations = []
-        for action in integration_summary.type.actions:
-            config = await self.get_action_configuration(integration_id, action.value, ttl)
-            if config:
-                configurations.append(config)
-        webhook_configuration = await self.get_webhook_configuration(integration_id, ttl)
-        return Integration(
+    async def _get_many(self, keys: list) -> list:
+        for attempt in stamina.retry_context(on=redis.RedisError, attempts=5, wait_initial=1.0, wait_max=30, wait_jitter=3.0):
+            with attempt:
+                return await self.db_client.mget(keys)
+
+    async def get_integration_details(self, integration_id: str, ttl=None, max_stale=None) -> Integration:
+        """
+        Get the integration and its configurations from the local cache, or from Redis with a single MGET
+        (reading the configurations of the known action types along with the integration).
+        Only missing configurations are reloaded from Gundi. Raises IntegrationNotFound for integrations that
+        Gundi reported as missing (remembered for a while, without asking Gundi again).
+        :param ttl: Seconds to keep the data reloaded from Gundi in Redis (None = never expire)
+        :param max_stale: With a ttl, data older than ttl (and up to ttl + max_stale) is still returned right away,
+        while it's refreshed in the background (stale-while-revalidate)
+        """
+        integration_id = str(integration_id)
+        integration, fresh_until = integration_details_cache.get_entry(integration_id)
+        if integration and (not ttl or (fresh_until and time.time() < fresh_until)):
+            return integration
+        if integration and max_stale and fresh_until and time.time() < fresh_until + max_stale:
+            self._refresh_in_background(integration_id, ttl, max_stale)
+            return integration
+        generation = integration_details_cache.generation
+        integration, fresh_until = await self._get_integration_details(integration_id, ttl, max_stale)
+        integration_details_cache.set(integration, generation=generation, fresh_until=fresh_until, max_stale=max_stale)
+        return integration
+
+    async def _get_integration_details(self, integration_id: str, ttl=None, max_stale=None) -> Tuple[Integration, Optional[float]]:
+        """
+        Returns the integration and the time until which it's fresh (None without a ttl, 0 if it isn't fresh).
+        """
+        known_action_ids = sorted(self._known_action_ids)
+        keys = [self._get_integration_key(integration_id), self._get_webhook_config_key(integration_id)]
+        keys += [self._get_action_config_key(integration_id, action_id) for action_id in known_action_ids]
+        if ttl:
+            keys.append(self._get_fresh_marker_key(integration_id))
+        values = await self._get_many(keys)
+        fresh_until = None
+        if ttl:
+            fresh_until = float(values.pop() or 0)
+        integration_data, webhook_data = values[0], values[1]
+        if not integration_data:  # If not found in cache, reload everything from Gundi
+            if await self.db_client.get(self._get_missing_marker_key(integration_id)):
+                raise IntegrationNotFound(f"Integration {integration_id} not found in Gundi recently.")
+            integration = await self._reload_integration_from_gundi(integration_id, ttl, max_stale)
+            return integration, (time.time() + ttl if ttl else None)
+        if max_stale and fresh_until is not None and fresh_until <= time.time():
+            self._refresh_in_background(integration_id, ttl, max_stale)
+        integration_summary = IntegrationSummary.parse_raw(integration_data)
+        action_ids = [action.value for action in integration_summary.type.actions]
+        self._known_action_ids.update(action_ids)
+        action_configs = dict(zip(known_action_ids, values[2:]))
+        if unknown_action_ids := [action_id for action_id in action_ids if action_id not in action_configs]:
+            action_configs.update(zip(unknown_action_ids, await self._get_many(
+                [self._get_action_config_key(integration_id, action_id) for action_id in unknown_action_ids]
+            )))
+        configs_by_action = {
+            action_id: IntegrationActionConfiguration.parse_raw(action_configs[action_id]) if action_configs[action_id] else None
+            for action_id in action_ids
+        }
+        webhook_configuration = WebhookConfiguration.parse_raw(webhook_data) if webhook_data else None
+        missing_action_ids = [action_id for action_id, config in configs_by_action.items() if not config]
+        if missing_action_ids or not webhook_configuration:
+            # If not found in the redis db, try reloading data from Gundi API
+            integration_details = await self._reload_integration_from_gundi(integration_id, ttl, max_stale)
+            for action_id in missing_action_ids:
+                configs_by_action[action_id] = integration_details.get_action_config(action_id)
+            webhook_configuration = webhook_configuration or integration_details.webhook_configuration
+            if ttl:
+                fresh_until = time.time() + ttl
+        integration = Integration(
             id=integration_summary.id,
             name=integration_summary.name,
             type=integration_summary.type,
@@ -119,6 +404,27 @@ class IntegrationConfigurationManager:
             owner=integration_summary.owner,
             default_route=integration_summary.default_route,
             additional=integration_summary.additional,
-            configurations=configurations,
+            configurations=[config for config in configs_by_action.values() if config],
             webhook_configuration=webhook_configuration
-        )
\ No newline at end of file
+        )
+        return integration, fresh_until
+
+    def _refresh_in_background(self, integration_id: str, ttl=None, max_stale=None):
+        if integration_id in self._reloading:  # Already on its way
+            return
+        task = asyncio.create_task(
+            self._refresh_integration(integration_id, ttl, max_stale, generation=integration_details_cache.generation)
+        )
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+
+    async def _refresh_integration(self, integration_id: str, ttl, max_stale, generation: int):
+        logger.debug(f"Refreshing stale integration {integration_id} in the background.")
+        try:
+            integration = await self._reload_integration_from_gundi(integration_id, ttl, max_stale)
+        except Exception as e:  # The stale data is used until it expires
+            logger.warning(f"Error refreshing integration {integration_id}: {type(e).__name__}: {e}")
+        else:
+            integration_details_cache.set(
+                integration, generation=generation, fresh_until=time.time() + ttl, max_stale=max_stale
+            )
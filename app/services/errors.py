@@ -15,3 +15,10 @@ class ConfigurationValidationError(Exception):
 class ActionExecutionError(Exception):
     pass
 
+
+class IntegrationNotFound(Exception):
+    pass
+
+
+class OperationInProgress(Exception):
+    pass
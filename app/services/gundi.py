@@ -1,12 +1,192 @@
+import asyncio
 import datetime
-from typing import List
+import gzip
+import json
+import logging
+import zlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional
 import httpx
 import stamina
-from gundi_client_v2.client import GundiClient, GundiDataSenderClient
+from gundi_client_v2.client import GundiClient
+from app import settings
+from .caching import TTLCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class IntegrationApiKeyCache:
+    """
+    Keeps the API keys of integrations in process memory for a while, so that sending data to Gundi doesn't
+    need a request to the portal each time. Keys are secrets, so they are never written to Redis. Concurrent
+    lookups of the same key wait for a single request.
+    """
+
+    def __init__(self, **kwargs):
+        self._cache = TTLCache(
+            maxsize=kwargs.get("maxsize", settings.GUNDI_API_KEY_CACHE_MAX_SIZE),
+            ttl=kwargs.get("ttl", settings.GUNDI_API_KEY_CACHE_TTL),
+        )
+        self._loading = {}  # integration_id -> Task
+
+    async def _load(self, integration_id: str, load: Callable[..., Awaitable[Optional[str]]]) -> Optional[str]:
+        if api_key := await load(integration_id=integration_id):
+            self._cache.set(integration_id, api_key)
+        return api_key
+
+    async def get(self, integration_id: str, load: Callable[..., Awaitable[Optional[str]]]) -> Optional[str]:
+        """
+        Get the API key of an integration, calling load(integration_id=...) if it isn't cached.
+        """
+        integration_id = str(integration_id)
+        if api_key := self._cache.get(integration_id):
+            return api_key
+        if not (task := self._loading.get(integration_id)):
+            task = asyncio.create_task(self._load(integration_id, load))
+            self._loading[integration_id] = task
+            task.add_done_callback(lambda t: self._loading.pop(integration_id, None))
+        return await asyncio.shield(task)
+
+    def invalidate(self, integration_id: str):
+        self._cache.pop(str(integration_id))
+
+
+gundi_api_key_cache = IntegrationApiKeyCache()
+
+
+class PooledGundiDataSenderClient:
+    """
+    Sends data to the sensors API through a shared HTTP session, instead of opening a new one on each request.
+    It has the same public methods as gundi_client_v2's GundiDataSenderClient, which can't take a session.
+    """
+
+    COMPRESSORS = {
+        "gzip": lambda body, level: gzip.compress(body, compresslevel=level),
+        "deflate": lambda body, level: zlib.compress(body, level),
+    }
+
+    def __init__(self, session: httpx.AsyncClient, integration_api_key: str = None, **kwargs):
+        self.compression = kwargs.get("compression", settings.GUNDI_SENDER_COMPRESSION)
+        self.compression_min_size = kwargs.get("compression_min_size", settings.GUNDI_SENDER_COMPRESSION_MIN_SIZE)
+        self.compression_level = kwargs.get("compression_level", settings.GUNDI_SENDER_COMPRESSION_LEVEL)
+        if self.compression and self.compression not in self.COMPRESSORS:
+            raise ValueError(f"Unsupported compression '{self.compression}'. Use one of: {', '.join(self.COMPRESSORS)}")
+        self.sensors_api_endpoint = f"{kwargs.get('sensors_api_base_url', settings.SENSORS_API_BASE_URL)}/v2"
+        self.api_key = integration_api_key
+        self._session = session
+
+    async def post_observations(self, data: List[dict]) -> dict:
+        return await self._post_data(data=data, endpoint="observations")
+
+    async def post_events(self, data: List[dict]) -> dict:
+        return await self._post_data(data=data, endpoint="events")
+
+    async def post_messages(self, data: List[dict]) -> dict:
+        return await self._post_data(data=data, endpoint="messages")
+
+    async def update_event(self, event_id: str, data: dict) -> dict:
+        return await self._update_data(data=data, endpoint=f"events/{event_id}")
+
+    async def post_event_attachments(self, event_id: str, attachments: List[tuple]) -> dict:
+        return await self._post_data(attachments=attachments, endpoint=f"events/{event_id}/attachments")
+
+    def _encode_json(self, data) -> dict:
+        """
+        Encode data as a JSON body, compressed when it's at least compression_min_size bytes long.
+        Returns the content and headers of the request.
+        """
+        body = json.dumps(data, default=str).encode("utf-8")
+        headers = {"apikey": self.api_key, "Content-Type": "application/json"}
+        if self.compression and len(body) >= self.compression_min_size:
+            body = self.COMPRESSORS[self.compression](body, self.compression_level)
+            headers["Content-Encoding"] = self.compression
+        return {"content": body, "headers": headers}
+
+    async def _post_data(self, data: List[dict] = None, endpoint: str = None, attachments: List[tuple] = None) -> dict:
+        url = f"{self.sensors_api_endpoint}/{endpoint}/"
+        request = dict(
+            url=url,
+            headers={"apikey": self.api_key}
+        )
+        if data:
+            request.update(self._encode_json(data))
+        if attachments:
+            request["files"] = [
+                ('file', (filename, image_binary)) for filename, image_binary in attachments
+            ]
+        logger.debug(f"Sending {len(data or attachments)} {endpoint} to {url}.")
+        response = await self._session.post(**request)
+        response.raise_for_status()
+        return response.json()
+
+    async def _update_data(self, data: dict = None, endpoint: str = None) -> dict:
+        url = f"{self.sensors_api_endpoint}/{endpoint}/"
+        logger.debug(f"Updating {endpoint} in {url}.")
+        response = await self._session.patch(url=url, **self._encode_json(data))
+        response.raise_for_status()
+        return response.json()
+
+
+class GundiDataSenderPool:
+    """
+    Process-wide pool of sensors API clients keyed by integration, bounded in size (least recently used
+    clients are dropped first). All the clients share one HTTP session with keep-alive connections.
+    """
+
+    def __init__(self, **kwargs):
+        self.max_clients = kwargs.get("max_clients", settings.GUNDI_SENDER_POOL_MAX_CLIENTS)
+        self.max_connections = kwargs.get("max_connections", settings.GUNDI_SENDER_POOL_MAX_CONNECTIONS)
+        self.keepalive_expiry = kwargs.get("keepalive_expiry", settings.GUNDI_SENDER_POOL_KEEPALIVE_EXPIRY)
+        self.timeout = kwargs.get("timeout", settings.GUNDI_SENDER_TIMEOUT)
+        self._session = None
+        self._clients = OrderedDict()
+
+    def _get_session(self) -> httpx.AsyncClient:
+        if self._session is None or self._session.is_closed:
+            self._session = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                )
+            )
+        return self._session
+
+    def get(self, integration_id: str, api_key: str) -> PooledGundiDataSenderClient:
+        key = str(integration_id)
+        client = self._clients.get(key)
+        if client is None or client.api_key != api_key:  # New integration or rotated key
+            client = PooledGundiDataSenderClient(session=self._get_session(), integration_api_key=api_key)
+            self._clients[key] = client
+        self._clients.move_to_end(key)
+        while len(self._clients) > self.max_clients:
+            self._clients.popitem(last=False)  # Nothing to close, the session is shared
+        return client
+
+    async def warm_up(self):
+        """
+        Open a keep-alive connection to the sensors API in advance.
+        """
+        response = await self._get_session().head(settings.SENSORS_API_BASE_URL)
+        await response.aclose()
+
+    async def close(self):
+        self._clients.clear()
+        session, self._session = self._session, None
+        if session:
+            await session.aclose()
+
+    def __len__(self):
+        return len(self._clients)
+
+
+gundi_data_sender_pool = GundiDataSenderPool()
 
 
-@stamina.retry(on=httpx.HTTPError, wait_initial=10.0, wait_jitter=10.0, wait_max=300.0)
 async def _get_gundi_api_key(integration_id):
+    # A single attempt: send_*_to_gundi() retry on their own, and the outbox retries in the background
     async with GundiClient() as gundi_client:
         return await gundi_client.get_integration_api_key(
             integration_id=integration_id
@@ -14,12 +194,34 @@ async def _get_gundi_api_key(integration_id):
 
 
 async def _get_sensors_api_client(integration_id):
-    gundi_api_key = await _get_gundi_api_key(integration_id=integration_id)
+    gundi_api_key = await gundi_api_key_cache.get(integration_id=integration_id, load=_get_gundi_api_key)
     assert gundi_api_key, f"Cannot get a valid API Key for integration {integration_id}"
-    sensors_api_client = GundiDataSenderClient(
-        integration_api_key=gundi_api_key
+    return gundi_data_sender_pool.get(integration_id=integration_id, api_key=gundi_api_key)
+
+
+async def _send_to_gundi(integration_id: str, send: Callable[[PooledGundiDataSenderClient], Awaitable[dict]]) -> dict:
+    sensors_api_client = await _get_sensors_api_client(integration_id=integration_id)
+    try:
+        return await send(sensors_api_client)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == httpx.codes.UNAUTHORIZED:
+            # The API key may have been rotated. Get it again on the next attempt.
+            gundi_api_key_cache.invalidate(integration_id=integration_id)
+        raise
+
+
+async def post_data_to_gundi(data_type: str, data: List[dict], integration_id: str) -> dict:
+    """
+    Send data to Gundi using the REST API v2, in a single attempt (see GundiOutbox for deferred retries)
+    :param data_type: "observations", "events" or "messages"
+    :param data: A list of items in the format expected by send_<data_type>_to_gundi
+    :param integration_id: The UUID of the related integration
+    :return: A dict with the response from the API
+    """
+    return await _send_to_gundi(
+        integration_id=str(integration_id),
+        send=lambda sensors_api_client: getattr(sensors_api_client, f"post_{data_type}")(data=data),
     )
-    return sensors_api_client
 
 
 @stamina.retry(on=httpx.HTTPError, wait_initial=10.0, wait_jitter=10.0, wait_max=300.0)
@@ -47,8 +249,10 @@ async def send_events_to_gundi(events: List[dict], **kwargs) -> dict:
     """
     integration_id = kwargs.get("integration_id")
     assert integration_id, "integration_id is required"
-    sensors_api_client = await _get_sensors_api_client(integration_id=str(integration_id))
-    return await sensors_api_client.post_events(data=events)
+    return await _send_to_gundi(
+        integration_id=str(integration_id),
+        send=lambda sensors_api_client: sensors_api_client.post_events(data=events),
+    )
 
 
 @stamina.retry(on=httpx.HTTPError, wait_initial=10.0, wait_jitter=10.0, wait_max=300.0)
@@ -65,8 +269,12 @@ async def send_event_attachments_to_gundi(event_id: str, attachments: List[tuple
     """
     integration_id = kwargs.get("integration_id")
     assert integration_id, "integration_id is required"
-    sensors_api_client = await _get_sensors_api_client(integration_id=str(integration_id))
-    return await sensors_api_client.post_event_attachments(event_id=event_id, attachments=attachments)
+    return await _send_to_gundi(
+        integration_id=str(integration_id),
+        send=lambda sensors_api_client: sensors_api_client.post_event_attachments(
+            event_id=event_id, attachments=attachments
+        ),
+    )
 
 
 @stamina.retry(on=httpx.HTTPError, wait_initial=10.0, wait_jitter=10.0, wait_max=300.0)
@@ -95,8 +303,10 @@ async def send_observations_to_gundi(observations: List[dict], **kwargs) -> dict
     """
     integration_id = kwargs.get("integration_id")
     assert integration_id, "integration_id is required"
-    sensors_api_client = await _get_sensors_api_client(integration_id=str(integration_id))
-    return await sensors_api_client.post_observations(data=observations)
+    return await _send_to_gundi(
+        integration_id=str(integration_id),
+        send=lambda sensors_api_client: sensors_api_client.post_observations(data=observations),
+    )
 
 
 @stamina.retry(on=httpx.HTTPError, wait_initial=10.0, wait_jitter=10.0, wait_max=300.0)
@@ -133,5 +343,7 @@ async def send_messages_to_gundi(messages: List[dict], **kwargs) -> dict:
     """
     integration_id = kwargs.get("integration_id")
     assert integration_id, "integration_id is required"
-    sensors_api_client = await _get_sensors_api_client(integration_id=str(integration_id))
-    return await sensors_api_client.post_messages(data=messages)
+    return await _send_to_gundi(
+        integration_id=str(integration_id),
+        send=lambda sensors_api_client: sensors_api_client.post_messages(data=messages),
+    )
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+import redis.asyncio as redis
+from app import settings
+from app.services.errors import OperationInProgress
+
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyStore:
+    """
+    Makes sure an operation identified by a key (e.g. a gundi_id and a destination) succeeds only once.
+    The outcome is recorded in Redis, so a redelivered request can be answered with the cached result.
+    Concurrent duplicates wait for the first one to finish instead of running the operation again,
+    for up to max_wait seconds. Then OperationInProgress is raised so the request is retried later.
+    """
+    PENDING = "pending"
+    DONE = "done"
+
+    def __init__(self, **kwargs):
+        host = kwargs.get("host", settings.REDIS_HOST)
+        port = kwargs.get("port", settings.REDIS_PORT)
+        db = kwargs.get("db", settings.REDIS_STATE_DB)
+        self.db_client = redis.Redis(host=host, port=port, db=db)
+        self.ttl = kwargs.get("ttl", settings.IDEMPOTENCY_TTL)
+        self.pending_ttl = kwargs.get("pending_ttl", settings.IDEMPOTENCY_PENDING_TTL)
+        self.poll_interval = kwargs.get("poll_interval", settings.IDEMPOTENCY_POLL_INTERVAL)
+        self.max_wait = kwargs.get("max_wait", settings.IDEMPOTENCY_MAX_WAIT)
+        self._in_flight = {}  # key -> Task, for duplicates arriving at this instance
+
+    @staticmethod
+    def _get_key(key: str) -> str:
+        return f"idempotency.{key}"
+
+    async def _claim(self, key: str):
+        """
+        Returns None if the key was claimed by us, or the existing record otherwise.
+        """
+        claimed = await self.db_client.set(
+            self._get_key(key), json.dumps({"status": self.PENDING}), nx=True, ex=self.pending_ttl
+        )
+        if claimed:
+            return None
+        json_value = await self.db_client.get(self._get_key(key))
+        # The key may expire between both calls, so try again later
+        return json.loads(json_value) if json_value else {"status": self.PENDING}
+
+    async def _complete(self, key: str, result: Any):
+        await self.db_client.set(
+            self._get_key(key), json.dumps({"status": self.DONE, "result": result}, default=str), ex=self.ttl
+        )
+
+    async def _release(self, key: str):
+        await self.db_client.delete(self._get_key(key))
+
+    async def _run_once(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        deadline = time.monotonic() + self.max_wait
+        try:
+            while (record := await self._claim(key)) is not None:
+                if record.get("status") == self.DONE:
+                    logger.info(f"Operation '{key}' already succeeded. Returning the recorded result.")
+                    return record.get("result")
+                # Another instance is running it. The pending record expires if that instance dies.
+                if time.monotonic() >= deadline:
+                    # Don't hold the request (and a worker) for as long as the other instance may take
+                    raise OperationInProgress(f"Operation '{key}' is still in progress in another instance.")
+                await asyncio.sleep(self.poll_interval)
+        except redis.RedisError as e:
+            logger.warning(f"Idempotency check for '{key}' skipped, Redis error: {type(e).__name__}: {e}")
+            return await func()
+
+        try:
+            result = await func()
+        except BaseException:
+            try:  # Let retries run the operation again
+                await self._release(key)
+            except redis.RedisError as e:
+                logger.warning(f"Error releasing idempotency key '{key}': {type(e).__name__}: {e}")
+            raise
+        try:
+            await self._complete(key, result)
+        except redis.RedisError as e:
+            logger.warning(f"Error recording the result of '{key}': {type(e).__name__}: {e}")
+        return result
+
+    async def run_once(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs func() unless it already succeeded for this key, and returns its result (or the recorded one).
+        """
+        if not (task := self._in_flight.get(key)):
+            task = asyncio.create_task(self._run_once(key, func))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._in_flight.pop(key, None))
+        else:
+            logger.info(f"Operation '{key}' is already in progress. Waiting for its result.")
+        # Shielded, so that a cancelled duplicate doesn't cancel the operation for the others
+        return await asyncio.shield(task)
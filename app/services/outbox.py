@@ -0,0 +1,335 @@
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from collections import deque
+from typing import List, Optional
+
+import httpx
+import redis.asyncio as redis
+from app import settings
+from . import gundi
+
+
+logger = logging.getLogger(__name__)
+
+
+# Claims the due items, leasing them. Claiming an item blocks its integration until the item is done (see
+# RELEASE_SCRIPT), and due items of a blocked integration are parked behind it, with their original scores.
+CLAIM_SCRIPT = """
+local now = tonumber(ARGV[1])
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, ARGV[2])
+local items = {}
+for i = 1, #due, 2 do
+    local id, score = due[i], due[i + 1]
+    local item = redis.call('HGET', KEYS[2], id)
+    if item then
+        local integration_id = cjson.decode(item)['integration_id']
+        local block = redis.call('HGET', KEYS[3], integration_id)
+        block = block and cjson.decode(block)
+        if block and block['id'] ~= id and tonumber(block['until']) > now then
+            redis.call('ZREM', KEYS[1], id)
+            redis.call('ZADD', ARGV[4] .. integration_id, score, id)
+        else
+            redis.call('ZADD', KEYS[1], ARGV[3], id)
+            redis.call('HSET', KEYS[3], integration_id, cjson.encode({id = id, ['until'] = tonumber(ARGV[3])}))
+            table.insert(items, item)
+        end
+    else
+        redis.call('ZREM', KEYS[1], id)
+    end
+end
+return items
+"""
+
+# Unblocks an integration if the item still holds it, and puts its parked items back in the queue
+RELEASE_SCRIPT = """
+local block = redis.call('HGET', KEYS[2], ARGV[1])
+if not block or cjson.decode(block)['id'] ~= ARGV[2] then
+    return 0
+end
+redis.call('HDEL', KEYS[2], ARGV[1])
+local parked = redis.call('ZRANGE', KEYS[3], 0, -1, 'WITHSCORES')
+for i = 1, #parked, 2 do
+    redis.call('ZADD', KEYS[1], parked[i + 1], parked[i])
+end
+redis.call('DEL', KEYS[3])
+return #parked / 2
+"""
+
+
+class LocalOutboxBackend:
+    """
+    Keeps the outbox in memory. Items are lost on restarts, so it's only suitable for tests or local runs.
+    """
+
+    def __init__(self, **kwargs):
+        self._schedule = {}  # id -> time of the next attempt
+        self._items = {}  # id -> item
+        self._blocks = {}  # integration_id -> (id of the item holding it, time until it's held)
+        self._parked = {}  # integration_id -> {id: time of the next attempt}, for the items waiting behind it
+        self._dead_letters = deque(maxlen=kwargs.get("max_dead_letters", settings.GUNDI_OUTBOX_MAX_DEAD_LETTERS))
+
+    async def push(self, item: dict, due_at: float):
+        self._items[item["id"]] = item
+        self._schedule[item["id"]] = due_at
+
+    async def claim(self, now: float, limit: int, lease_until: float) -> List[dict]:
+        due_ids = sorted((due_at, item_id) for item_id, due_at in self._schedule.items() if due_at <= now)[:limit]
+        items = []
+        for due_at, item_id in due_ids:
+            integration_id = self._items[item_id]["integration_id"]
+            blocking_id, blocked_until = self._blocks.get(integration_id, (None, 0))
+            if blocking_id not in (None, item_id) and blocked_until > now:
+                del self._schedule[item_id]
+                self._parked.setdefault(integration_id, {})[item_id] = due_at
+                continue
+            self._schedule[item_id] = lease_until
+            self._blocks[integration_id] = (item_id, lease_until)
+            items.append(dict(self._items[item_id]))
+        return items
+
+    async def block(self, integration_id: str, item_id: str, until: float):
+        self._blocks[integration_id] = (item_id, until)
+
+    async def release(self, integration_id: str, item_id: str):
+        if self._blocks.get(integration_id, (None, 0))[0] != item_id:
+            return
+        del self._blocks[integration_id]
+        self._schedule.update(self._parked.pop(integration_id, {}))
+
+    async def remove(self, item_id: str):
+        self._schedule.pop(item_id, None)
+        self._items.pop(item_id, None)
+
+    async def move_to_dead_letters(self, item: dict):
+        await self.remove(item["id"])
+        self._dead_letters.appendleft(item)
+
+    async def depth(self) -> int:
+        return len(self._items)
+
+    async def dead_letters_count(self) -> int:
+        return len(self._dead_letters)
+
+
+class RedisOutboxBackend:
+    """
+    Keeps the outbox in Redis: a sorted set of item ids scored by the time of their next attempt, plus a hash
+    with the items. Claimed items are leased (rescheduled a while later), so they are retried if a replica dies.
+    Blocked integrations are kept in another hash, and their parked items in a sorted set per integration.
+    """
+
+    def __init__(self, **kwargs):
+        host = kwargs.get("host", settings.REDIS_HOST)
+        port = kwargs.get("port", settings.REDIS_PORT)
+        db = kwargs.get("db", settings.REDIS_STATE_DB)
+        self.db_client = redis.Redis(host=host, port=port, db=db)
+        self.max_dead_letters = kwargs.get("max_dead_letters", settings.GUNDI_OUTBOX_MAX_DEAD_LETTERS)
+        self.queue_key = "gundi_outbox.queue"
+        self.items_key = "gundi_outbox.items"
+        self.dead_letters_key = "gundi_outbox.dead_letters"
+        self.blocks_key = "gundi_outbox.blocks"
+        self.parked_key_prefix = "gundi_outbox.parked."
+
+    async def push(self, item: dict, due_at: float):
+        async with self.db_client.pipeline(transaction=True) as pipe:
+            pipe.hset(self.items_key, item["id"], json.dumps(item, default=str))
+            pipe.zadd(self.queue_key, {item["id"]: due_at})
+            await pipe.execute()
+
+    async def claim(self, now: float, limit: int, lease_until: float) -> List[dict]:
+        items = await self.db_client.eval(
+            CLAIM_SCRIPT, 3, self.queue_key, self.items_key, self.blocks_key,
+            now, limit, lease_until, self.parked_key_prefix
+        )
+        return [json.loads(item) for item in items]
+
+    async def block(self, integration_id: str, item_id: str, until: float):
+        await self.db_client.hset(self.blocks_key, integration_id, json.dumps({"id": item_id, "until": until}))
+
+    async def release(self, integration_id: str, item_id: str):
+        await self.db_client.eval(
+            RELEASE_SCRIPT, 3, self.queue_key, self.blocks_key, f"{self.parked_key_prefix}{integration_id}",
+            integration_id, item_id
+        )
+
+    async def remove(self, item_id: str):
+        async with self.db_client.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.queue_key, item_id)
+            pipe.hdel(self.items_key, item_id)
+            await pipe.execute()
+
+    async def move_to_dead_letters(self, item: dict):
+        async with self.db_client.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.queue_key, item["id"])
+            pipe.hdel(self.items_key, item["id"])
+            pipe.lpush(self.dead_letters_key, json.dumps(item, default=str))
+            pipe.ltrim(self.dead_letters_key, 0, self.max_dead_letters - 1)
+            await pipe.execute()
+
+    async def depth(self) -> int:
+        return await self.db_client.hlen(self.items_key)
+
+    async def dead_letters_count(self) -> int:
+        return await self.db_client.llen(self.dead_letters_key)
+
+
+class GundiOutbox:
+    """
+    Sends data to Gundi, and when the sensors API can't take it, keeps it in a durable outbox instead of
+    retrying inline. A background drainer retries the pending items with exponential backoff, keeping the
+    order of the items of each integration (e.g. observations before the messages that follow them): while an
+    item is being sent or waits for a retry, its integration is blocked in the backend, so no replica sends
+    the items that follow it.
+    """
+
+    ORDER_STEP = 0.000001  # Seconds between the due times of consecutive items of an integration
+
+    def __init__(self, **kwargs):
+        self.backend = kwargs.get("backend") or get_outbox_backend()
+        self.initial_wait = kwargs.get("initial_wait", settings.GUNDI_OUTBOX_RETRY_INITIAL_WAIT)
+        self.max_wait = kwargs.get("max_wait", settings.GUNDI_OUTBOX_RETRY_MAX_WAIT)
+        self.max_attempts = kwargs.get("max_attempts", settings.GUNDI_OUTBOX_MAX_ATTEMPTS)
+        self.poll_interval = kwargs.get("poll_interval", settings.GUNDI_OUTBOX_POLL_INTERVAL)
+        self.lease_seconds = kwargs.get("lease_seconds", settings.GUNDI_OUTBOX_LEASE_SECONDS)
+        self.claim_size = kwargs.get("claim_size", settings.GUNDI_OUTBOX_CLAIM_SIZE)
+        self._drainer = None
+        self._latest_due = {}  # integration_id -> due time of the last item scheduled here
+
+    @staticmethod
+    def is_retryable(exc: Exception) -> bool:
+        if isinstance(exc, httpx.HTTPStatusError):  # Bad requests won't succeed later
+            status_code = exc.response.status_code
+            return status_code >= 500 or status_code in (httpx.codes.TOO_MANY_REQUESTS, httpx.codes.REQUEST_TIMEOUT)
+        return isinstance(exc, httpx.HTTPError)
+
+    def _get_wait(self, attempts: int) -> float:
+        wait = min(self.initial_wait * 2 ** max(attempts - 1, 0), self.max_wait)
+        return wait + random.uniform(0, wait * 0.1)
+
+    def _next_due(self, integration_id: str, due_at: float) -> float:
+        """
+        Due time for a new item of an integration, after the ones already scheduled by this replica.
+        """
+        due_at = max(due_at, self._latest_due.get(integration_id, 0) + self.ORDER_STEP)
+        self._latest_due[integration_id] = due_at
+        return due_at
+
+    async def _push(self, item: dict, due_at: float):
+        item["due_at"] = due_at
+        await self.backend.push(item, due_at=due_at)
+
+    async def enqueue(self, data_type: str, data: List[dict], integration_id: str, attempts: int = 1, error: str = ""):
+        item = {
+            "id": str(uuid.uuid4()),
+            "data_type": data_type,
+            "integration_id": str(integration_id),
+            "data": data,
+            "attempts": attempts,
+            "error": error,
+        }
+        await self._push(item, due_at=self._next_due(item["integration_id"], time.time() + self._get_wait(attempts)))
+        logger.info(f"{len(data)} {data_type} of integration {integration_id} saved in the outbox for later delivery.")
+
+    async def send(self, data_type: str, data: List[dict], integration_id: str, defer: bool = False) -> Optional[dict]:
+        """
+        Send data to Gundi. If it fails with a temporary error, the data is saved in the outbox and None is returned.
+        :param data_type: "observations", "events" or "messages"
+        :param defer: Save it in the outbox without trying now, e.g. to keep it behind data that couldn't be sent
+        """
+        if defer:
+            await self.enqueue(data_type=data_type, data=data, integration_id=integration_id)
+            return None
+        try:
+            return await gundi.post_data_to_gundi(data_type=data_type, data=data, integration_id=integration_id)
+        except Exception as e:
+            if not self.is_retryable(e):
+                raise
+            error = f"{type(e).__name__}: {e}"
+            logger.warning(f"Error sending {data_type} of integration {integration_id} to Gundi: {error}")
+            try:
+                await self.enqueue(data_type=data_type, data=data, integration_id=integration_id, error=error)
+            except redis.RedisError as redis_error:
+                logger.error(f"Error saving {data_type} in the outbox: {type(redis_error).__name__}: {redis_error}")
+                raise e from redis_error  # Let the caller retry instead
+            return None
+
+    async def _retry(self, item: dict):
+        integration_id = item["integration_id"]
+        try:
+            await gundi.post_data_to_gundi(
+                data_type=item["data_type"], data=item["data"], integration_id=integration_id
+            )
+        except Exception as e:
+            item["attempts"] += 1
+            item["error"] = f"{type(e).__name__}: {e}"
+            if not self.is_retryable(e) or item["attempts"] >= self.max_attempts:
+                logger.error(
+                    f"Giving up sending {len(item['data'])} {item['data_type']} of integration {integration_id} "
+                    f"after {item['attempts']} attempts: {item['error']}"
+                )
+                await self.backend.move_to_dead_letters(item)
+                await self.backend.release(integration_id, item["id"])
+                return
+            # Retried before the items of the integration that follow it, which wait until then
+            due_at = time.time() + self._get_wait(item["attempts"])
+            await self.backend.block(integration_id, item["id"], until=due_at + self.lease_seconds)
+            await self._push(item, due_at=due_at)
+        else:
+            logger.info(f"{len(item['data'])} {item['data_type']} of integration {integration_id} delivered from the outbox.")
+            await self.backend.remove(item["id"])
+            await self.backend.release(integration_id, item["id"])
+
+    async def drain_once(self) -> int:
+        """
+        Retry the items that are due, oldest first. Returns the number of items processed.
+        """
+        now = time.time()
+        self._latest_due = {key: due_at for key, due_at in self._latest_due.items() if due_at > now}
+        items = await self.backend.claim(now=now, limit=self.claim_size, lease_until=now + self.lease_seconds)
+        for item in items:  # At most one per integration, the others are parked behind it
+            await self._retry(item)
+        return len(items)
+
+    async def _run(self):
+        while True:
+            try:
+                processed = await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Error draining the Gundi outbox: {type(e).__name__}: {e}")
+                processed = 0
+            if not processed:
+                await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        if not self._drainer or self._drainer.done():
+            self._drainer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._drainer:
+            self._drainer.cancel()
+            try:
+                await self._drainer
+            except asyncio.CancelledError:
+                pass
+            self._drainer = None
+
+    async def status(self) -> dict:
+        return {
+            "depth": await self.backend.depth(),
+            "dead_letters": await self.backend.dead_letters_count(),
+        }
+
+
+def get_outbox_backend():
+    if settings.GUNDI_OUTBOX_BACKEND == "redis":
+        return RedisOutboxBackend()
+    return LocalOutboxBackend()
+
+
+gundi_outbox = GundiOutbox()
@@ -0,0 +1,158 @@
+import json
+import logging
+import struct
+import zlib
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from app import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+# Each record is framed as: payload length (4 bytes, big-endian) | CRC32 of the payload (4 bytes) | payload
+FRAME_HEADER = struct.Struct(">II")
+SEGMENT_SUFFIX = ".seg"
+
+
+class DiskSpool:
+    """
+    Append-only queue of records on local disk, split in segment files that are deleted once read.
+    The read position is saved in a cursor file, so records survive restarts (they may be read again
+    if the process dies before committing them).
+    """
+
+    def __init__(self, directory: str, **kwargs):
+        self.directory = Path(directory)
+        self.segment_size = kwargs.get("segment_size", settings.ACTIVITY_LOGS_SPOOL_SEGMENT_SIZE)
+        self.max_size = kwargs.get("max_size", settings.ACTIVITY_LOGS_SPOOL_MAX_SIZE)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._cursor_path = self.directory / "cursor"
+        self._segments = sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}"))  # Oldest first
+        self._size = sum(segment.stat().st_size for segment in self._segments)
+        self._writer = None
+        self._read_segment, self._read_offset = self._load_cursor()
+
+    def _load_cursor(self) -> Tuple[Optional[Path], int]:
+        try:
+            cursor = json.loads(self._cursor_path.read_text())
+            segment = self.directory / cursor["segment"]
+            if segment in self._segments:
+                return segment, cursor["offset"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return (self._segments[0] if self._segments else None), 0
+
+    def _save_cursor(self):
+        if self._read_segment is None:
+            self._cursor_path.unlink(missing_ok=True)
+            return
+        tmp_path = self._cursor_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"segment": self._read_segment.name, "offset": self._read_offset}))
+        tmp_path.replace(self._cursor_path)
+
+    def _get_writer(self, frame_size: int):
+        if self._writer and self._writer.tell() and self._writer.tell() + frame_size > self.segment_size:
+            self._writer.close()
+            self._writer = None
+        if not self._writer:
+            number = int(self._segments[-1].stem) + 1 if self._segments else 1
+            segment = self.directory / f"{number:012d}{SEGMENT_SUFFIX}"
+            self._writer = open(segment, "ab")
+            self._segments.append(segment)
+            if self._read_segment is None:
+                self._read_segment, self._read_offset = segment, 0
+        return self._writer
+
+    def __len__(self):
+        """
+        Bytes on disk, including the records read but not deleted yet.
+        """
+        return self._size
+
+    def is_empty(self) -> bool:
+        if self._read_segment is None:
+            return True
+        return self._read_segment == self._segments[-1] and self._read_offset >= self._read_segment.stat().st_size
+
+    def append(self, records: List[bytes]) -> int:
+        """
+        Append records at the end of the spool. Returns how many were written (none once the spool is full).
+        """
+        written = 0
+        for payload in records:
+            frame = FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+            if self._size + len(frame) > self.max_size:
+                logger.error(f"Spool {self.directory} is full. {len(records) - written} records dropped.")
+                break
+            self._get_writer(len(frame)).write(frame)
+            self._size += len(frame)
+            written += 1
+        if self._writer:
+            self._writer.flush()
+        return written
+
+    def read(self, limit: int) -> List[Tuple[bytes, tuple]]:
+        """
+        Read up to limit records from the start of the spool, without removing them.
+        Returns a list of (payload, position), pass the position of the last record handled to commit().
+        """
+        records = []
+        segment, offset = self._read_segment, self._read_offset
+        while segment is not None and len(records) < limit:
+            corrupt = False
+            with open(segment, "rb") as segment_file:
+                segment_file.seek(offset)
+                while len(records) < limit:
+                    header = segment_file.read(FRAME_HEADER.size)
+                    if not header:
+                        break
+                    length, crc = FRAME_HEADER.unpack(header) if len(header) == FRAME_HEADER.size else (0, None)
+                    payload = segment_file.read(length)
+                    if crc is None or len(payload) < length or zlib.crc32(payload) != crc:
+                        # A torn write after a crash, the rest of the segment can't be trusted
+                        logger.error(f"Corrupt record in {segment} at offset {offset}. Skipping the rest of the segment.")
+                        offset = segment.stat().st_size
+                        corrupt = True
+                        break
+                    offset += FRAME_HEADER.size + length
+                    records.append((payload, (segment, offset)))
+            if corrupt and not records:
+                # Persist the skip, otherwise the corrupt tail would be found (and the spool look non-empty) forever
+                self.commit((segment, offset))
+                segment, offset = self._read_segment, self._read_offset
+                continue
+            if len(records) >= limit or segment == self._segments[-1]:
+                break
+            # The segment was consumed, continue with the next one
+            segment, offset = self._segments[self._segments.index(segment) + 1], 0
+            if not records:  # Nothing to commit from skipped segments, so move the cursor now
+                self.commit((segment, offset))
+        return records
+
+    def commit(self, position: tuple):
+        """
+        Mark the records up to position as done, deleting the segments consumed.
+        """
+        segment, offset = position
+        while self._segments and self._segments[0] != segment:
+            self._delete_segment(self._segments[0])
+        self._read_segment, self._read_offset = segment, offset
+        if segment == self._segments[-1] and offset >= segment.stat().st_size:  # All read, start over
+            if self._writer:
+                self._writer.close()
+                self._writer = None
+            self._delete_segment(segment)
+            self._read_segment, self._read_offset = None, 0
+        self._save_cursor()
+
+    def _delete_segment(self, segment: Path):
+        self._size -= segment.stat().st_size
+        segment.unlink(missing_ok=True)
+        self._segments.remove(segment)
+
+    def close(self):
+        if self._writer:
+            self._writer.close()
+            self._writer = None
@@ -7,6 +7,7 @@ from fastapi import status
 from gundi_core.commands import RunIntegrationAction
 from gundi_core.events import IntegrationActionFailed
 from gundi_core.events.transformers import ObservationTransformedER
+from gundi_core.schemas.v2 import IntegrationActionConfiguration
 
 from app import settings
 from app.conftest import MockSubActionConfiguration, MockPushActionConfiguration
@@ -48,8 +49,24 @@ async def test_execute_pull_action_from_pubsub(
 @pytest.mark.asyncio
 async def test_execute_push_action_from_pubsub(
         mocker, mock_gundi_client_v2, mock_publish_event, mock_action_handlers, mock_config_manager,
-        pubsub_message_request_headers, run_push_action_pubsub_payload, mock_push_observations_handler
+        pubsub_message_request_headers, run_push_action_pubsub_payload, mock_push_observations_handler,
+        integration_v2
 ):
+    integration_v2.configurations.append(
+        IntegrationActionConfiguration.parse_obj(
+            {
+                "id": "8f5a8b3e-2c4d-4e1f-9a6b-7c8d9e0f1a2b",
+                "integration": str(integration_v2.id),
+                "action": {
+                    "id": "9f211f31-e693-404c-b6ee-20fde6019fa5",
+                    "type": "push",
+                    "name": "Push Observations",
+                    "value": "push_observations",
+                },
+                "data": {},
+            }
+        )
+    )
     mocker.patch("app.services.action_runner.action_handlers", mock_action_handlers)
     mocker.patch("app.actions.action_handlers", mock_action_handlers)
     mocker.patch("app.services.action_runner._portal", mock_gundi_client_v2)
@@ -144,6 +161,9 @@ async def test_execute_action_from_api_with_config_overrides(
     for k, v in config_overrides.items():
         config = mock_action_handler.call_args.kwargs["action_config"]
         assert getattr(config, k) == v
+    # The configuration is taken from the integration already loaded, and it's not modified
+    assert not mock_config_manager.get_action_configuration.called
+    assert "lookback_days" not in integration_v2.get_action_config("pull_observations").data
 
 
 @pytest.mark.asyncio
@@ -1,17 +1,26 @@
+import asyncio
+import json
+
+import aiohttp
 import pytest
-from unittest.mock import ANY
+from unittest.mock import ANY, AsyncMock
 from gundi_core.events import (
     LogLevel,
     IntegrationActionStarted,
     IntegrationActionComplete,
     IntegrationActionFailed,
     IntegrationActionCustomLog,
+    CustomActivityLog,
     IntegrationWebhookStarted,
     IntegrationWebhookComplete,
     IntegrationWebhookFailed
 )
 from app import settings
-from app.services.activity_logger import publish_event, activity_logger, webhook_activity_logger, log_activity
+from app.services.activity_logger import (
+    publish_event, activity_logger, webhook_activity_logger, log_activity, PubSubPublisher,
+    ActivityEventQueue, DebugLogsPolicy, log_action_activity,
+)
+from app.services.spool import DiskSpool
 from app.webhooks import GenericJsonPayload, GenericJsonTransformConfig
 
 
@@ -25,7 +34,7 @@ from app.webhooks import GenericJsonPayload, GenericJsonTransformConfig
 @pytest.mark.asyncio
 async def test_publish_event(
         mocker, mock_pubsub_client, integration_event_pubsub_message, gcp_pubsub_publish_response,
-        system_event
+        system_event, event_publisher
 ):
     mocker.patch("app.services.activity_logger.pubsub", mock_pubsub_client)
 
@@ -33,6 +42,7 @@ async def test_publish_event(
         event=system_event,
         topic_name=settings.INTEGRATION_EVENTS_TOPIC
     )
+    await event_publisher.close()
 
     assert response == gcp_pubsub_publish_response
     assert mock_pubsub_client.PublisherClient.called
@@ -45,6 +55,57 @@ async def test_publish_event(
     )
 
 
+@pytest.mark.asyncio
+async def test_publish_event_batches_concurrent_events(
+        mocker, mock_pubsub_client, action_started_event, custom_activity_log_event, action_complete_event,
+        event_publisher
+):
+    mocker.patch("app.services.activity_logger.pubsub", mock_pubsub_client)
+    mock_publisher = mock_pubsub_client.PublisherClient.return_value
+    mock_publisher.publish.side_effect = AsyncMock(return_value={"messageIds": ["1", "2", "3"]})
+
+    responses = await asyncio.gather(
+        publish_event(event=action_started_event, topic_name=settings.INTEGRATION_EVENTS_TOPIC),
+        publish_event(event=custom_activity_log_event, topic_name=settings.INTEGRATION_EVENTS_TOPIC),
+        publish_event(event=action_complete_event, topic_name=settings.INTEGRATION_EVENTS_TOPIC),
+    )
+    await event_publisher.close()
+
+    # One request to PubSub for the three events, sharing the same client
+    assert mock_publisher.publish.call_count == 1
+    assert len(mock_publisher.publish.call_args.args[1]) == 3
+    assert mock_pubsub_client.PublisherClient.call_count == 1
+    assert responses == [{"messageIds": ["1"]}, {"messageIds": ["2"]}, {"messageIds": ["3"]}]
+
+
+@pytest.mark.asyncio
+async def test_event_publisher_flushes_full_batches(mocker, mock_pubsub_client, action_started_event):
+    mocker.patch("app.services.activity_logger.pubsub", mock_pubsub_client)
+    mock_publisher = mock_pubsub_client.PublisherClient.return_value
+    mock_publisher.publish.side_effect = AsyncMock(return_value={"messageIds": ["1", "2"]})
+    publisher = PubSubPublisher(max_batch_size=2, max_latency=60)
+
+    futures = [publisher.publish(event=action_started_event, topic_name="topic-a") for _ in range(5)]
+    await asyncio.gather(*futures[:4])  # Two full batches, without waiting for max_latency
+    assert mock_publisher.publish.call_count == 2
+    assert not futures[4].done()
+
+    await publisher.close()  # The rest is published on shutdown
+    assert mock_publisher.publish.call_count == 3
+    assert futures[4].done()
+
+
+@pytest.mark.asyncio
+async def test_publish_event_raises_publish_errors(mocker, mock_pubsub_client, action_started_event, event_publisher):
+    mocker.patch("app.services.activity_logger.pubsub", mock_pubsub_client)
+    mock_publisher = mock_pubsub_client.PublisherClient.return_value
+    mock_publisher.publish.side_effect = ValueError("Invalid topic")
+
+    with pytest.raises(ValueError):
+        await publish_event(event=action_started_event, topic_name=settings.INTEGRATION_EVENTS_TOPIC)
+    await event_publisher.close()
+
+
 @pytest.mark.asyncio
 async def test_activity_logger_decorator(
         mocker, mock_publish_event, integration_v2, pull_observations_config
@@ -218,3 +279,231 @@ async def test_log_activity_with_error_level(mocker, integration_v2, mock_publis
     assert mock_publish_event.call_count == 1
     assert isinstance(mock_publish_event.call_args_list[0].kwargs.get("event"), IntegrationActionCustomLog)
 
+
+
+@pytest.mark.asyncio
+async def test_activity_logger_publishes_in_background(
+        mocker, integration_v2, pull_observations_config, activity_event_queue
+):
+    pubsub_is_down = asyncio.Event()
+
+    async def wait_for_pubsub(**kwargs):
+        await pubsub_is_down.wait()
+
+    mock_publish_event = AsyncMock(side_effect=wait_for_pubsub)
+    mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
+    mocker.patch("app.services.activity_logger.settings.ACTIVITY_LOGS_IN_BACKGROUND", True)
+
+    @activity_logger()
+    async def action_pull_observations(integration, action_config):
+        return {"observations_extracted": 10}
+
+    # The action finishes even though PubSub doesn't respond
+    result = await asyncio.wait_for(
+        action_pull_observations(integration=integration_v2, action_config=pull_observations_config), timeout=1
+    )
+    assert result == {"observations_extracted": 10}
+
+    pubsub_is_down.set()
+    await activity_event_queue.close()
+    assert mock_publish_event.call_count == 2
+    assert isinstance(mock_publish_event.call_args_list[0].kwargs.get("event"), IntegrationActionStarted)
+    assert isinstance(mock_publish_event.call_args_list[1].kwargs.get("event"), IntegrationActionComplete)
+
+
+def build_custom_log(level):
+    return IntegrationActionCustomLog(
+        payload=CustomActivityLog(
+            integration_id="779ff3ab-5589-4f4c-9e0a-ae8d6c9edff0",
+            action_id="push_messages",
+            title=f"{level.name} log",
+            level=level,
+        )
+    )
+
+
+@pytest.mark.asyncio
+async def test_activity_event_queue_overflow_policy(mocker, mock_publish_event):
+    mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
+    event_queue = ActivityEventQueue(maxsize=2, workers=0)  # Keep the events in the queue
+    topic = settings.INTEGRATION_EVENTS_TOPIC
+
+    await event_queue.put(build_custom_log(LogLevel.DEBUG), topic)
+    await event_queue.put(build_custom_log(LogLevel.INFO), topic)
+    await event_queue.put(build_custom_log(LogLevel.DEBUG), topic)  # Dropped
+    await event_queue.put(build_custom_log(LogLevel.WARNING), topic)  # Takes the place of the queued DEBUG event
+    assert [level for level, _, _ in event_queue._items] == [LogLevel.INFO, LogLevel.WARNING]
+    await event_queue.put(build_custom_log(LogLevel.INFO), topic)  # Dropped
+    assert len(event_queue) == 2
+
+    # ERROR events wait for room instead
+    put_error = asyncio.create_task(event_queue.put(build_custom_log(LogLevel.ERROR), topic))
+    await asyncio.sleep(0.01)
+    assert not put_error.done()
+    event_queue.workers = 1
+    event_queue.start()
+    await asyncio.wait_for(put_error, timeout=1)
+    await event_queue.close()
+
+    assert mock_publish_event.call_count == 3
+    assert [c.kwargs["event"].payload.level for c in mock_publish_event.call_args_list] == [
+        LogLevel.INFO, LogLevel.WARNING, LogLevel.ERROR
+    ]
+
+
+@pytest.mark.asyncio
+async def test_sample_debug_logs_per_integration(mocker, mock_publish_event):
+    mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
+    mocker.patch("app.services.activity_logger.debug_logs_policy", DebugLogsPolicy(mode="sample", sample_rate=0.25))
+
+    for integration_id in ["779ff3ab-5589-4f4c-9e0a-ae8d6c9edff0", "a1e2b3c4-5589-4f4c-9e0a-ae8d6c9edff0"]:
+        for i in range(8):
+            await log_action_activity(
+                integration_id=integration_id, action_id="push_messages", title=f"Message {i} Delivered",
+                level=LogLevel.DEBUG
+            )
+    await log_action_activity(
+        integration_id="779ff3ab-5589-4f4c-9e0a-ae8d6c9edff0", action_id="push_messages", title="Error",
+        level=LogLevel.ERROR
+    )
+
+    # 1 of every 4 DEBUG logs of each integration, and every ERROR log
+    titles = [c.kwargs["event"].payload.title for c in mock_publish_event.call_args_list]
+    assert titles == [
+        "Message 0 Delivered", "Message 4 Delivered", "Message 0 Delivered", "Message 4 Delivered", "Error"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_debug_logs(mocker, mock_publish_event):
+    mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
+    logs_policy = DebugLogsPolicy(mode="coalesce", window=60)
+    mocker.patch("app.services.activity_logger.debug_logs_policy", logs_policy)
+    integration_id = "779ff3ab-5589-4f4c-9e0a-ae8d6c9edff0"
+
+    for i in range(3):
+        await log_action_activity(
+            integration_id=integration_id, action_id="push_messages", title=f"Message {i} Delivered",
+            level=LogLevel.DEBUG, data={"gundi_id": str(i)}
+        )
+    await log_action_activity(
+        integration_id=integration_id, action_id="push_messages", title="Error", level=LogLevel.ERROR
+    )
+    assert mock_publish_event.call_count == 1  # Errors go out right away
+
+    await logs_policy.close()  # Ends the window
+    assert mock_publish_event.call_count == 2
+    summary = mock_publish_event.call_args.kwargs["event"]
+    assert isinstance(summary, IntegrationActionCustomLog)
+    assert summary.payload.level == LogLevel.DEBUG
+    assert summary.payload.title.startswith("3 DEBUG logs in the last")
+    assert summary.payload.title.endswith("Last one: Message 2 Delivered")
+    assert summary.payload.data == {
+        "coalesced_logs": 3, "first_title": "Message 0 Delivered", "last_data": {"gundi_id": "2"}
+    }
+
+
+@pytest.mark.asyncio
+async def test_event_publisher_spools_events_while_pubsub_is_down(
+        mocker, tmp_path, mock_pubsub_client, action_started_event, action_complete_event
+):
+    mocker.patch("app.services.activity_logger.pubsub.PublisherClient", mock_pubsub_client.PublisherClient)
+    mock_publisher = mock_pubsub_client.PublisherClient.return_value
+    mock_publisher.publish.side_effect = aiohttp.ClientConnectionError("PubSub is down")
+    publisher = PubSubPublisher(spool=DiskSpool(directory=tmp_path), replay_interval=60)
+
+    response = await publisher.publish(event=action_started_event, topic_name="topic-a")
+    assert response == {"messageIds": [], "spooled": True}
+    assert mock_publisher.publish.call_count == 1  # No inline retries
+    # Later events go to the spool too, to keep the order
+    await publisher.publish(event=action_complete_event, topic_name="topic-b")
+    assert mock_publisher.publish.call_count == 1
+
+    # Replayed in order once PubSub is back
+    mock_publisher.publish.side_effect = AsyncMock(return_value={"messageIds": ["1"]})
+    publisher._replayer.cancel()  # Don't wait for the next attempt
+    await asyncio.gather(publisher._replayer, return_exceptions=True)
+    publisher.start()
+    await asyncio.wait_for(publisher._replayer, timeout=1)
+    assert publisher.spool.is_empty()
+    assert [c.args[0] for c in mock_publisher.publish.call_args_list[-2:]] == [
+        mock_publisher.topic_path.return_value, mock_publisher.topic_path.return_value
+    ]
+    replayed = [json.loads(c.args[1][0].data) for c in mock_publisher.publish.call_args_list[-2:]]
+    assert [event["event_type"] for event in replayed] == ["IntegrationActionStarted", "IntegrationActionComplete"]
+    assert [c.args[0] for c in mock_publisher.topic_path.call_args_list[-2:]] == [settings.GCP_PROJECT_ID] * 2
+    assert [c.args[1] for c in mock_publisher.topic_path.call_args_list[-2:]] == ["topic-a", "topic-b"]
+    await publisher.close()
+
+
+@pytest.mark.asyncio
+async def test_event_publisher_replays_spool_with_torn_tail(mocker, tmp_path, mock_pubsub_client, action_started_event):
+    mocker.patch("app.services.activity_logger.pubsub.PublisherClient", mock_pubsub_client.PublisherClient)
+    mock_publisher = mock_pubsub_client.PublisherClient.return_value
+    mock_publisher.publish.side_effect = AsyncMock(return_value={"messageIds": ["1"]})
+    spool = DiskSpool(directory=tmp_path)
+    spool.append([b"topic-a\0" + json.dumps(action_started_event.dict(), default=str).encode("utf-8")])
+    spool.close()
+    segment = next(tmp_path.glob("*.seg"))
+    segment.write_bytes(segment.read_bytes()[:-3])  # Crashed while writing the only record
+    publisher = PubSubPublisher(spool=DiskSpool(directory=tmp_path), replay_interval=60)
+
+    publisher.start()
+    if publisher._replayer:
+        await asyncio.wait_for(publisher._replayer, timeout=1)
+
+    assert publisher.spool.is_empty()
+    assert not mock_publisher.publish.called
+    # New events aren't spooled behind the corrupt record
+    response = await publisher.publish(event=action_started_event, topic_name="topic-a")
+    assert response == {"messageIds": ["1"]}
+    await publisher.close()
+
+
+@pytest.mark.asyncio
+async def test_event_publisher_drops_spooled_events_rejected_by_pubsub(
+        mocker, tmp_path, mock_pubsub_client, action_started_event, action_complete_event
+):
+    mocker.patch("app.services.activity_logger.pubsub.PublisherClient", mock_pubsub_client.PublisherClient)
+    mock_publisher = mock_pubsub_client.PublisherClient.return_value
+    rejected = aiohttp.ClientResponseError(request_info=mocker.MagicMock(), history=(), status=400, message="Bad Request")
+    mock_publisher.publish.side_effect = AsyncMock(side_effect=[rejected, {"messageIds": ["1"]}])
+    spool = DiskSpool(directory=tmp_path)
+    spool.append([
+        b"topic-a\0" + json.dumps(action_started_event.dict(), default=str).encode("utf-8"),
+        b"topic-b\0" + json.dumps(action_complete_event.dict(), default=str).encode("utf-8"),
+    ])
+    spool.close()
+    publisher = PubSubPublisher(spool=DiskSpool(directory=tmp_path), replay_interval=60)
+
+    publisher.start()
+    await asyncio.wait_for(publisher._replayer, timeout=1)
+
+    # The rejected event doesn't hold the next one
+    assert publisher.spool.is_empty()
+    assert mock_publisher.publish.call_count == 2
+    replayed = json.loads(mock_publisher.publish.call_args_list[-1].args[1][0].data)
+    assert replayed["event_type"] == "IntegrationActionComplete"
+    await publisher.close()
+
+
+@pytest.mark.parametrize("spooled", [True, False])
+@pytest.mark.asyncio
+async def test_event_publisher_doesnt_retry_events_rejected_by_pubsub(
+        mocker, tmp_path, mock_pubsub_client, action_started_event, spooled
+):
+    mocker.patch("app.services.activity_logger.pubsub.PublisherClient", mock_pubsub_client.PublisherClient)
+    mock_publisher = mock_pubsub_client.PublisherClient.return_value
+    mock_publisher.publish.side_effect = aiohttp.ClientResponseError(
+        request_info=mocker.MagicMock(), history=(), status=400, message="Request payload size exceeds the limit"
+    )
+    publisher = PubSubPublisher(spool=DiskSpool(directory=tmp_path) if spooled else None, replay_interval=60)
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        await publisher.publish(event=action_started_event, topic_name="topic-a")
+
+    assert mock_publisher.publish.call_count == 1
+    assert publisher._replayer is None
+    if spooled:
+        assert publisher.spool.is_empty()
+    await publisher.close()
@@ -28,10 +28,12 @@ async def test_process_event_integration_created_from_pubsub(
 @pytest.mark.asyncio
 async def test_process_event_integration_updated_from_pubsub(
         mocker, mock_gundi_client_v2, mock_publish_event, mock_action_handlers, mock_config_manager,
-        pubsub_message_request_headers, integration_updated_event_as_pubsub_message
+        pubsub_message_request_headers, integration_updated_event_as_pubsub_message, gundi_api_key_cache,
+        integration_details_cache
 ):
 
     mocker.patch("app.services.config_events_consumer.config_manager", mock_config_manager)
+    mocker.spy(gundi_api_key_cache, "invalidate")
 
     response = api_client.post(
         "/config-events/",
@@ -42,15 +44,23 @@ async def test_process_event_integration_updated_from_pubsub(
     assert response.status_code == 200
     assert mock_config_manager.get_integration.called
     assert mock_config_manager.set_integration.called
+    gundi_api_key_cache.invalidate.assert_called_once()
+    # Other replicas are told to drop their cached copy
+    integration_details_cache.db_client.publish.assert_called_once()
 
 
 @pytest.mark.asyncio
 async def test_process_event_integration_deleted_from_pubsub(
         mocker, mock_gundi_client_v2, mock_publish_event, mock_action_handlers, mock_config_manager,
-        pubsub_message_request_headers, integration_deleted_event_as_pubsub_message
+        pubsub_message_request_headers, integration_deleted_event_as_pubsub_message, integration_details_cache,
+        integration_v2
 ):
 
     mocker.patch("app.services.config_events_consumer.config_manager", mock_config_manager)
+    deleted_integration = integration_v2.copy(update={"id": "c4517ce8-3c14-46c0-9c68-8978bdc34a1f"})
+    integration_details_cache.set(deleted_integration, generation=integration_details_cache.generation)
+    invalidation_hook = mocker.MagicMock()
+    integration_details_cache.add_invalidation_hook(invalidation_hook)
 
     response = api_client.post(
         "/config-events/",
@@ -60,6 +70,9 @@ async def test_process_event_integration_deleted_from_pubsub(
 
     assert response.status_code == 200
     assert mock_config_manager.delete_integration.called
+    # Caches derived from its configuration are dropped too
+    invalidation_hook.assert_called_once_with(str(deleted_integration.id))
+    assert integration_details_cache.get(str(deleted_integration.id)) is None
 
 
 @pytest.mark.asyncio
@@ -1,7 +1,13 @@
+import asyncio
+import time
+
+import httpx
 import pytest
 
 from gundi_core.schemas.v2 import IntegrationSummary, IntegrationActionConfiguration, Integration, WebhookConfiguration
+from app.conftest import async_return
 from app.services.config_manager import IntegrationConfigurationManager
+from app.services.errors import IntegrationNotFound
 
 
 @pytest.mark.asyncio
@@ -107,10 +113,65 @@ async def test_get_integration_details_with_empty_redis_db(
     assert isinstance(integration, Integration)
     assert len(integration.configurations) == len(integration_v2.configurations)
     assert integration.id == integration_v2.id
-    mock_gundi_client_v2_class.return_value.get_integration_details.assert_called_with(integration_id)
-    for config in integration_v2.configurations:
-        action_id = config.action.value
-        mock_redis_empty.Redis.return_value.get.assert_any_call(f"integrationconfig.{integration_id}.{action_id}")
+    mock_gundi_client_v2_class.return_value.get_integration_details.assert_called_once_with(integration_id)
+    mock_redis_empty.Redis.return_value.mget.assert_called_once_with(
+        [f"integration.{integration_id}", f"integrationconfig.{integration_id}.webhook"]
+    )
+    # Everything is written back in a single transaction
+    mock_redis_empty.Redis.return_value.pipeline.assert_called_once_with(transaction=True)
+    mock_redis_empty.Redis.return_value.execute.assert_called_once()
+    assert mock_redis_empty.Redis.return_value.set.call_count == len(integration_v2.configurations) + 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_reloads_share_one_request_to_gundi(
+        mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
+):
+    mocker.patch("app.services.config_manager.redis", mock_redis_empty)
+    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+
+    async def slow_get_integration_details(integration_id):
+        await asyncio.sleep(0.05)
+        return integration_v2
+
+    mock_gundi_client_v2_class.return_value.get_integration_details = mocker.AsyncMock(
+        side_effect=slow_get_integration_details
+    )
+    config_manager = IntegrationConfigurationManager()
+    integration_id = str(integration_v2.id)
+
+    results = await asyncio.gather(*[config_manager.get_integration_details(integration_id) for _ in range(10)])
+
+    assert all(integration.id == integration_v2.id for integration in results)
+    mock_gundi_client_v2_class.return_value.get_integration_details.assert_called_once_with(integration_id)
+    mock_redis_empty.Redis.return_value.lock.assert_called_once_with(
+        f"integration_reload_lock.{integration_id}", timeout=mocker.ANY, blocking_timeout=mocker.ANY
+    )
+    mock_redis_empty.Redis.return_value.lock.return_value.release.assert_called_once()
+    assert not config_manager._reloading
+
+
+@pytest.mark.asyncio
+async def test_reload_reuses_result_from_other_replica(
+        mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
+):
+    mocker.patch("app.services.config_manager.redis", mock_redis_empty)
+    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    redis_client = mock_redis_empty.Redis.return_value
+    # Another replica holds the lock, and saves the integration before releasing it
+    redis_client.lock.return_value.acquire.side_effect = lambda blocking=None: async_return(blocking is None)
+    redis_client.get.side_effect = lambda key: async_return(
+        integration_v2.json() if key == f"integration_reloaded.{integration_v2.id}" else None
+    )
+    config_manager = IntegrationConfigurationManager()
+    integration_id = str(integration_v2.id)
+
+    integration = await config_manager._reload_integration_from_gundi(integration_id)
+
+    assert integration.id == integration_v2.id
+    assert len(integration.configurations) == len(integration_v2.configurations)
+    redis_client.get.assert_called_once_with(f"integration_reloaded.{integration_id}")
+    assert not mock_gundi_client_v2_class.return_value.get_integration_details.called
 
 
 # TTL Feature Tests
@@ -294,9 +355,7 @@ async def test_get_integration_details_with_webhook_configuration(
     assert integration.webhook_configuration is not None
     assert isinstance(integration.webhook_configuration, WebhookConfiguration)
     # Verify webhook config was fetched
-    mock_redis_empty.Redis.return_value.get.assert_any_call(
-        f"integrationconfig.{integration_id}.webhook"
-    )
+    assert f"integrationconfig.{integration_id}.webhook" in mock_redis_empty.Redis.return_value.mget.call_args.args[0]
 
 
 @pytest.mark.asyncio
@@ -321,3 +380,261 @@ async def test_get_integration_details_with_ttl(
     for call in set_calls:
         assert call[0][2] == ttl  # TTL is the third argument
 
+
+
+@pytest.mark.asyncio
+async def test_get_integration_details_from_redis_in_one_round_trip(
+        mocker, mock_redis_client_in_memory, mock_gundi_client_v2_class, integration_v2, integration_v2_with_webhook,
+        integration_details_cache
+):
+    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    config_manager = IntegrationConfigurationManager()
+    config_manager.db_client = mock_redis_client_in_memory
+    integration_id = str(integration_v2.id)
+    # All the action types are configured, so there's nothing to reload from Gundi
+    configured_action_ids = [config.action.value for config in integration_v2.configurations]
+    integration_v2.type.actions = [action for action in integration_v2.type.actions if action.value in configured_action_ids]
+    await config_manager.set_integration(IntegrationSummary.from_integration(integration_v2))
+    for config in integration_v2.configurations:
+        await config_manager.set_action_configuration(integration_id, config.action.value, config)
+    webhook_configuration = integration_v2_with_webhook.webhook_configuration
+    mock_redis_client_in_memory.values[f"integrationconfig.{integration_id}.webhook"] = webhook_configuration.json()
+
+    # The first time, the action types of the integration are unknown
+    await config_manager.get_integration_details(integration_id)
+    assert mock_redis_client_in_memory.mget.call_count == 2
+    mock_redis_client_in_memory.mget.reset_mock()
+    integration_details_cache.clear()
+
+    integration = await config_manager.get_integration_details(integration_id)
+
+    mock_redis_client_in_memory.mget.assert_called_once()
+    assert not mock_redis_client_in_memory.get.called
+    assert not mock_gundi_client_v2_class.return_value.get_integration_details.called
+    assert integration.id == integration_v2.id
+    assert {c.action.value for c in integration.configurations} == set(configured_action_ids)
+    assert integration.webhook_configuration == webhook_configuration
+
+
+@pytest.mark.asyncio
+async def test_get_integration_details_serves_stale_data_while_refreshing(
+        mocker, mock_redis_client_in_memory, mock_gundi_client_v2_class, integration_v2_with_webhook,
+        integration_details_cache
+):
+    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mock_gundi_client_v2_class.return_value.get_integration_details = mocker.AsyncMock(
+        return_value=integration_v2_with_webhook
+    )
+    config_manager = IntegrationConfigurationManager()
+    config_manager.db_client = mock_redis_client_in_memory
+    integration_id = str(integration_v2_with_webhook.id)
+    # Load it with a ttl, and let the ttl expire (the data is kept for max_stale seconds more)
+    await config_manager.get_integration_details(integration_id, ttl=60, max_stale=600)
+    mock_gundi_client_v2_class.return_value.get_integration_details.assert_called_once_with(integration_id)
+    mock_redis_client_in_memory.pipeline.return_value.set.assert_any_call(f"integration.{integration_id}", mocker.ANY, 660)
+    assert mock_redis_client_in_memory.values.pop(f"integration_fresh.{integration_id}")
+    integration_details_cache.clear()
+    mock_gundi_client_v2_class.return_value.get_integration_details.reset_mock()
+
+    integration = await config_manager.get_integration_details(integration_id, ttl=60, max_stale=600)
+
+    # The stale integration is returned without waiting for Gundi, and refreshed in the background
+    assert integration.id == integration_v2_with_webhook.id
+    assert not mock_gundi_client_v2_class.return_value.get_integration_details.called
+    assert integration_details_cache.get_entry(integration_id) == (None, None)  # Stale reads aren't cached
+    assert len(config_manager._refreshes) == 1
+    await asyncio.gather(*config_manager._refreshes)
+    mock_gundi_client_v2_class.return_value.get_integration_details.assert_called_once_with(integration_id)
+    assert mock_redis_client_in_memory.values[f"integration_fresh.{integration_id}"]
+    assert integration_details_cache.get(integration_id)
+
+
+@pytest.mark.asyncio
+async def test_get_integration_details_doesnt_refresh_fresh_data(
+        mocker, mock_redis_client_in_memory, mock_gundi_client_v2_class, integration_v2_with_webhook,
+        integration_details_cache
+):
+    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mock_gundi_client_v2_class.return_value.get_integration_details = mocker.AsyncMock(
+        return_value=integration_v2_with_webhook
+    )
+    config_manager = IntegrationConfigurationManager()
+    config_manager.db_client = mock_redis_client_in_memory
+    integration_id = str(integration_v2_with_webhook.id)
+    await config_manager.get_integration_details(integration_id, ttl=60, max_stale=600)
+    integration_details_cache.clear()
+    mock_gundi_client_v2_class.return_value.get_integration_details.reset_mock()
+
+    integration = await config_manager.get_integration_details(integration_id, ttl=60, max_stale=600)
+
+    assert integration.id == integration_v2_with_webhook.id
+    assert not config_manager._refreshes
+    assert not mock_gundi_client_v2_class.return_value.get_integration_details.called
+
+
+@pytest.mark.asyncio
+async def test_get_integration_details_remembers_missing_integrations(
+        mocker, mock_redis_client_in_memory, mock_gundi_client_v2_class
+):
+    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    integration_id = "0cd1f2a8-7f7c-4a8e-9d29-2f6b1e3c4d5e"
+    request = httpx.Request("GET", f"https://gundi.local/api/v2/integrations/{integration_id}/")
+    mock_gundi_client_v2_class.return_value.get_integration_details = mocker.AsyncMock(
+        side_effect=httpx.HTTPStatusError("Not Found", request=request, response=httpx.Response(404, request=request))
+    )
+    config_manager = IntegrationConfigurationManager()
+    config_manager.db_client = mock_redis_client_in_memory
+
+    with pytest.raises(IntegrationNotFound):
+        await config_manager.get_integration_details(integration_id)
+    with pytest.raises(IntegrationNotFound):
+        await config_manager.get_integration_details(integration_id)
+
+    # Not retried, and not requested again while it's remembered as missing
+    mock_gundi_client_v2_class.return_value.get_integration_details.assert_called_once_with(integration_id)
+    assert mock_redis_client_in_memory.values[f"integration_missing.{integration_id}"]
+
+
+@pytest.mark.asyncio
+async def test_get_integration_details_from_local_cache(
+        mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2, integration_details_cache
+):
+    mocker.patch("app.services.config_manager.redis", mock_redis_empty)
+    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    config_manager = IntegrationConfigurationManager()
+    integration_id = str(integration_v2.id)
+
+    integration = await config_manager.get_integration_details(integration_id)
+    assert mock_redis_empty.Redis.return_value.mget.call_count == 1
+
+    # Served from memory, even by other config managers
+    assert await IntegrationConfigurationManager().get_integration_details(integration_id) is integration
+    assert mock_redis_empty.Redis.return_value.mget.call_count == 1
+    assert mock_gundi_client_v2_class.return_value.get_integration_details.call_count == 1
+
+    await integration_details_cache.invalidate(integration_id)
+    await config_manager.get_integration_details(integration_id)
+    assert mock_redis_empty.Redis.return_value.mget.call_count == 2
+    integration_details_cache.db_client.publish.assert_called_once_with(
+        "integration_config_invalidations", integration_id
+    )
+
+
+@pytest.mark.asyncio
+async def test_integration_details_cache_discards_reads_older_than_invalidations(integration_v2, integration_details_cache):
+    generation = integration_details_cache.generation
+    await integration_details_cache.invalidate(str(integration_v2.id))  # While the integration was being read
+
+    integration_details_cache.set(integration_v2, generation=generation)
+
+    assert integration_details_cache.get(str(integration_v2.id)) is None
+
+
+@pytest.mark.asyncio
+async def test_get_integration_details_revalidates_stale_local_cache_entries(
+        mocker, mock_redis_client_in_memory, mock_gundi_client_v2_class, integration_v2_with_webhook,
+        integration_details_cache
+):
+    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mock_gundi_client_v2_class.return_value.get_integration_details = mocker.AsyncMock(
+        return_value=integration_v2_with_webhook
+    )
+    config_manager = IntegrationConfigurationManager()
+    config_manager.db_client = mock_redis_client_in_memory
+    integration_id = str(integration_v2_with_webhook.id)
+    await config_manager.get_integration_details(integration_id, ttl=60, max_stale=600)
+    mock_redis_client_in_memory.mget.reset_mock()
+    now = time.time()
+    mock_time = mocker.patch("app.services.config_manager.time.time", return_value=now + 61)
+
+    # Past the ttl, the cached integration is returned right away and refreshed in the background
+    integration = await config_manager.get_integration_details(integration_id, ttl=60, max_stale=600)
+
+    assert integration.id == integration_v2_with_webhook.id
+    assert not mock_redis_client_in_memory.mget.called
+    await asyncio.gather(*config_manager._refreshes)
+    assert mock_gundi_client_v2_class.return_value.get_integration_details.call_count == 2
+    assert integration_details_cache.get(integration_id, ttl=60)
+
+    # Past the max staleness, it's never returned without a new read
+    mock_time.return_value = now + 61 + 661
+    mock_redis_client_in_memory.values.clear()  # Expired in Redis too
+    await config_manager.get_integration_details(integration_id, ttl=60, max_stale=600)
+    assert mock_redis_client_in_memory.mget.called
+    assert mock_gundi_client_v2_class.return_value.get_integration_details.call_count == 3
+
+
+def test_integration_details_cache_honors_the_ttl_of_callers(integration_v2, integration_details_cache):
+    integration_id = str(integration_v2.id)
+    # Read without a ttl (kept fresh by configuration events)
+    integration_details_cache.set(integration_v2, generation=integration_details_cache.generation)
+    assert integration_details_cache.get(integration_id)
+    assert integration_details_cache.get(integration_id, ttl=60) is None
+
+    integration_details_cache.set(
+        integration_v2, generation=integration_details_cache.generation, fresh_until=time.time() + 60
+    )
+    assert integration_details_cache.get(integration_id, ttl=60)
+
+    # Never kept past its freshness
+    integration_details_cache.set(
+        integration_v2, generation=integration_details_cache.generation, fresh_until=time.time() - 1
+    )
+    assert integration_details_cache.get(integration_id) is None
+
+
+@pytest.mark.asyncio
+async def test_get_integration_details_with_ttl_skips_stale_local_cache(
+        mocker, mock_redis_client_in_memory, mock_gundi_client_v2_class, integration_v2_with_webhook,
+        integration_details_cache
+):
+    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mock_gundi_client_v2_class.return_value.get_integration_details = mocker.AsyncMock(
+        return_value=integration_v2_with_webhook
+    )
+    config_manager = IntegrationConfigurationManager()
+    config_manager.db_client = mock_redis_client_in_memory
+    integration_id = str(integration_v2_with_webhook.id)
+    await config_manager.get_integration_details(integration_id, ttl=60)
+    assert integration_details_cache.get(integration_id, ttl=60)
+
+    # Once the ttl expires, it's read again from Redis (and reloaded, as the keys expired too)
+    mocker.patch("app.services.config_manager.time.time", return_value=time.time() + 61)
+    mock_redis_client_in_memory.values.clear()
+    await config_manager.get_integration_details(integration_id, ttl=60)
+
+    assert mock_gundi_client_v2_class.return_value.get_integration_details.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_integration_details_cache_invalidated_by_other_replicas(mocker, integration_v2, integration_details_cache):
+    updated, received = asyncio.Event(), asyncio.Event()
+
+    async def listen():
+        yield {"type": "subscribe", "data": 1}
+        await updated.wait()
+        yield {"type": "message", "data": str(integration_v2.id).encode("utf-8")}
+        received.set()
+        await asyncio.Event().wait()  # Keep listening
+
+    mock_pubsub = mocker.MagicMock()
+    mock_pubsub.__aenter__.return_value = mock_pubsub
+    mock_pubsub.__aexit__.return_value = None
+    mock_pubsub.subscribe = mocker.AsyncMock()
+    mock_pubsub.listen = listen
+    integration_details_cache.db_client.pubsub.return_value = mock_pubsub
+    invalidation_hook = mocker.MagicMock()
+    integration_details_cache.add_invalidation_hook(invalidation_hook)
+
+    integration_details_cache.start()
+    await asyncio.sleep(0)
+    integration_details_cache.set(integration_v2, generation=integration_details_cache.generation)
+    assert integration_details_cache.get(str(integration_v2.id))
+    updated.set()  # The integration is updated through another replica
+    await asyncio.wait_for(received.wait(), timeout=1)
+    await integration_details_cache.stop()
+
+    mock_pubsub.subscribe.assert_called_once_with("integration_config_invalidations")
+    assert integration_details_cache.get(str(integration_v2.id)) is None
+    # Hooks run for invalidations from other replicas, and for any missed while disconnected
+    assert invalidation_hook.call_args_list == [mocker.call(None), mocker.call(str(integration_v2.id))]
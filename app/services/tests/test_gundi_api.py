@@ -1,5 +1,21 @@
+import asyncio
+import gzip
+import json
+import zlib
+from unittest.mock import AsyncMock, ANY
+
+import httpx
 import pytest
-from app.services.gundi import send_events_to_gundi, send_observations_to_gundi, send_event_attachments_to_gundi
+import respx
+from app.services.gundi import (
+    post_data_to_gundi,
+    send_events_to_gundi,
+    send_observations_to_gundi,
+    send_event_attachments_to_gundi,
+    IntegrationApiKeyCache,
+    GundiDataSenderPool,
+    PooledGundiDataSenderClient,
+)
 
 
 @pytest.mark.asyncio
@@ -8,7 +24,7 @@ async def test_send_events_to_gundi(
         mock_get_gundi_api_key, integration_v2
 ):
     mocker.patch("app.services.gundi.GundiClient", mock_gundi_client_v2_class)
-    mocker.patch("app.services.gundi.GundiDataSenderClient", mock_gundi_sensors_client_class)
+    mocker.patch("app.services.gundi.PooledGundiDataSenderClient", mock_gundi_sensors_client_class)
     mocker.patch("app.services.gundi._get_gundi_api_key", mock_get_gundi_api_key)
     events = [
         {
@@ -55,7 +71,7 @@ async def test_send_event_attachments_to_gundi(
         mock_get_gundi_api_key, integration_v2
 ):
     mocker.patch("app.services.gundi.GundiClient", mock_gundi_client_v2_class)
-    mocker.patch("app.services.gundi.GundiDataSenderClient", mock_gundi_sensors_client_class)
+    mocker.patch("app.services.gundi.PooledGundiDataSenderClient", mock_gundi_sensors_client_class)
     mocker.patch("app.services.gundi._get_gundi_api_key", mock_get_gundi_api_key)
     attachments = [
         ("file1.png", b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x01\x00x\x00x\x00\x00\xff\xdb\x00C\x00\x02\x01\x01\x02'),
@@ -82,7 +98,7 @@ async def test_send_observations_to_gundi(
         mock_get_gundi_api_key, integration_v2
 ):
     mocker.patch("app.services.gundi.GundiClient", mock_gundi_client_v2_class)
-    mocker.patch("app.services.gundi.GundiDataSenderClient", mock_gundi_sensors_client_class)
+    mocker.patch("app.services.gundi.PooledGundiDataSenderClient", mock_gundi_sensors_client_class)
     mocker.patch("app.services.gundi._get_gundi_api_key", mock_get_gundi_api_key)
     observations = [
         {
@@ -121,3 +137,160 @@ async def test_send_observations_to_gundi(
     assert len(response) == 2
     assert mock_gundi_sensors_client_class.called
     mock_gundi_sensors_client_class.return_value.post_observations.assert_called_once_with(data=observations)
+
+
+@pytest.mark.asyncio
+async def test_send_observations_to_gundi_reuses_cached_api_key(
+        mocker, mock_gundi_client_v2_class, mock_gundi_sensors_client_class,
+        mock_get_gundi_api_key, mock_api_key, integration_v2
+):
+    mocker.patch("app.services.gundi.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.gundi.PooledGundiDataSenderClient", mock_gundi_sensors_client_class)
+    mocker.patch("app.services.gundi._get_gundi_api_key", mock_get_gundi_api_key)
+    observations = [
+        {
+            "source": "device-xy123",
+            "recorded_at": "2024-01-24 09:03:00-0300",
+            "location": {"lat": -51.748, "lon": -72.720}
+        }
+    ]
+
+    for _ in range(3):
+        await send_observations_to_gundi(observations=observations, integration_id=integration_v2.id)
+
+    mock_get_gundi_api_key.assert_called_once_with(integration_id=str(integration_v2.id))
+    mock_gundi_sensors_client_class.assert_called_with(session=ANY, integration_api_key=mock_api_key)
+
+
+@pytest.mark.asyncio
+async def test_post_data_to_gundi_drops_api_key_rejected_by_sensors_api(
+        mocker, mock_gundi_sensors_client_class, mock_get_gundi_api_key, integration_v2
+):
+    mocker.patch("app.services.gundi.PooledGundiDataSenderClient", mock_gundi_sensors_client_class)
+    mocker.patch("app.services.gundi._get_gundi_api_key", mock_get_gundi_api_key)
+    request = httpx.Request("POST", "https://sensors.api.gundiservice.org/v2/observations/")
+    unauthorized = httpx.HTTPStatusError(
+        "Unauthorized", request=request, response=httpx.Response(httpx.codes.UNAUTHORIZED, request=request)
+    )
+    mock_gundi_sensors_client_class.return_value.post_observations = AsyncMock(side_effect=[unauthorized, {}])
+    observations = [{"source": "device-xy123", "recorded_at": "2024-01-24 09:03:00-0300"}]
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await post_data_to_gundi(data_type="observations", data=observations, integration_id=integration_v2.id)
+    # The API key may have been rotated, so it's requested again
+    await post_data_to_gundi(data_type="observations", data=observations, integration_id=integration_v2.id)
+
+    assert mock_get_gundi_api_key.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_api_key_cache_loads_concurrent_lookups_once(mock_api_key):
+    api_key_cache = IntegrationApiKeyCache()
+
+    async def get_api_key(integration_id):
+        await asyncio.sleep(0.01)
+        return mock_api_key
+    load = AsyncMock(side_effect=get_api_key)
+
+    api_keys = await asyncio.gather(*[api_key_cache.get(integration_id="integration1", load=load) for _ in range(3)])
+
+    assert api_keys == [mock_api_key] * 3
+    load.assert_awaited_once_with(integration_id="integration1")
+
+
+@pytest.mark.asyncio
+async def test_api_key_cache_invalidate():
+    api_key_cache = IntegrationApiKeyCache()
+    load = AsyncMock(side_effect=["OldAP1K3y", "NewAP1K3y"])
+    assert await api_key_cache.get(integration_id="integration1", load=load) == "OldAP1K3y"
+
+    api_key_cache.invalidate(integration_id="integration1")
+
+    assert await api_key_cache.get(integration_id="integration1", load=load) == "NewAP1K3y"
+
+
+@pytest.mark.asyncio
+async def test_sender_pool_reuses_client_per_integration():
+    sender_pool = GundiDataSenderPool(max_clients=2)
+
+    client_1 = sender_pool.get(integration_id="integration1", api_key="K3y1")
+    assert sender_pool.get(integration_id="integration1", api_key="K3y1") is client_1
+    client_2 = sender_pool.get(integration_id="integration2", api_key="K3y2")
+    # All the clients share the same HTTP session
+    assert client_1._session is client_2._session
+    # A rotated key gets a new client
+    assert sender_pool.get(integration_id="integration1", api_key="N3wK3y1") is not client_1
+
+    await sender_pool.close()
+    assert len(sender_pool) == 0
+    assert client_1._session.is_closed
+
+
+@pytest.mark.asyncio
+async def test_sender_pool_evicts_least_recently_used_client():
+    sender_pool = GundiDataSenderPool(max_clients=2)
+    client_1 = sender_pool.get(integration_id="integration1", api_key="K3y1")
+    sender_pool.get(integration_id="integration2", api_key="K3y2")
+    sender_pool.get(integration_id="integration1", api_key="K3y1")
+
+    sender_pool.get(integration_id="integration3", api_key="K3y3")
+
+    assert len(sender_pool) == 2
+    assert sender_pool.get(integration_id="integration1", api_key="K3y1") is client_1  # integration2 was evicted
+    await sender_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pooled_sender_client_post_observations(observations_created_response):
+    async with httpx.AsyncClient() as session:
+        client = PooledGundiDataSenderClient(
+            session=session, integration_api_key="MockAP1K3y", sensors_api_base_url="https://sensors.api.gundiservice.org"
+        )
+        async with respx.mock(assert_all_called=True) as mock:
+            route = mock.post("https://sensors.api.gundiservice.org/v2/observations/").respond(
+                status_code=httpx.codes.CREATED,
+                json=observations_created_response
+            )
+
+            for _ in range(2):
+                response = await client.post_observations(data=[{"source": "device-xy123"}])
+                assert response == observations_created_response
+
+        assert route.call_count == 2
+        assert route.calls.last.request.headers["apikey"] == "MockAP1K3y"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("compression,decompress", [
+    ("gzip", gzip.decompress),
+    ("deflate", zlib.decompress),
+])
+async def test_pooled_sender_client_compresses_large_bodies(compression, decompress, observations_created_response):
+    observations = [
+        {"source": f"device-{i}", "type": "gps-radio", "subject_type": "ranger", "location": {"lat": -51.6, "lon": -72.7}}
+        for i in range(50)
+    ]
+    async with httpx.AsyncClient() as session:
+        client = PooledGundiDataSenderClient(
+            session=session, integration_api_key="MockAP1K3y", sensors_api_base_url="https://sensors.api.gundiservice.org",
+            compression=compression, compression_min_size=1024
+        )
+        async with respx.mock(assert_all_called=True) as mock:
+            route = mock.post("https://sensors.api.gundiservice.org/v2/observations/").respond(
+                status_code=httpx.codes.CREATED,
+                json=observations_created_response
+            )
+            await client.post_observations(data=observations)  # Large enough to be compressed
+            await client.post_observations(data=observations[:1])
+
+    compressed_request, small_request = [call.request for call in route.calls]
+    assert compressed_request.headers["Content-Encoding"] == compression
+    assert len(compressed_request.content) < len(json.dumps(observations))
+    assert json.loads(decompress(compressed_request.content)) == observations
+    assert "Content-Encoding" not in small_request.headers
+    assert json.loads(small_request.content) == observations[:1]
+
+
+def test_pooled_sender_client_rejects_unknown_compression():
+    with pytest.raises(ValueError):
+        PooledGundiDataSenderClient(session=httpx.AsyncClient(), integration_api_key="MockAP1K3y", compression="br")
@@ -0,0 +1,109 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+import redis
+
+from app.services.errors import OperationInProgress
+from app.services.idempotency import IdempotencyStore
+
+
+@pytest.fixture
+def idempotency_store(mock_redis_client_in_memory):
+    store = IdempotencyStore(poll_interval=0.01)
+    store.db_client = mock_redis_client_in_memory
+    return store
+
+
+@pytest.mark.asyncio
+async def test_run_once_records_result(idempotency_store):
+    func = AsyncMock(return_value={"status": "success"})
+
+    first_result = await idempotency_store.run_once(key="push_messages.dest1.msg1", func=func)
+    second_result = await idempotency_store.run_once(key="push_messages.dest1.msg1", func=func)
+
+    assert first_result == second_result == {"status": "success"}
+    func.assert_awaited_once()
+    assert idempotency_store.db_client.values["idempotency.push_messages.dest1.msg1"] == (
+        '{"status": "done", "result": {"status": "success"}}'
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_once_collapses_concurrent_duplicates(idempotency_store):
+    async def slow_operation():
+        await asyncio.sleep(0.05)
+        return {"status": "success"}
+    func = AsyncMock(side_effect=slow_operation)
+
+    results = await asyncio.gather(
+        *[idempotency_store.run_once(key="push_messages.dest1.msg1", func=func) for _ in range(3)]
+    )
+
+    assert results == [{"status": "success"}] * 3
+    func.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_run_once_waits_for_operation_pending_in_other_instance(idempotency_store):
+    other_instance = IdempotencyStore()
+    other_instance.db_client = idempotency_store.db_client
+    func = AsyncMock(return_value={"status": "success"})
+
+    async def slow_operation():
+        await asyncio.sleep(0.05)
+        return {"status": "success", "instance": "other"}
+
+    results = await asyncio.gather(
+        other_instance.run_once(key="push_messages.dest1.msg1", func=slow_operation),
+        idempotency_store.run_once(key="push_messages.dest1.msg1", func=func),
+    )
+
+    assert results == [{"status": "success", "instance": "other"}] * 2
+    func.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_run_once_stops_waiting_for_operation_pending_in_other_instance(idempotency_store):
+    idempotency_store.max_wait = 0.05
+    other_instance = IdempotencyStore()
+    other_instance.db_client = idempotency_store.db_client
+    func = AsyncMock(return_value={"status": "success"})
+    other_started = asyncio.Event()
+
+    async def stuck_operation():
+        other_started.set()
+        await asyncio.sleep(10)
+
+    other_task = asyncio.create_task(other_instance.run_once(key="push_messages.dest1.msg1", func=stuck_operation))
+    await other_started.wait()
+
+    with pytest.raises(OperationInProgress):
+        await asyncio.wait_for(idempotency_store.run_once(key="push_messages.dest1.msg1", func=func), timeout=1)
+    func.assert_not_awaited()
+    other_instance._in_flight["push_messages.dest1.msg1"].cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await other_task
+
+
+@pytest.mark.asyncio
+async def test_run_once_releases_key_on_error(idempotency_store):
+    func = AsyncMock(side_effect=[ValueError("Failed"), {"status": "success"}])
+
+    with pytest.raises(ValueError):
+        await idempotency_store.run_once(key="push_messages.dest1.msg1", func=func)
+    result = await idempotency_store.run_once(key="push_messages.dest1.msg1", func=func)
+
+    assert result == {"status": "success"}
+    assert func.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_run_once_without_redis(idempotency_store):
+    idempotency_store.db_client.set.side_effect = redis.ConnectionError("Connection refused")
+    func = AsyncMock(return_value={"status": "success"})
+
+    result = await idempotency_store.run_once(key="push_messages.dest1.msg1", func=func)
+
+    assert result == {"status": "success"}
+    func.assert_awaited_once()
@@ -0,0 +1,124 @@
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+
+from app.services.outbox import GundiOutbox, LocalOutboxBackend
+
+
+@pytest.fixture
+def outbox():
+    # No waits between retries
+    return GundiOutbox(backend=LocalOutboxBackend(), initial_wait=0, max_wait=0, max_attempts=3)
+
+
+@pytest.mark.asyncio
+async def test_outbox_send_success(mocker, outbox):
+    mock_post_data_to_gundi = AsyncMock(return_value={"object_id": "1234"})
+    mocker.patch("app.services.gundi.post_data_to_gundi", mock_post_data_to_gundi)
+
+    response = await outbox.send(data_type="observations", data=[{"source": "1"}], integration_id="integration1")
+
+    assert response == {"object_id": "1234"}
+    assert (await outbox.status())["depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_outbox_retries_failed_send_in_background(mocker, outbox):
+    mock_post_data_to_gundi = AsyncMock(
+        side_effect=[httpx.ConnectError("Connection refused"), httpx.ConnectError("Connection refused"), {}]
+    )
+    mocker.patch("app.services.gundi.post_data_to_gundi", mock_post_data_to_gundi)
+
+    response = await outbox.send(data_type="observations", data=[{"source": "1"}], integration_id="integration1")
+    assert response is None
+    assert (await outbox.status())["depth"] == 1
+
+    assert await outbox.drain_once() == 1  # Fails again, rescheduled
+    assert (await outbox.status())["depth"] == 1
+    assert await outbox.drain_once() == 1  # Delivered
+
+    assert (await outbox.status()) == {"depth": 0, "dead_letters": 0}
+    mock_post_data_to_gundi.assert_awaited_with(
+        data_type="observations", data=[{"source": "1"}], integration_id="integration1"
+    )
+
+
+@pytest.mark.asyncio
+async def test_outbox_keeps_items_in_order(mocker, outbox):
+    mock_post_data_to_gundi = AsyncMock(side_effect=httpx.ConnectError("Connection refused"))
+    mocker.patch("app.services.gundi.post_data_to_gundi", mock_post_data_to_gundi)
+    await outbox.send(data_type="observations", data=[{"source": "1"}], integration_id="integration1")
+    await outbox.send(data_type="messages", data=[{"sender": "1"}], integration_id="integration1")
+    mock_post_data_to_gundi.reset_mock(side_effect=True)
+
+    while await outbox.drain_once():
+        pass
+
+    assert [call.kwargs["data_type"] for call in mock_post_data_to_gundi.mock_calls] == ["observations", "messages"]
+
+
+@pytest.mark.asyncio
+async def test_outbox_holds_items_behind_a_failed_one(mocker, outbox):
+    mock_post_data_to_gundi = AsyncMock(
+        side_effect=[httpx.ConnectError("Connection refused"), httpx.ConnectError("Connection refused"), {}, {}]
+    )
+    mocker.patch("app.services.gundi.post_data_to_gundi", mock_post_data_to_gundi)
+    await outbox.send(data_type="observations", data=[{"source": "1"}], integration_id="integration1")
+    await outbox.send(data_type="messages", data=[{"sender": "1"}], integration_id="integration1", defer=True)
+    assert mock_post_data_to_gundi.await_count == 1  # The messages weren't tried
+
+    assert await outbox.drain_once() == 1  # The observations fail again, the messages wait behind them
+    assert mock_post_data_to_gundi.await_count == 2
+    assert await outbox.drain_once() == 1  # The observations are delivered
+    assert await outbox.drain_once() == 1  # Then the messages
+
+    assert [call.kwargs["data_type"] for call in mock_post_data_to_gundi.mock_calls] == [
+        "observations", "observations", "observations", "messages"
+    ]
+    assert (await outbox.status()) == {"depth": 0, "dead_letters": 0}
+
+
+@pytest.mark.asyncio
+async def test_outbox_holds_items_behind_a_failed_one_in_other_replicas(mocker):
+    backend = LocalOutboxBackend()
+    replica_a = GundiOutbox(backend=backend, initial_wait=20, max_wait=20, max_attempts=3)
+    replica_b = GundiOutbox(backend=backend, initial_wait=0, max_wait=0, max_attempts=3)
+    mock_post_data_to_gundi = AsyncMock(side_effect=httpx.ConnectError("Connection refused"))
+    mocker.patch("app.services.gundi.post_data_to_gundi", mock_post_data_to_gundi)
+    await replica_b.send(data_type="observations", data=[{"source": "1"}], integration_id="integration1")
+    await replica_b.send(data_type="messages", data=[{"sender": "1"}], integration_id="integration1", defer=True)
+    mock_post_data_to_gundi.reset_mock()
+
+    assert await replica_a.drain_once() == 1  # The observations fail again, retried in 20 seconds
+    assert await replica_b.drain_once() == 0  # The messages are due, but wait behind the observations
+
+    assert [call.kwargs["data_type"] for call in mock_post_data_to_gundi.mock_calls] == ["observations"]
+    assert (await replica_b.status())["depth"] == 2
+
+
+@pytest.mark.asyncio
+async def test_outbox_raises_errors_that_cannot_be_retried(mocker, outbox):
+    response = httpx.Response(status_code=400, request=httpx.Request("POST", "https://sensors.api.gundiservice.org"))
+    mock_post_data_to_gundi = AsyncMock(
+        side_effect=httpx.HTTPStatusError("Bad Request", request=response.request, response=response)
+    )
+    mocker.patch("app.services.gundi.post_data_to_gundi", mock_post_data_to_gundi)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await outbox.send(data_type="observations", data=[{"source": "1"}], integration_id="integration1")
+
+    assert (await outbox.status())["depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_outbox_gives_up_after_max_attempts(mocker, outbox):
+    mock_post_data_to_gundi = AsyncMock(side_effect=httpx.ConnectError("Connection refused"))
+    mocker.patch("app.services.gundi.post_data_to_gundi", mock_post_data_to_gundi)
+    await outbox.send(data_type="observations", data=[{"source": "1"}], integration_id="integration1")
+
+    while await outbox.drain_once():
+        pass
+
+    assert mock_post_data_to_gundi.await_count == 3
+    assert (await outbox.status()) == {"depth": 0, "dead_letters": 1}
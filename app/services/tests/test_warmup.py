@@ -0,0 +1,45 @@
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+
+from app.services.warmup import warm_up_connections
+
+
+@pytest.fixture
+def mock_gundi_client(mocker):
+    mock_client = mocker.MagicMock()
+    mock_client.base_url = "https://api.gundiservice.org"
+    mock_client.get_auth_header = AsyncMock(return_value={"authorization": "Bearer token"})
+    return mock_client
+
+
+@pytest.mark.asyncio
+async def test_warm_up_connections(mocker, mock_gundi_client):
+    mocker.patch("app.services.warmup.settings.SENSORS_API_BASE_URL", "https://sensors.api.gundiservice.org")
+    mock_sender_pool = mocker.MagicMock()
+    mock_sender_pool.warm_up = AsyncMock()
+    mocker.patch("app.services.warmup.gundi_data_sender_pool", mock_sender_pool)
+    warm_up_inreach = AsyncMock()
+
+    timings = await warm_up_connections(
+        gundi_client=mock_gundi_client,
+        extra_targets={"InReach API": warm_up_inreach}
+    )
+
+    mock_gundi_client.get_auth_header.assert_awaited_once()
+    mock_sender_pool.warm_up.assert_awaited_once()
+    warm_up_inreach.assert_awaited_once()
+    assert set(timings) == {"Gundi auth server", "Sensors API", "InReach API"}
+    assert all(timing is not None for timing in timings.values())
+
+
+@pytest.mark.asyncio
+async def test_warm_up_connections_ignores_errors(mocker, mock_gundi_client):
+    mocker.patch("app.services.warmup.settings.SENSORS_API_BASE_URL", None)
+    mock_gundi_client.get_auth_header.side_effect = httpx.ConnectError("Connection refused")
+
+    timings = await warm_up_connections(gundi_client=mock_gundi_client)
+
+    assert timings == {"Gundi auth server": None}
+    assert "Sensors API" not in timings
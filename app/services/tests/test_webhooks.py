@@ -1,5 +1,6 @@
 import base64
 import json
+import httpx
 from unittest.mock import ANY
 
 import pytest
@@ -71,7 +72,7 @@ async def test_process_webhook_request_with_dynamic_schema(
 async def test_get_integration_calls_config_manager_with_ttl(
         mocker, integration_v2_with_webhook
 ):
-    """Test that get_integration calls config_manager.get_integration_details with ttl=60"""
+    """Test that get_integration calls config_manager.get_integration_details with ttl=60 and max_stale=600"""
     mock_config_manager = mocker.patch("app.services.webhooks.config_manager")
     mock_config_manager.get_integration_details = AsyncMock(return_value=integration_v2_with_webhook)
     
@@ -87,7 +88,8 @@ async def test_get_integration_calls_config_manager_with_ttl(
     assert integration == integration_v2_with_webhook
     mock_config_manager.get_integration_details.assert_called_once_with(
         str(integration_v2_with_webhook.id), 
-        ttl=60
+        ttl=60,
+        max_stale=600
     )
 
 
@@ -113,7 +115,8 @@ async def test_get_integration_with_integration_id_header(
     assert integration == integration_v2_with_webhook
     mock_config_manager.get_integration_details.assert_called_once_with(
         str(integration_v2_with_webhook.id), 
-        ttl=60
+        ttl=60,
+        max_stale=600
     )
 
 
@@ -138,7 +141,8 @@ async def test_get_integration_with_query_param(
     assert integration == integration_v2_with_webhook
     mock_config_manager.get_integration_details.assert_called_once_with(
         str(integration_v2_with_webhook.id), 
-        ttl=60
+        ttl=60,
+        max_stale=600
     )
 
 
@@ -176,7 +180,7 @@ async def test_process_webhook_calls_config_manager_with_ttl(
         mock_get_webhook_handler_for_fixed_json_payload, mock_webhook_handler,
         mock_webhook_request_payload_for_fixed_schema
 ):
-    """Test that process_webhook calls config_manager.get_integration_details with ttl=60"""
+    """Test that process_webhook calls config_manager.get_integration_details with ttl=60 and max_stale=600"""
     mocker.patch("app.services.webhooks.get_webhook_handler", mock_get_webhook_handler_for_fixed_json_payload)
     mock_config_manager = mocker.patch("app.services.webhooks.config_manager")
     mock_config_manager.get_integration_details = AsyncMock(return_value=integration_v2_with_webhook)
@@ -193,7 +197,8 @@ async def test_process_webhook_calls_config_manager_with_ttl(
     assert response.status_code == 200
     mock_config_manager.get_integration_details.assert_called_once_with(
         str(integration_v2_with_webhook.id),
-        ttl=60
+        ttl=60,
+        max_stale=600
     )
 
 
@@ -292,7 +297,7 @@ async def test_process_webhook_reloads_from_gundi_on_cache_miss(
     assert response.status_code == 200
     
     # Verify that Redis was checked for cached data (cache miss)
-    mock_redis_empty.Redis.return_value.get.assert_called()
+    mock_redis_empty.Redis.return_value.mget.assert_called()
     
     # Verify that GundiClient was called to reload the integration
     mock_gundi_instance = mock_gundi_client_v2_class_for_webhooks.return_value.__aenter__.return_value
@@ -335,7 +340,7 @@ async def test_get_integration_reloads_from_gundi_on_cache_miss(
     assert integration.name == integration_v2_with_webhook.name
     
     # Verify that Redis was checked for cached data (cache miss)
-    mock_redis_empty.Redis.return_value.get.assert_called()
+    mock_redis_empty.Redis.return_value.mget.assert_called()
     
     # Verify that GundiClient was called to reload the integration
     mock_gundi_instance = mock_gundi_client_v2_class_for_webhooks.return_value.__aenter__.return_value
@@ -345,6 +350,36 @@ async def test_get_integration_reloads_from_gundi_on_cache_miss(
     mock_redis_empty.Redis.return_value.set.assert_called()
 
 
+@pytest.mark.asyncio
+async def test_get_integration_rate_limits_failure_events_of_missing_integrations(
+        mocker, mock_publish_event, mock_redis_client_in_memory, mock_gundi_client_v2_class_with_error
+):
+    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class_with_error)
+    request = httpx.Request("GET", "https://gundi.local/api/v2/integrations/unknown-integration-id/")
+    mock_gundi_instance = mock_gundi_client_v2_class_with_error.return_value.__aenter__.return_value
+    mock_gundi_instance.get_integration_details.side_effect = httpx.HTTPStatusError(
+        "Not Found", request=request, response=httpx.Response(404, request=request)
+    )
+    config_manager = IntegrationConfigurationManager()
+    config_manager.db_client = mock_redis_client_in_memory
+    mocker.patch("app.services.webhooks.config_manager", config_manager)
+    mocker.patch("app.services.webhooks.publish_event", mock_publish_event)
+
+    from app.services.webhooks import get_integration
+    from fastapi import Request
+
+    for _ in range(3):
+        request = Request({"type": "http", "method": "POST", "url": "http://test/webhooks"})
+        request._headers = {"x-gundi-integration-id": "unknown-integration-id"}
+        request._query_params = {}
+        assert await get_integration(request) is None
+
+    # Gundi is asked once, without retries, and only one failure event is published
+    mock_gundi_instance.get_integration_details.assert_called_once_with("unknown-integration-id")
+    mock_publish_event.assert_called_once()
+    assert "IntegrationNotFound" in str(mock_publish_event.call_args)
+
+
 @pytest.mark.asyncio
 async def test_process_webhook_handles_gundi_api_failure_gracefully(
         mocker, mock_publish_event, mock_webhook_request_payload_for_fixed_schema,
@@ -380,7 +415,7 @@ async def test_process_webhook_handles_gundi_api_failure_gracefully(
     assert integration is None
     
     # Verify that Redis was checked for cached data (cache miss)
-    mock_redis_empty.Redis.return_value.get.assert_called()
+    mock_redis_empty.Redis.return_value.mget.assert_called()
     
     # Verify that GundiClient was called but failed
     mock_gundi_instance = mock_gundi_client_v2_class_with_error.return_value.__aenter__.return_value
@@ -0,0 +1,53 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from gundi_client_v2 import GundiClient
+from app import settings
+from .gundi import gundi_data_sender_pool
+
+
+logger = logging.getLogger(__name__)
+
+
+async def _warm_up(name: str, func: Callable[[], Awaitable], timeout: float) -> Optional[float]:
+    start = time.monotonic()
+    try:
+        await asyncio.wait_for(func(), timeout=timeout)
+    except Exception as e:
+        elapsed_ms = (time.monotonic() - start) * 1000
+        logger.warning(f"Warm-up of {name} failed after {elapsed_ms:.0f} ms: {type(e).__name__}: {e}")
+        return None
+    elapsed_ms = (time.monotonic() - start) * 1000
+    logger.info(f"Warm-up of {name} took {elapsed_ms:.0f} ms.")
+    return elapsed_ms
+
+
+async def warm_up_connections(
+        gundi_client: GundiClient,
+        extra_targets: Optional[Dict[str, Callable[[], Awaitable]]] = None,
+        timeout: Optional[float] = None
+) -> Dict[str, Optional[float]]:
+    """
+    Get an access token for gundi_client (which only reaches the Gundi auth server, not the API host) and connect
+    the shared sensors API pool, plus any extra targets (name -> coroutine function), all at once.
+    Failures are logged but never raised.
+    :return: The time each target took in milliseconds, or None if it failed
+    """
+    timeout = timeout or settings.WARMUP_TIMEOUT_SECONDS
+    targets = {}
+    if gundi_client.base_url:
+        targets["Gundi auth server"] = gundi_client.get_auth_header
+    if settings.SENSORS_API_BASE_URL:
+        targets["Sensors API"] = gundi_data_sender_pool.warm_up
+    targets.update(extra_targets or {})
+
+    start = time.monotonic()
+    results = await asyncio.gather(*[_warm_up(name, func, timeout) for name, func in targets.items()])
+    timings = dict(zip(targets.keys(), results))
+    logger.info(
+        f"Connections warm-up finished in {(time.monotonic() - start) * 1000:.0f} ms "
+        f"({len([t for t in results if t is not None])}/{len(results)} targets ready)."
+    )
+    return timings
@@ -11,9 +11,20 @@ from gundi_core.events import IntegrationWebhookFailed, WebhookExecutionFailed
 from app.services.utils import DyntamicFactory
 from app.webhooks.core import get_webhook_handler, DynamicSchemaConfig, HexStringConfig, GenericJsonPayload
 from app.services.config_manager import IntegrationConfigurationManager
+from app.services.caching import TTLCache
+from app.services.errors import IntegrationNotFound
 
 config_manager = IntegrationConfigurationManager()
 logger = logging.getLogger(__name__)
+# Integrations with a recent IntegrationWebhookFailed event, so a misconfigured fleet doesn't flood them
+failure_events_sent = TTLCache(maxsize=10000, ttl=settings.WEBHOOK_FAILURE_EVENTS_INTERVAL)
+
+
+def _should_publish_failure_event(integration_id: str) -> bool:
+    if integration_id in failure_events_sent:
+        return False
+    failure_events_sent.set(integration_id, True)
+    return True
 
 
 async def get_integration(request):
@@ -24,25 +35,34 @@ async def get_integration(request):
     if integration_id:
         try:
             # Retry on httpx.HTTPError (StatusError, Timeout, ConnectError, etc.)
-            for attempt in stamina.retry_context(on=httpx.HTTPError, wait_initial=10.0, wait_jitter=10.0, wait_max=300.0):
+            async for attempt in stamina.retry_context(on=httpx.HTTPError, wait_initial=10.0, wait_jitter=10.0, wait_max=300.0):
                 with attempt:
-                    # Cache the integration details and webhook config for 60 seconds. 
+                    # Cache the integration details and webhook config for a while, once expired they are still
+                    # used (up to the max staleness) while they are refreshed in the background.
                     # ToDo: Refactor to event-driven webhook config updates (as in actions)
-                    integration = await config_manager.get_integration_details(integration_id, ttl=60)
+                    integration = await config_manager.get_integration_details(
+                        integration_id,
+                        ttl=settings.WEBHOOK_CONFIG_TTL,
+                        max_stale=settings.WEBHOOK_CONFIG_MAX_STALENESS
+                    )
         except Exception as e:
             error_message = f"Error retrieving integration '{integration_id}': {type(e).__name__}: {e}"
-            logger.exception(error_message)
-            await publish_event(
-                event=IntegrationWebhookFailed(
-                    payload=WebhookExecutionFailed(
-                        integration_id=str(integration_id),
-                        webhook_id=None,
-                        config_data={},
-                        error=error_message
-                    )
-                ),
-                topic_name=settings.INTEGRATION_EVENTS_TOPIC,
-            )
+            if isinstance(e, IntegrationNotFound):  # Expected for unknown or deleted integrations
+                logger.warning(error_message)
+            else:
+                logger.exception(error_message)
+            if _should_publish_failure_event(str(integration_id)):
+                await publish_event(
+                    event=IntegrationWebhookFailed(
+                        payload=WebhookExecutionFailed(
+                            integration_id=str(integration_id),
+                            webhook_id=None,
+                            config_data={},
+                            error=error_message
+                        )
+                    ),
+                    topic_name=settings.INTEGRATION_EVENTS_TOPIC,
+                )
     return integration
 
 
@@ -74,3 +74,72 @@ INTEGRATION_EVENTS_TOPIC = env.str("INTEGRATION_EVENTS_TOPIC", "integration-even
 default_commands_topic = f"{INTEGRATION_TYPE_SLUG}-actions-topic" if INTEGRATION_TYPE_SLUG else None
 INTEGRATION_COMMANDS_TOPIC = env.str("INTEGRATION_COMMANDS_TOPIC", default_commands_topic)
 TRIGGER_ACTIONS_ALWAYS_SYNC = env.bool("TRIGGER_ACTIONS_ALWAYS_SYNC", False)
+# Events are published to PubSub in batches, when a batch is full or after a short delay
+PUBSUB_PUBLISHER_MAX_BATCH_SIZE = env.int("PUBSUB_PUBLISHER_MAX_BATCH_SIZE", 100)  # PubSub allows up to 1000
+PUBSUB_PUBLISHER_MAX_LATENCY = env.float("PUBSUB_PUBLISHER_MAX_LATENCY", 0.05)  # Seconds
+PUBSUB_PUBLISHER_TIMEOUT = env.float("PUBSUB_PUBLISHER_TIMEOUT", 20.0)  # Seconds
+# Events that can't be published are saved in a local spool and replayed later (disabled if no directory is set)
+ACTIVITY_LOGS_SPOOL_DIR = env.str("ACTIVITY_LOGS_SPOOL_DIR", None)
+ACTIVITY_LOGS_SPOOL_SEGMENT_SIZE = env.int("ACTIVITY_LOGS_SPOOL_SEGMENT_SIZE", 4 * 1024 * 1024)  # Bytes
+ACTIVITY_LOGS_SPOOL_MAX_SIZE = env.int("ACTIVITY_LOGS_SPOOL_MAX_SIZE", 512 * 1024 * 1024)  # Bytes
+ACTIVITY_LOGS_SPOOL_REPLAY_INTERVAL = env.float("ACTIVITY_LOGS_SPOOL_REPLAY_INTERVAL", 5.0)  # Seconds, after failures
+# Publish activity logs from background workers, so that actions and webhooks don't wait for PubSub
+ACTIVITY_LOGS_IN_BACKGROUND = env.bool("ACTIVITY_LOGS_IN_BACKGROUND", False)
+ACTIVITY_LOGS_QUEUE_SIZE = env.int("ACTIVITY_LOGS_QUEUE_SIZE", 10000)  # Events, DEBUG ones are dropped first when full
+ACTIVITY_LOGS_WORKERS = env.int("ACTIVITY_LOGS_WORKERS", 2)
+ACTIVITY_LOGS_SHUTDOWN_TIMEOUT = env.float("ACTIVITY_LOGS_SHUTDOWN_TIMEOUT", 10.0)  # Seconds
+# DEBUG activity logs: "all", "sample" (publish a fraction of them) or "coalesce" (publish a summary per window)
+ACTIVITY_LOGS_DEBUG_POLICY = env.str("ACTIVITY_LOGS_DEBUG_POLICY", "all")
+ACTIVITY_LOGS_DEBUG_SAMPLE_RATE = env.float("ACTIVITY_LOGS_DEBUG_SAMPLE_RATE", 0.1)  # Per integration and action
+ACTIVITY_LOGS_DEBUG_COALESCE_WINDOW = env.float("ACTIVITY_LOGS_DEBUG_COALESCE_WINDOW", 60.0)  # Seconds
+
+# Idempotent processing of redelivered messages (e.g. PubSub retries)
+IDEMPOTENCY_TTL = env.int("IDEMPOTENCY_TTL", 60 * 60 * 24 * 7)  # PubSub retains unacked messages for up to 7 days
+IDEMPOTENCY_PENDING_TTL = env.int("IDEMPOTENCY_PENDING_TTL", 60 * 10)  # Longer than MAX_ACTION_EXECUTION_TIME
+IDEMPOTENCY_POLL_INTERVAL = env.float("IDEMPOTENCY_POLL_INTERVAL", 0.5)  # Seconds
+IDEMPOTENCY_MAX_WAIT = env.float("IDEMPOTENCY_MAX_WAIT", 60.0)  # Seconds. Then fail and let PubSub redeliver it later
+
+# Open connections to the configured APIs on startup, to cut the latency of the first requests after a cold start
+WARMUP_CONNECTIONS_ON_START = env.bool("WARMUP_CONNECTIONS_ON_START", False)
+WARMUP_TIMEOUT_SECONDS = env.float("WARMUP_TIMEOUT_SECONDS", 5.0)  # Per endpoint
+
+# In-memory cache of integration API keys used to send data to Gundi (dropped on 401 responses)
+GUNDI_API_KEY_CACHE_TTL = env.float("GUNDI_API_KEY_CACHE_TTL", 60.0 * 10)  # Seconds
+GUNDI_API_KEY_CACHE_MAX_SIZE = env.int("GUNDI_API_KEY_CACHE_MAX_SIZE", 1000)
+
+# In-memory cache of integration configurations, invalidated by configuration events across replicas
+CONFIG_LOCAL_CACHE_TTL = env.float("CONFIG_LOCAL_CACHE_TTL", 300.0)  # Seconds, in case an invalidation is missed
+CONFIG_LOCAL_CACHE_MAX_SIZE = env.int("CONFIG_LOCAL_CACHE_MAX_SIZE", 1000)
+CONFIG_INVALIDATION_CHANNEL = env.str("CONFIG_INVALIDATION_CHANNEL", "integration_config_invalidations")
+CONFIG_INVALIDATION_RETRY_INTERVAL = env.float("CONFIG_INVALIDATION_RETRY_INTERVAL", 5.0)  # Seconds
+# Only one replica reloads an integration from Gundi at a time, the others wait and reuse the result
+CONFIG_RELOAD_LOCK_TIMEOUT = env.float("CONFIG_RELOAD_LOCK_TIMEOUT", 60.0)  # Seconds, in case the holder dies
+CONFIG_RELOAD_LOCK_WAIT = env.float("CONFIG_RELOAD_LOCK_WAIT", 30.0)  # Seconds, then reload without the lock
+CONFIG_RELOAD_RESULT_TTL = env.int("CONFIG_RELOAD_RESULT_TTL", 10)  # Seconds
+# Integrations not found in Gundi aren't requested again for a while
+CONFIG_MISSING_INTEGRATION_TTL = env.int("CONFIG_MISSING_INTEGRATION_TTL", 60)  # Seconds
+# Integrations used by webhooks are refreshed after a while, serving the cached ones in the meantime
+WEBHOOK_CONFIG_TTL = env.int("WEBHOOK_CONFIG_TTL", 60)  # Seconds
+WEBHOOK_CONFIG_MAX_STALENESS = env.int("WEBHOOK_CONFIG_MAX_STALENESS", 600)  # Seconds after the ttl (0 = disabled)
+# At most one IntegrationWebhookFailed event per integration in this interval, per replica
+WEBHOOK_FAILURE_EVENTS_INTERVAL = env.float("WEBHOOK_FAILURE_EVENTS_INTERVAL", 60.0)  # Seconds
+
+# Pool of sensors API clients (one per integration, all sharing keep-alive connections)
+GUNDI_SENDER_POOL_MAX_CLIENTS = env.int("GUNDI_SENDER_POOL_MAX_CLIENTS", 500)
+GUNDI_SENDER_POOL_MAX_CONNECTIONS = env.int("GUNDI_SENDER_POOL_MAX_CONNECTIONS", 50)
+GUNDI_SENDER_POOL_KEEPALIVE_EXPIRY = env.float("GUNDI_SENDER_POOL_KEEPALIVE_EXPIRY", 60.0)  # Seconds
+GUNDI_SENDER_TIMEOUT = env.float("GUNDI_SENDER_TIMEOUT", 120.0)  # Seconds
+# Compression of the JSON bodies sent to the sensors API: "gzip", "deflate" or empty (disabled)
+GUNDI_SENDER_COMPRESSION = env.str("GUNDI_SENDER_COMPRESSION", None) or None
+GUNDI_SENDER_COMPRESSION_MIN_SIZE = env.int("GUNDI_SENDER_COMPRESSION_MIN_SIZE", 1024)  # Bytes, smaller bodies are sent as is
+GUNDI_SENDER_COMPRESSION_LEVEL = env.int("GUNDI_SENDER_COMPRESSION_LEVEL", 6)  # 1 (fastest) to 9 (smallest)
+
+# Outbox for data that couldn't be sent to Gundi (retried in the background)
+GUNDI_OUTBOX_BACKEND = env.str("GUNDI_OUTBOX_BACKEND", "redis")  # "redis" or "local" (in memory)
+GUNDI_OUTBOX_RETRY_INITIAL_WAIT = env.float("GUNDI_OUTBOX_RETRY_INITIAL_WAIT", 10.0)  # Seconds
+GUNDI_OUTBOX_RETRY_MAX_WAIT = env.float("GUNDI_OUTBOX_RETRY_MAX_WAIT", 300.0)  # Seconds
+GUNDI_OUTBOX_MAX_ATTEMPTS = env.int("GUNDI_OUTBOX_MAX_ATTEMPTS", 30)
+GUNDI_OUTBOX_POLL_INTERVAL = env.float("GUNDI_OUTBOX_POLL_INTERVAL", 1.0)  # Seconds
+GUNDI_OUTBOX_LEASE_SECONDS = env.float("GUNDI_OUTBOX_LEASE_SECONDS", 120.0)  # Before another replica can retry an item
+GUNDI_OUTBOX_CLAIM_SIZE = env.int("GUNDI_OUTBOX_CLAIM_SIZE", 10)
+GUNDI_OUTBOX_MAX_DEAD_LETTERS = env.int("GUNDI_OUTBOX_MAX_DEAD_LETTERS", 1000)
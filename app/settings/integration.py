@@ -3,3 +3,48 @@ from environs import Env
 env = Env()
 
 TRACING_ENABLED = env.bool("TRACING_ENABLED", True)
+
+# InReach client connection pooling
+INREACH_CLIENT_POOL_MAX_CLIENTS = env.int("INREACH_CLIENT_POOL_MAX_CLIENTS", 100)
+INREACH_CLIENT_POOL_MAX_CONNECTIONS = env.int("INREACH_CLIENT_POOL_MAX_CONNECTIONS", 100)  # Per API URL
+INREACH_CLIENT_POOL_MAX_CONNECTIONS_PER_TENANT = env.int("INREACH_CLIENT_POOL_MAX_CONNECTIONS_PER_TENANT", 10)
+INREACH_CLIENT_POOL_IDLE_TIMEOUT = env.float("INREACH_CLIENT_POOL_IDLE_TIMEOUT", 300.0)  # Seconds
+INREACH_CLIENT_KEEPALIVE_EXPIRY = env.float("INREACH_CLIENT_KEEPALIVE_EXPIRY", 60.0)  # Seconds
+
+# Micro-batching of messages pushed to InReach (set the window to 0 to disable it)
+INREACH_BATCH_WINDOW_SECONDS = env.float("INREACH_BATCH_WINDOW_SECONDS", 0.1)
+INREACH_BATCH_MAX_SIZE = env.int("INREACH_BATCH_MAX_SIZE", 25)
+
+# Adaptive (AIMD) concurrency limits per InReach account. Use the "redis" backend to share them across replicas
+# (it costs about 3 round trips to Redis per request).
+INREACH_RATE_LIMITER_BACKEND = env.str("INREACH_RATE_LIMITER_BACKEND", "local")  # "redis" or "local"
+INREACH_RATE_LIMITER_INITIAL_LIMIT = env.float("INREACH_RATE_LIMITER_INITIAL_LIMIT", 5.0)
+INREACH_RATE_LIMITER_MIN_LIMIT = env.float("INREACH_RATE_LIMITER_MIN_LIMIT", 1.0)
+INREACH_RATE_LIMITER_MAX_LIMIT = env.float("INREACH_RATE_LIMITER_MAX_LIMIT", 20.0)
+INREACH_RATE_LIMITER_INCREASE_STEP = env.float("INREACH_RATE_LIMITER_INCREASE_STEP", 0.1)  # Added on each success
+INREACH_RATE_LIMITER_DECREASE_FACTOR = env.float("INREACH_RATE_LIMITER_DECREASE_FACTOR", 0.5)  # Applied when throttled
+INREACH_RATE_LIMITER_MAX_WAIT_SECONDS = env.float("INREACH_RATE_LIMITER_MAX_WAIT_SECONDS", 30.0)
+INREACH_RATE_LIMITER_STATE_TTL = env.int("INREACH_RATE_LIMITER_STATE_TTL", 600)  # Seconds
+# Slots expire on their own after this, in case they are never released (e.g. a replica crashed)
+INREACH_RATE_LIMITER_LEASE_SECONDS = env.float("INREACH_RATE_LIMITER_LEASE_SECONDS", 120.0)
+
+# Circuit breaker for the InReach API (one per API URL)
+INREACH_CIRCUIT_BREAKER_FAILURE_RATE_THRESHOLD = env.float("INREACH_CIRCUIT_BREAKER_FAILURE_RATE_THRESHOLD", 0.5)
+INREACH_CIRCUIT_BREAKER_MINIMUM_CALLS = env.int("INREACH_CIRCUIT_BREAKER_MINIMUM_CALLS", 10)
+INREACH_CIRCUIT_BREAKER_WINDOW_SIZE = env.int("INREACH_CIRCUIT_BREAKER_WINDOW_SIZE", 20)  # Last N calls
+INREACH_CIRCUIT_BREAKER_OPEN_SECONDS = env.float("INREACH_CIRCUIT_BREAKER_OPEN_SECONDS", 30.0)
+INREACH_CIRCUIT_BREAKER_HALF_OPEN_MAX_CALLS = env.int("INREACH_CIRCUIT_BREAKER_HALF_OPEN_MAX_CALLS", 1)
+
+# Cache of successful credential checks (pingback)
+INREACH_AUTH_CACHE_TTL = env.float("INREACH_AUTH_CACHE_TTL", 300.0)  # Seconds
+INREACH_AUTH_CACHE_MAX_SIZE = env.int("INREACH_AUTH_CACHE_MAX_SIZE", 1000)
+
+# Pre-flight validation of IPC messages. When enabled, out-of-range fields are repaired instead of rejected.
+INREACH_REPAIR_INVALID_MESSAGES = env.bool("INREACH_REPAIR_INVALID_MESSAGES", True)
+
+# InReach API URLs to connect to on startup (see WARMUP_CONNECTIONS_ON_START). Defaults to the InReach API URL.
+INREACH_WARMUP_API_URLS = env.list("INREACH_WARMUP_API_URLS", [])
+
+# Data received in webhooks is sent to Gundi in batches, a few at a time
+WEBHOOK_GUNDI_BATCH_SIZE = env.int("WEBHOOK_GUNDI_BATCH_SIZE", 200)
+WEBHOOK_GUNDI_MAX_CONCURRENT_BATCHES = env.int("WEBHOOK_GUNDI_MAX_CONCURRENT_BATCHES", 4)
@@ -1,7 +1,11 @@
+import asyncio
 import logging
+from typing import Awaitable, Callable, List
 
+from app import settings
 from app.services.activity_logger import webhook_activity_logger
-from app.services.gundi import send_observations_to_gundi, _get_gundi_api_key, send_messages_to_gundi
+from app.services.outbox import gundi_outbox
+from app.services.utils import generate_batches
 from .configurations import InReachWebhookPayload, InReachWebhookConfig
 from .inreach import InreachEvent, MessageCodeEnum
 
@@ -54,6 +58,28 @@ def build_observation_from_inreach_event(inreach_event: InreachEvent):
     }
 
 
+async def send_in_batches(send_batch: Callable[[List[dict]], Awaitable], items: List[dict]):
+    """
+    Send items to Gundi in batches of up to WEBHOOK_GUNDI_BATCH_SIZE, with a few batches in flight at a time.
+    Each batch is retried on its own (see GundiOutbox). The first error is raised once all batches are done.
+    """
+    semaphore = asyncio.Semaphore(settings.WEBHOOK_GUNDI_MAX_CONCURRENT_BATCHES)
+
+    async def send(batch):
+        async with semaphore:
+            return await send_batch(batch)
+
+    results = await asyncio.gather(
+        *[send(batch) for batch in generate_batches(items, settings.WEBHOOK_GUNDI_BATCH_SIZE)],
+        return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        logger.error(f"{len(errors)} of {len(results)} batches couldn't be sent to Gundi.")
+        raise errors[0]
+    return results
+
+
 @webhook_activity_logger()
 async def webhook_handler(payload: InReachWebhookPayload, integration=None, webhook_config: InReachWebhookConfig = None):
     observations = []
@@ -70,8 +96,20 @@ async def webhook_handler(payload: InReachWebhookPayload, integration=None, webh
     # Send the final data to gundi
     integration_id = str(integration.id)
     # Observations sent first so that subjects and sources are created
+    # Batches that can't be delivered now are retried later from the outbox, so the webhook doesn't wait for them
+    observations_deferred = False
     if observations:
-        await send_observations_to_gundi(observations=observations, integration_id=integration_id)
+        results = await send_in_batches(
+            send_batch=lambda batch: gundi_outbox.send(data_type="observations", data=batch, integration_id=integration_id),
+            items=observations
+        )
+        observations_deferred = any(result is None for result in results)
     if messages:
-        await send_messages_to_gundi(messages=messages, integration_id=integration_id)
+        # If some observations are in the outbox, the messages must wait behind them
+        await send_in_batches(
+            send_batch=lambda batch: gundi_outbox.send(
+                data_type="messages", data=batch, integration_id=integration_id, defer=observations_deferred
+            ),
+            items=messages
+        )
     return {"total_observations": len(observations), "total_messages": len(messages)}
@@ -18,14 +18,7 @@ def gundi_api_data_received_response():
 
 
 @pytest.fixture
-def mock_send_observations_to_gundi(gundi_api_data_received_response):
-    return AsyncMock(
-        return_value=gundi_api_data_received_response
-    )
-
-
-@pytest.fixture
-def mock_send_messages_to_gundi(gundi_api_data_received_response):
+def mock_post_data_to_gundi(gundi_api_data_received_response):
     return AsyncMock(
         return_value=gundi_api_data_received_response
     )
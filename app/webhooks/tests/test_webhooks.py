@@ -1,8 +1,13 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock
+
+import httpx
 import pytest
 
-from app.webhooks.configurations import InReachWebhookConfig
+from app.webhooks.configurations import InReachWebhookConfig, InReachWebhookPayload
 from app.webhooks.handlers import webhook_handler, build_observation_from_inreach_event, \
-    build_message_from_inreach_event
+    build_message_from_inreach_event, send_in_batches
 
 
 # Test data transformations
@@ -59,8 +64,7 @@ def test_build_observation_from_inreach_event(inreach_event):
 @pytest.mark.asyncio
 async def test_webhook_handler_processes_inreach_event_success(
         mocker,
-        mock_send_observations_to_gundi,
-        mock_send_messages_to_gundi,
+        mock_post_data_to_gundi,
         mock_publish_event,
         inreach_integration_with_webhook,
         inreach_webhook_request_payload,
@@ -68,8 +72,7 @@ async def test_webhook_handler_processes_inreach_event_success(
 ):
 
     mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
-    mocker.patch("app.webhooks.handlers.send_observations_to_gundi", mock_send_observations_to_gundi)
-    mocker.patch("app.webhooks.handlers.send_messages_to_gundi", mock_send_messages_to_gundi)
+    mocker.patch("app.services.gundi.post_data_to_gundi", mock_post_data_to_gundi)
 
     result = await webhook_handler(
         payload=inreach_webhook_request_payload,
@@ -87,16 +90,91 @@ async def test_webhook_handler_processes_inreach_event_success(
         expected_total_observations = 0
     assert result == {"total_observations": expected_total_observations, "total_messages": expected_total_messages}
 
+    post_data_calls = {call.kwargs["data_type"]: call for call in mock_post_data_to_gundi.mock_calls}
+    assert mock_post_data_to_gundi.call_count == len(post_data_calls)
     if expected_total_observations > 0:
-        assert mock_send_observations_to_gundi.call_count == 1
-        post_observations_call = mock_send_observations_to_gundi.mock_calls[0]
+        post_observations_call = post_data_calls["observations"]
         assert post_observations_call.kwargs["integration_id"] == str(inreach_integration_with_webhook.id)
         expected_observations = [build_observation_from_inreach_event(event) for event in inreach_webhook_request_payload.Events]
-        assert post_observations_call.kwargs["observations"] == expected_observations
+        assert post_observations_call.kwargs["data"] == expected_observations
 
     if expected_total_messages > 0:
-        assert mock_send_messages_to_gundi.call_count == 1
-        send_messages_call = mock_send_messages_to_gundi.mock_calls[0]
+        send_messages_call = post_data_calls["messages"]
         assert send_messages_call.kwargs["integration_id"] == str(inreach_integration_with_webhook.id)
         expected_messages = [build_message_from_inreach_event(event) for event in inreach_webhook_request_payload.Events]
-        assert send_messages_call.kwargs["messages"] == expected_messages
+        assert send_messages_call.kwargs["data"] == expected_messages
+
+
+@pytest.mark.asyncio
+async def test_webhook_handler_sends_data_in_batches(
+        mocker,
+        mock_publish_event,
+        inreach_integration_with_webhook,
+        inreach_event_as_dict,
+):
+    mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
+    mocker.patch("app.webhooks.handlers.settings.WEBHOOK_GUNDI_BATCH_SIZE", 2)
+    sent_batches = []
+
+    async def post_data_to_gundi(data_type, data, integration_id):
+        if data_type == "observations":
+            await asyncio.sleep(0.01)
+        sent_batches.append((data_type, len(data)))
+        return {"object_id": "1234"}
+
+    mocker.patch("app.services.gundi.post_data_to_gundi", post_data_to_gundi)
+    payload = InReachWebhookPayload(Version="2.0", Events=[inreach_event_as_dict] * 5)
+
+    result = await webhook_handler(
+        payload=payload,
+        integration=inreach_integration_with_webhook,
+        webhook_config=InReachWebhookConfig(include_messages=True, include_observations=True)
+    )
+
+    assert result == {"total_observations": 5, "total_messages": 5}
+    # All the observations are sent before the messages
+    assert sorted(sent_batches[:3]) == [("observations", 1), ("observations", 2), ("observations", 2)]
+    assert sent_batches[3:] == [("messages", 2), ("messages", 2), ("messages", 1)]
+
+
+@pytest.mark.asyncio
+async def test_send_in_batches_sends_all_batches_despite_errors(mocker):
+    mocker.patch("app.webhooks.handlers.settings.WEBHOOK_GUNDI_BATCH_SIZE", 2)
+    send_batch = AsyncMock(side_effect=[{}, httpx.ConnectError("Connection refused"), {}])
+
+    with pytest.raises(httpx.ConnectError):
+        await send_in_batches(send_batch=send_batch, items=[{"id": i} for i in range(6)])
+
+    assert send_batch.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_webhook_handler_saves_data_in_outbox_when_gundi_is_down(
+        mocker,
+        mock_publish_event,
+        inreach_integration_with_webhook,
+        inreach_webhook_request_payload,
+        gundi_outbox,
+):
+    mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
+    mock_post_data_to_gundi = AsyncMock(side_effect=httpx.ConnectError("Connection refused"))
+    mocker.patch("app.services.gundi.post_data_to_gundi", mock_post_data_to_gundi)
+
+    result = await webhook_handler(
+        payload=inreach_webhook_request_payload,
+        integration=inreach_integration_with_webhook,
+        webhook_config=InReachWebhookConfig(include_messages=True, include_observations=True)
+    )
+
+    # The webhook is processed without waiting for retries
+    assert result == {"total_observations": 1, "total_messages": 1}
+    # The messages aren't sent ahead of the observations, they wait behind them in the outbox
+    assert mock_post_data_to_gundi.await_count == 1
+    assert mock_post_data_to_gundi.await_args.kwargs["data_type"] == "observations"
+    assert (await gundi_outbox.status())["depth"] == 2
+    mock_post_data_to_gundi.reset_mock(side_effect=True)
+    mock_post_data_to_gundi.return_value = {"object_id": "1234"}
+    now = time.time()
+    for item in await gundi_outbox.backend.claim(now=now + 3600, limit=10, lease_until=now):  # As if due
+        await gundi_outbox._retry(item)
+    assert [c.kwargs["data_type"] for c in mock_post_data_to_gundi.await_args_list] == ["observations", "messages"]
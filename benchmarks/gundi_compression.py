@@ -0,0 +1,122 @@
+"""
+Benchmark: compression of the observation batches sent to the sensors API.
+
+Builds typical InReach observation batches with build_observation_from_inreach_event() and posts them
+through PooledGundiDataSenderClient to an in-process transport, with compression disabled, gzip and deflate.
+Reports the bytes on the wire and the end-to-end latency per batch: encoding and compression on our side,
+transfer at the given uplink bandwidth, and decompression and parsing on the receiving side.
+
+Usage:
+    TRACING_ENABLED=false python -m benchmarks.gundi_compression [batch_size] [bandwidth_mbps] [iterations]
+"""
+import asyncio
+import datetime
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+import zlib
+
+os.environ.setdefault("TRACING_ENABLED", "false")
+
+import httpx  # noqa: E402
+from app.services.gundi import PooledGundiDataSenderClient  # noqa: E402
+from app.webhooks.handlers import build_observation_from_inreach_event  # noqa: E402
+from app.webhooks.inreach import InreachEvent  # noqa: E402
+
+
+DECOMPRESSORS = {"gzip": gzip.decompress, "deflate": zlib.decompress}
+
+
+def build_observations(count: int):
+    timestamp = datetime.datetime(2025, 6, 4, 13, 35, 10, tzinfo=datetime.timezone.utc)
+    return [
+        build_observation_from_inreach_event(
+            InreachEvent.parse_obj(
+                {
+                    "imei": f"30043406393{i % 20:04d}",
+                    "messageCode": 0,
+                    "freeText": None,
+                    "timeStamp": timestamp + datetime.timedelta(seconds=i * 30),
+                    "addresses": [],
+                    "point": {
+                        "latitude": -51.688645 + i / 10000,
+                        "longitude": -72.704421 - i / 10000,
+                        "altitude": 1520 + i % 7,
+                        "gpsFix": 2,
+                        "course": (45 + i) % 360,
+                        "speed": i % 15,
+                    },
+                    "status": {"autonomous": 0, "lowBattery": 0, "intervalChange": 0, "resetDetected": 0},
+                }
+            )
+        )
+        for i in range(count)
+    ]
+
+
+def make_transport(bandwidth_mbps: float, stats: dict) -> httpx.MockTransport:
+    bytes_per_second = bandwidth_mbps * 1e6 / 8
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = request.content
+        stats["bytes"] = len(body)
+        await asyncio.sleep(len(body) / bytes_per_second)  # Time on the wire
+        if encoding := request.headers.get("Content-Encoding"):
+            body = DECOMPRESSORS[encoding](body)
+        observations = json.loads(body)
+        return httpx.Response(status_code=httpx.codes.CREATED, json={"observations": len(observations)})
+
+    return httpx.MockTransport(handler)
+
+
+async def run(observations, compression, bandwidth_mbps: float, iterations: int) -> dict:
+    stats = {}
+    async with httpx.AsyncClient(transport=make_transport(bandwidth_mbps, stats)) as session:
+        client = PooledGundiDataSenderClient(
+            session=session, integration_api_key="B3nchK3y", sensors_api_base_url="https://sensors.api.local",
+            compression=compression, compression_min_size=0
+        )
+        encode_seconds = min(
+            _time(lambda: client._encode_json(observations)) for _ in range(iterations)
+        )
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            await client.post_observations(data=observations)
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "bytes": stats["bytes"],
+        "encode_ms": encode_seconds * 1000,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def _time(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main(batch_size: int = 200, bandwidth_mbps: float = 10.0, iterations: int = 50):
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    observations = build_observations(batch_size)
+    print(f"{batch_size} observations per batch, {bandwidth_mbps:g} Mbit/s uplink, {iterations} iterations")
+    print(f"{'compression':>12} {'bytes':>9} {'ratio':>6} {'encode ms':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    baseline = None
+    for compression in [None, "gzip", "deflate"]:
+        result = asyncio.run(run(observations, compression, bandwidth_mbps, iterations))
+        baseline = baseline or result["bytes"]
+        print(
+            f"{compression or 'none':>12} {result['bytes']:>9} {result['bytes'] / baseline:>6.1%} "
+            f"{result['encode_ms']:>10.2f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:4]
+    main(*[cast(arg) for cast, arg in zip([int, float, int], args)])
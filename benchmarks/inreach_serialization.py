@@ -0,0 +1,67 @@
+"""
+Microbenchmark: encoding of the IPC messages envelope sent to InReach.
+
+Compares the legacy path (per-message json() + loads, a dumps/loads round trip in _call_api,
+then json.dumps in httpx) against serialize_messages(), which encodes to bytes once.
+
+Usage:
+    TRACING_ENABLED=false python -m benchmarks.inreach_serialization [batch_size] [iterations]
+"""
+import datetime
+import json
+import os
+import sys
+import timeit
+
+os.environ.setdefault("TRACING_ENABLED", "false")
+
+from gundi_core.schemas.v2.inreach import InReachIPCMessage  # noqa: E402
+from app.actions.inreach_client import serialize_messages  # noqa: E402
+
+
+def build_messages(count: int):
+    timestamp = datetime.datetime(2025, 6, 4, 13, 35, 10, tzinfo=datetime.timezone.utc)
+    return [
+        InReachIPCMessage.parse_obj(
+            {
+                "Message": f"Patrol update {i}: all clear at the north gate.",
+                "Recipients": ["300434063930450"],
+                "Sender": "admin@sitex.pamdas.org",
+                "ReferencePoint": {
+                    "Altitude": 1520,
+                    "Coordinate": {"Latitude": -51.688645 + i / 1000, "Longitude": -72.704421},
+                    "Course": 45,
+                    "Label": "Gate",
+                    "Speed": 12
+                },
+                "Timestamp": timestamp + datetime.timedelta(seconds=i)
+            }
+        )
+        for i in range(count)
+    ]
+
+
+def legacy_serialize_messages(ipc_messages):
+    messages = [json.loads(msg.json()) for msg in ipc_messages]  # InReachClient.send_messages
+    clean_data = json.loads(json.dumps({"Messages": messages}, default=str))  # InReachClient._call_api
+    return json.dumps(clean_data).encode("utf-8")  # httpx (json=)
+
+
+def main(batch_size: int = 1, iterations: int = 20000):
+    ipc_messages = build_messages(batch_size)
+    legacy_body = legacy_serialize_messages(ipc_messages)
+    body = serialize_messages(ipc_messages)
+    assert body == legacy_body, "The encoded body differs from the legacy serialization"
+    print(f"Identical output: {len(body)} bytes for {batch_size} message(s).")
+
+    results = {}
+    for name, func in [("legacy", legacy_serialize_messages), ("single pass", serialize_messages)]:
+        seconds = min(timeit.repeat(lambda: func(ipc_messages), number=iterations, repeat=5))
+        results[name] = seconds / iterations / batch_size * 1e6
+        print(f"{name:>12}: {results[name]:8.2f} µs/message")
+    saved = results["legacy"] - results["single pass"]
+    print(f"{'saved':>12}: {saved:8.2f} µs/message ({saved / results['legacy']:.0%})")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])